@@ -4,6 +4,7 @@ import os
 import json
 from io import StringIO, BytesIO
 import csv
+import argparse
 
 # Check if this is a reload by flask debug mode
 is_reload = False
@@ -48,12 +49,18 @@ from datetime import datetime, timedelta
 import logging
 from flask import Flask, render_template, jsonify, request, redirect, url_for, current_app, send_file, flash, session
 from flask_sqlalchemy import SQLAlchemy
-from models import db, Contact, History, Settings, Notification
+from models import db, Contact, History, Settings, Notification, SyncRun, upgrade_schema, upgrade_settings
 from config import Config
-from ldap_sync import LDAPSync
+from ldap_sync import LDAPSync, user_search_cache
+from ldap_pool import ldap_pool
+from cucm_enrichment import enrichment_queue
+from sync_jobs import sync_jobs, SyncJob
 from apscheduler.schedulers.background import BackgroundScheduler
 from flask_wtf.csrf import CSRFProtect, CSRFError
-from cucm_service import CUCMService
+from cucm_service import CUCMService, phone_lookup_cache, phone_status_cache
+from axl_registry import axl_clients
+from phone_inventory import phone_inventory
+from fac_cache import fac_cache
 from mail_service import MailService  # Import our new MailService class
 
 # Configure logging
@@ -111,45 +118,123 @@ def init_db():
         init_settings()
         print("Database initialized successfully")
 
-def create_app():
+def resync_cli(argv):
+    """Run a targeted LDAP resync from the command line as a sync job and print its counts
+
+    The run takes the sync lease like any other job, so it never overlaps a
+    sync in another process; if one is running, the command exits with 1 and
+    that job's id.
+    """
+    parser = argparse.ArgumentParser(prog='app.py --resync', description='Resync part of the LDAP directory')
+    parser.add_argument('--base', help='Sub-base DN within the configured base DN')
+    parser.add_argument('--filter', help='Extra LDAP filter, e.g. "eduPersonAffiliation=staff"')
+    parser.add_argument('--uid', action='append', default=[], help='UID to resync (repeatable)')
+    args = parser.parse_args(argv)
+
+    scope = {'search_base': args.base, 'extra_filter': args.filter, 'uids': args.uid}
+    with app.app_context():
+        try:
+            LDAPSync().targeted_searches(**scope)
+        except Exception as e:
+            print(f"Targeted sync failed: {str(e)}")
+            sys.exit(1)
+    try:
+        job_id, _ = sync_jobs.submit(app, trigger='cli', scope=scope)
+    except sync_jobs.Busy as e:
+        print(f"Targeted sync not started: {str(e)}")
+        sys.exit(1)
+
+    job = sync_jobs.wait(job_id)
+    if job['status'] == 'skipped':
+        print(f"Targeted sync not started: another sync is already running (job {job['attached_to']})")
+        sys.exit(1)
+    if job['status'] != 'completed':
+        print(f"Targeted sync failed: {job['error']}")
+        sys.exit(1)
+    print(f"Targeted sync completed: {json.dumps(job['counts'])}")
+
+# Minutes between checks whether the phone inventory snapshot is due for a refresh
+PHONE_INVENTORY_CHECK_MINUTES = 5
+
+def refresh_phone_inventory(app, force=False):
+    """Refresh the CUCM phone inventory snapshot if CUCM is configured and a refresh is due"""
+    with app.app_context():
+        if not all(Settings.get_value(key) for key in ('CUCM_HOST', 'CUCM_USERNAME', 'CUCM_PASSWORD')):
+            return None
+        return CUCMService().refresh_phone_inventory(force=force)
+
+def create_app(start_scheduler=True):
+    """Build the application; start_scheduler=False skips the background sync and phone inventory jobs"""
     app = Flask(__name__)
     app.config.from_object(Config)
     db.init_app(app)
+    enrichment_queue.init_app(app)
     
     with app.app_context():
         # Create tables first
         db.create_all()
+        upgrade_schema()
         
         # Initialize settings if needed
         if Settings.query.count() == 0:
             init_settings()
+        upgrade_settings()
         
-        # Now create Config instance after settings are initialized
-        config = Config()
-        
-        # Initialize scheduler for automatic LDAP sync
-        scheduler = BackgroundScheduler()
-        sync_interval = config.SYNC_INTERVAL  # Use config instance
-        
-        # Don't automatically start LDAP sync if settings are incomplete
-        try:
-            ldap_sync = LDAPSync(config)
-            scheduler.add_job(
-                func=ldap_sync.sync_contacts,
-                trigger="interval", 
-                hours=int(sync_interval)
-            )
-            scheduler.start()
-        except ValueError as e:
-            print(f"Warning: LDAP synchronization not enabled - {str(e)}")
-            print("You can configure LDAP settings in the web interface.")
-        except Exception as e:
-            print(f"Error initializing LDAP sync: {str(e)}")
+        if start_scheduler:
+            schedule_jobs(app)
     
     return app
 
+def schedule_jobs(app):
+    """Start the scheduler running LDAP syncs and phone inventory refreshes (call in an app context)"""
+    # Now create Config instance after settings are initialized
+    config = Config()
+    
+    # Initialize scheduler for automatic LDAP sync
+    scheduler = BackgroundScheduler()
+    sync_interval = config.SYNC_INTERVAL  # Use config instance
+
+    # The phone inventory job runs at startup and then checks every few minutes
+    # whether CUCM_PHONE_SNAPSHOT_INTERVAL has passed since any process refreshed it
+    scheduler.add_job(
+        func=refresh_phone_inventory,
+        args=[app],
+        trigger="interval",
+        minutes=PHONE_INVENTORY_CHECK_MINUTES,
+        next_run_time=datetime.now()
+    )
+    
+    # Don't automatically start LDAP sync if settings are incomplete
+    try:
+        ldap_sync = LDAPSync(config)
+        if ldap_sync.incremental_sync:
+            # Incremental runs are cheap, so poll the directory every few minutes;
+            # sync_contacts performs a full reconcile when one is due
+            interval = {'minutes': int(Settings.get_value('LDAP_SYNC_INTERVAL', '60'))}
+        else:
+            interval = {'hours': int(sync_interval)}
+        # Scheduled runs go through the job manager so they run in an app context
+        # and report progress like manual ones
+        scheduler.add_job(
+            func=sync_jobs.submit,
+            args=[app],
+            kwargs={'trigger': 'scheduled'},
+            trigger="interval", 
+            **interval
+        )
+    except ValueError as e:
+        print(f"Warning: LDAP synchronization not enabled - {str(e)}")
+        print("You can configure LDAP settings in the web interface.")
+    except Exception as e:
+        print(f"Error initializing LDAP sync: {str(e)}")
+    scheduler.start()
+
+# One-shot command line runs must not start the scheduler (and its immediate phone inventory refresh)
+CLI_COMMANDS = ('--init-db', '--resync')
+is_cli_command = __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS
+
 # Configure CSRF protection properly
-app = create_app()
+app = create_app(start_scheduler=not is_cli_command)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 csrf = CSRFProtect()
 csrf.init_app(app)
@@ -337,6 +422,37 @@ def search_phones():
         logger.error(f"Error searching phones: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/phones/inventory', methods=['GET'])
+def get_phone_inventory():
+    """State of the local phone inventory snapshot"""
+    return jsonify({'success': True, 'enabled': phone_inventory.enabled(),
+                    'last_refresh': phone_inventory.state(), **phone_inventory.stats()})
+
+@app.route('/api/phones/inventory/refresh', methods=['POST'])
+def refresh_phone_inventory_now():
+    """Refresh the phone inventory snapshot now instead of waiting for the schedule"""
+    try:
+        counts = refresh_phone_inventory(current_app._get_current_object(), force=True)
+    except Exception as e:
+        logger.error(f"Phone inventory refresh failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)})
+    if counts is None:
+        return jsonify({'success': False, 'error': 'Phone inventory is disabled, not configured or already refreshing'})
+    return jsonify({'success': True, **counts})
+
+@app.route('/api/cucm/enrichment', methods=['GET'])
+def get_enrichment_status():
+    """Progress of the background CUCM enrichment queue and the state of the CUCM caches"""
+    return jsonify({'success': True, **enrichment_queue.stats(), 'axl_clients': axl_clients.stats(),
+                    'fac_cache': fac_cache.stats(), 'phone_lookup_cache': phone_lookup_cache.stats()})
+
+@app.route('/api/sync-runs', methods=['GET'])
+def get_sync_runs():
+    """Timings of the most recent LDAP sync runs, newest first"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), LDAPSync.SYNC_RUN_HISTORY)
+    runs = SyncRun.query.order_by(SyncRun.id.desc()).limit(limit).all()
+    return jsonify({'success': True, 'runs': [run.to_dict() for run in runs]})
+
 @app.route('/api/phones/<mac>/details', methods=['GET'])
 def get_phone_details(mac):
     """Get phone details endpoint"""
@@ -357,37 +473,11 @@ def get_phone_details(mac):
 
 @app.route('/sync', methods=['POST'])
 def sync():
+    """Start an LDAP sync in the background and return its job id"""
     try:
         app.logger.info("Manual sync initiated")
-        ldap_sync = LDAPSync()
-        initial_count = Contact.query.count()
-        
-        conflicts = ldap_sync.sync_contacts()
-        
-        final_count = Contact.query.count()
-        new_contacts = final_count - initial_count
-        
-        if conflicts:
-            return jsonify({
-                'success': True,
-                'has_conflicts': True,
-                'conflicts': len(conflicts),
-                'message': f'Sync completed with {len(conflicts)} UID conflicts that need resolution'
-            })
-            
-        if new_contacts > 0:
-            notification = Notification(
-                title="LDAP Sync Complete",
-                message=f"Successfully synchronized contacts. {new_contacts} new contacts added."
-            )
-            db.session.add(notification)
-            db.session.commit()
-        
-        app.logger.info("Manual sync completed successfully")
-        return jsonify({
-            'success': True,
-            'message': 'Synchronization completed successfully'
-        })
+        # Fail fast on incomplete LDAP settings instead of inside the job
+        LDAPSync()
     except Exception as e:
         error_msg = str(e)
         app.logger.error(f"Manual sync failed: {error_msg}")
@@ -405,6 +495,62 @@ def sync():
             'error': error_msg
         })
 
+    # Optional {"full": true} forces a full reconcile instead of an incremental run
+    data = request.get_json(silent=True) or {}
+    job_id, attached = sync_jobs.submit(current_app._get_current_object(), full=True if data.get('full') else None)
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'attached': attached,
+        'status_url': url_for('sync_status', job_id=job_id),
+        'message': 'A synchronization is already running' if attached else 'Synchronization started'
+    }), 202
+
+@app.route('/sync/targeted', methods=['POST'])
+def sync_targeted():
+    """Resync only the entries under a sub-base DN, matching a filter and/or with the given uids"""
+    data = request.get_json(silent=True) or {}
+    uids = data.get('uids') or []
+    if not isinstance(uids, list):
+        return jsonify({'success': False, 'error': 'uids must be a list'}), 400
+    scope = {'search_base': data.get('search_base') or None,
+             'extra_filter': data.get('filter') or None,
+             'uids': uids}
+    try:
+        # Fail fast on incomplete LDAP settings or an invalid scope instead of inside the job
+        LDAPSync().targeted_searches(**scope)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Targeted sync failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)})
+
+    try:
+        job_id, _ = sync_jobs.submit(current_app._get_current_object(), trigger='targeted', scope=scope)
+    except sync_jobs.Busy as e:
+        # The running sync may not cover this scope, so the caller has to retry once it is done
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'job_id': e.job_id,
+            'status_url': url_for('sync_status', job_id=e.job_id)
+        }), 409
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'attached': False,
+        'status_url': url_for('sync_status', job_id=job_id),
+        'message': 'Targeted synchronization started'
+    }), 202
+
+@app.route('/sync/<job_id>', methods=['GET'])
+def sync_status(job_id):
+    """Progress of a sync job: phase, entries processed, throughput and ETA"""
+    status = sync_jobs.status(job_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Sync job not found'}), 404
+    return jsonify({'success': True, **status})
+
 @app.route('/settings', methods=['GET'])
 @app.route('/settings/<category>', methods=['GET'])
 def settings(category=None):
@@ -434,7 +580,8 @@ def settings(category=None):
     # Commit any added settings
     db.session.commit()
     
-    settings = Settings.query.all()
+    # Internal settings hold sync state and are not editable
+    settings = Settings.query.filter(Settings.category != 'internal').all()
     settings_by_category = {}
     for setting in settings:
         if setting.category not in settings_by_category:
@@ -445,9 +592,16 @@ def settings(category=None):
     if not category and settings_by_category:
         category = next(iter(settings_by_category))
     
+    # Recent sync timings are charted on the LDAP page, oldest first
+    sync_runs = []
+    if category == 'ldap':
+        sync_runs = [run.to_dict() for run in reversed(
+            SyncRun.query.order_by(SyncRun.id.desc()).limit(20).all())]
+
     return render_template('settings.html', 
                          settings_by_category=settings_by_category,
-                         active_category=category)
+                         active_category=category,
+                         sync_runs=sync_runs)
 
 @app.route('/settings/<category>/save', methods=['POST'])
 def save_settings(category):
@@ -462,6 +616,16 @@ def save_settings(category):
                 setting.value = form_data.get(setting.key, '')
         
         db.session.commit()
+        if category == 'ldap':
+            # Drop connections and search results from the previous settings
+            ldap_pool.clear()
+            user_search_cache.clear()
+        elif category == 'cucm':
+            # Rebuild the shared AXL client with the new host and credentials
+            axl_clients.clear()
+            fac_cache.clear()
+            phone_lookup_cache.clear()
+            phone_status_cache.clear()
         flash(f'{category.title()} settings saved successfully', 'success')
         
     except Exception as e:
@@ -568,6 +732,9 @@ def contact_update(contact_id):
                     new_value=new_value
                 ))
                 setattr(contact, field, new_value)
+                # Let the next LDAP sync overwrite manual edits of directory fields again
+                if field in ('first_name', 'last_name', 'email', 'phone', 'department', 'title'):
+                    contact.ldap_hash = None
         
         # Add all history records
         if changes:
@@ -586,6 +753,8 @@ def contact_update(contact_id):
 def contact_delete(contact_id):
     contact = Contact.query.get_or_404(contact_id)
     contact.is_active = False
+    contact.deactivated_at = datetime.utcnow()
+    contact.deactivated_by = 'user'
     
     # Add deletion to history
     history = History(
@@ -602,6 +771,8 @@ def contact_delete(contact_id):
 def contact_restore(contact_id):
     contact = Contact.query.get_or_404(contact_id)
     contact.is_active = True
+    contact.deactivated_at = None
+    contact.deactivated_by = None
     
     # Add restoration to history
     history = History(
@@ -651,12 +822,16 @@ def ldap_search():
         contacts = ldap_sync.search_user(
             search_term, 
             exclude_students=exclude_students,
-            exclude_alumni=exclude_alumni
+            exclude_alumni=exclude_alumni,
+            live=bool(request.json.get('live', False))
         )
         
         return jsonify({
             'success': True,
-            'contacts': contacts
+            'contacts': contacts,
+            'truncated': ldap_sync.last_search_truncated,
+            'source': ldap_sync.last_search_source,
+            'mirror_refreshed_at': ldap_sync.mirror_refreshed_at
         })
     except Exception as e:
         app.logger.error(f"LDAP search error: {str(e)}")
@@ -694,6 +869,31 @@ def import_contact():
             'error': str(e)
         })
 
+@app.route('/import-contacts', methods=['POST'])
+def import_contacts():
+    """Import many LDAP contacts at once from lists of DNs and/or UIDs"""
+    try:
+        data = request.get_json(silent=True) or {}
+        dns = data.get('dns') or []
+        uids = data.get('uids') or []
+        if not isinstance(dns, list) or not isinstance(uids, list):
+            return jsonify({'success': False, 'error': 'dns and uids must be lists'}), 400
+        if not dns and not uids:
+            return jsonify({'success': False, 'error': 'No DNs or UIDs given'}), 400
+        if len(dns) + len(uids) > LDAPSync.BULK_IMPORT_LIMIT:
+            return jsonify({'success': False, 'error': f'At most {LDAPSync.BULK_IMPORT_LIMIT} contacts per request'}), 400
+
+        results = LDAPSync().import_contacts(dns=dns, uids=uids, force=bool(data.get('force')))
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        return jsonify({'success': True, 'results': results, 'summary': summary})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
 @app.route('/export-csv')
 def export_csv():
     # Create StringIO for text content first
@@ -1370,4 +1570,7 @@ if __name__ == '__main__':
     if len(sys.argv) > 1 and sys.argv[1] == '--init-db':
         init_db()
         sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == '--resync':
+        resync_cli(sys.argv[2:])
+        sys.exit(0)
     app.run(debug=True)
\ No newline at end of file
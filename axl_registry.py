@@ -0,0 +1,62 @@
+import hashlib
+import logging
+import threading
+
+class AXLClientRegistry:
+    """Process-wide cache of AXL services, one per set of CUCM settings
+
+    Building a zeep client parses the AXL WSDL and its schemas, which takes
+    seconds, so every CUCMService shares the service built for the current
+    settings fingerprint. The authentication probe only runs until it first
+    succeeds. A new fingerprint (changed host or credentials) builds a new
+    service and drops the ones built with older settings.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('AXLClientRegistry')
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def fingerprint(*settings):
+        """Stable key for a set of CUCM settings (hashed so credentials are not kept as keys)"""
+        payload = '\x1f'.join('' if value is None else str(value) for value in settings)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_service(self, fingerprint, create_service, probe):
+        """Return the AXL service for a fingerprint, building and probing it on first use
+
+        create_service() builds the service; probe(service) checks that the
+        credentials work and raises if they do not. A failed probe is retried on
+        the next call, but the parsed service is kept.
+        """
+        # Held while building so concurrent first requests parse the WSDL only once
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.logger.info("Building AXL client for the current CUCM settings")
+                entry = {'service': create_service(), 'verified': False}
+                self.builds += 1
+                # Services built with older settings are never used again
+                self._entries = {fingerprint: entry}
+            if not entry['verified']:
+                probe(entry['service'])
+                entry['verified'] = True
+            return entry['service']
+
+    def clear(self):
+        """Forget every cached service (e.g. after the CUCM settings were saved)"""
+        with self._lock:
+            self._entries = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._entries),
+                'verified': sum(entry['verified'] for entry in self._entries.values()),
+                'builds': self.builds,
+            }
+
+# Shared by every CUCMService instance in the process
+axl_clients = AXLClientRegistry()
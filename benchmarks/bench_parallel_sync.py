@@ -0,0 +1,101 @@
+"""Benchmark partitioned LDAP sync wall-clock time against the number of workers
+
+The mock directory evaluates searches in-process while holding the GIL, which a
+real directory server does not. Each configuration therefore runs once untimed
+to record the mock's search results, and the timed run replays them with a
+fixed per-request latency standing in for the server and network time that
+parallel partitions overlap.
+
+Usage:
+    python -m benchmarks.bench_parallel_sync --entries 20000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Contact
+from ldap3.strategy.mockBase import MockBaseStrategy
+from ldap_sync import LDAPSync
+from ldap_pool import ldap_pool
+from cucm_enrichment import enrichment_queue
+from benchmarks.bench_sync import build_directory, connect, create_app
+
+
+def recorded_search():
+    """Patch the mock's server-side search to evaluate each distinct request only once"""
+    execute_search = MockBaseStrategy._execute_search
+    recorded = {}
+
+    def replay(strategy, request):
+        key = (request['base'], request['scope'], str(request['filter']),
+               tuple(request['attributes']), request['sizeLimit'])
+        if key not in recorded:
+            recorded[key] = execute_search(strategy, request)
+        response, result = recorded[key]
+        return list(response), dict(result)
+
+    return mock.patch.object(MockBaseStrategy, '_execute_search', replay)
+
+
+def run(server, count, workers, partitioning, page_size, latency):
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        app = create_app(db_path)
+        with app.app_context(), \
+                mock.patch.object(LDAPSync, '_open_connection', lambda self, _server: connect(server, latency)), \
+                mock.patch.object(enrichment_queue, 'enqueue', lambda contact_ids, retry=False: 0):
+            ldap_sync = LDAPSync()
+            ldap_sync.page_size = page_size
+            ldap_sync.partitioning = partitioning if workers > 1 else 'none'
+            ldap_sync.sync_workers = workers
+            ldap_pool.configure(max_size=workers + ldap_pool.RESERVED_FOR_INTERACTIVE)
+
+            with recorded_search():
+                # Untimed pass records the directory's answers and creates the contacts
+                ldap_sync.sync_contacts(full=True)
+                start = time.perf_counter()
+                ldap_sync.sync_contacts(full=True)
+                elapsed = time.perf_counter() - start
+            return {
+                'entries': count,
+                'workers': workers,
+                'partitioning': ldap_sync.partitioning,
+                'contacts': Contact.query.count(),
+                'sync_seconds': round(elapsed, 3),
+            }
+    finally:
+        ldap_pool.clear()
+        os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--ous', type=int, default=8, help='First-level OUs in the mock directory')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--partitioning', choices=['ou', 'uid'], default='ou')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every LDAP search')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    server = build_directory(args.entries, ous=args.ous)
+    results = []
+    for workers in args.workers:
+        results.append(run(server, args.entries, workers, args.partitioning, args.page_size, args.latency))
+    baseline = results[0]['sync_seconds']
+    for result in results:
+        result['speedup'] = round(baseline / result['sync_seconds'], 2) if result['sync_seconds'] else None
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
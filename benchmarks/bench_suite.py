@@ -0,0 +1,179 @@
+"""Benchmark LDAP sync, user search and single-contact import against an offline mock directory
+
+Every scenario reports wall time, CPU time, the number of SQL statements
+executed and peak memory; sync scenarios also report CPU seconds per 10k
+entries. The mock directory evaluates searches in the benchmark process, so
+the replayed resync answers every search from the results recorded by the
+previous sync, leaving only the client side's CPU time. The cold and cached
+user searches bypass the local directory mirror (live=True), which
+search_user_mirror measures separately.
+
+Peak memory is the tracemalloc high-water mark of Python allocations made
+during the scenario; tracing slows Python code down, so pass
+--no-tracemalloc for undistorted wall and CPU times (peak memory then falls
+back to the peak RSS of the whole process).
+
+The directory is synthetic and deterministic and the database is a
+temporary SQLite file, so results are repeatable without network access.
+
+Usage:
+    python -m benchmarks.bench_suite --entries 1000 10000 100000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from models import db, Contact
+from ldap_sync import LDAPSync, user_search_cache
+from ldap_pool import ldap_pool
+from cucm_enrichment import enrichment_queue
+from sync_metrics import SyncMetrics
+from benchmarks.bench_sync import build_directory, connect, create_app
+from benchmarks.bench_parallel_sync import recorded_search
+
+
+class Measurement:
+    """Wall time, SQL statement count and peak memory of one scenario"""
+
+    def __init__(self, use_tracemalloc=True):
+        self.use_tracemalloc = use_tracemalloc
+        self.queries = 0
+
+    def _count(self, *args):
+        self.queries += 1
+
+    @contextmanager
+    def measure(self, results, name, **extra):
+        """Record the block's measurements under results[name]"""
+        self.queries = 0
+        event.listen(db.engine, 'before_cursor_execute', self._count)
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+            if self.use_tracemalloc:
+                peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            else:
+                peak_kb = SyncMetrics.process_peak_rss_kb()
+            event.remove(db.engine, 'before_cursor_execute', self._count)
+            entries = extra.get('entries')
+            results[name] = {
+                'wall_seconds': round(wall, 3),
+                'cpu_seconds': round(cpu, 3),
+                'queries': self.queries,
+                'peak_memory_kb': peak_kb,
+                **extra,
+            }
+            if entries:
+                results[name]['cpu_seconds_per_10k'] = round(cpu / entries * 10000, 3)
+
+
+def search_terms(count):
+    """Terms matching one entry, a handful of entries, and many entries"""
+    last = count - 1
+    return [f'user{last:06d}', f'Given{last // 10}', 'Surname1']
+
+
+def run(count, page_size, imports, use_tracemalloc):
+    build_start = time.perf_counter()
+    server = build_directory(count)
+    build_seconds = round(time.perf_counter() - build_start, 3)
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    results = {}
+    measurement = Measurement(use_tracemalloc)
+    try:
+        app = create_app(db_path)
+        with app.app_context(), \
+                mock.patch.object(LDAPSync, '_open_connection', lambda self, _server: connect(server)), \
+                mock.patch.object(enrichment_queue, 'enqueue', lambda contact_ids, retry=False: 0):
+
+            def ldap_sync():
+                instance = LDAPSync()
+                instance.page_size = page_size
+                return instance
+
+            # Full sync into an empty database, then a resync with nothing changed
+            with measurement.measure(results, 'sync_initial', entries=count):
+                ldap_sync().sync_contacts(full=True)
+            with recorded_search():
+                with measurement.measure(results, 'sync_unchanged', entries=count):
+                    ldap_sync().sync_contacts(full=True)
+                with measurement.measure(results, 'sync_unchanged_replayed', entries=count):
+                    ldap_sync().sync_contacts(full=True)
+
+            # Cold live searches hit the directory, repeated ones are served from the cache
+            terms = search_terms(count)
+            user_search_cache.clear()
+            matches = {}
+            with measurement.measure(results, 'search_user_cold', searches=len(terms), matches=matches):
+                for term in terms:
+                    matches[term] = len(ldap_sync().search_user(term, live=True))
+            with measurement.measure(results, 'search_user_cached', searches=len(terms)):
+                for term in terms:
+                    ldap_sync().search_user(term, live=True)
+            # The default path answers from the directory_entry mirror filled by the sync
+            with measurement.measure(results, 'search_user_mirror', searches=len(terms)):
+                for term in terms:
+                    ldap_sync().search_user(term)
+
+            # Re-import contacts that were removed locally
+            imported = min(imports, count)
+            dns = [dn for dn, in db.session.query(Contact.ldap_dn).order_by(Contact.id).limit(imported)]
+            Contact.query.filter(Contact.ldap_dn.in_(dns)).delete(synchronize_session=False)
+            db.session.commit()
+            with measurement.measure(results, 'import_single_contact', imports=len(dns)):
+                for dn in dns:
+                    ldap_sync().import_single_contact(dn)
+
+            contacts = Contact.query.count()
+    finally:
+        ldap_pool.clear()
+        user_search_cache.clear()
+        os.remove(db_path)
+
+    return {
+        'entries': count,
+        'contacts': contacts,
+        'build_directory_seconds': build_seconds,
+        'memory': 'tracemalloc' if use_tracemalloc else 'peak_rss',
+        'scenarios': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000, 100000])
+    # The mock server filters the whole DIT for every page, see bench_sync
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--imports', type=int, default=100,
+                        help='Contacts re-imported one at a time with import_single_contact')
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false',
+                        help='Report process peak RSS instead of traced allocations')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = [run(count, args.page_size, args.imports, args.tracemalloc) for count in args.entries]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark LDAPSync.sync_contacts against an in-process mock directory
+
+Usage:
+    python -m benchmarks.bench_sync --entries 10000 100000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from ldap3 import Server, Connection, MOCK_SYNC
+
+from models import db, Contact, Settings
+from ldap_sync import LDAPSync
+from ldap_pool import ldap_pool
+from cucm_enrichment import enrichment_queue
+
+BASE_DN = 'dc=example,dc=org'
+AFFILIATIONS = ['staff', 'faculty', 'student', 'affiliate']
+
+
+def build_directory(count, ous=1):
+    """Build a mock LDAP server holding `count` synthetic person entries spread over `ous` OUs"""
+    server = Server('mock-ldap')
+    conn = Connection(server, client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(BASE_DN, {'objectClass': ['domain'], 'dc': 'example'})
+    ou_names = ['people'] if ous <= 1 else [f'people{n}' for n in range(ous)]
+    for name in ou_names:
+        conn.strategy.add_entry(f'ou={name},{BASE_DN}', {'objectClass': ['organizationalUnit'], 'ou': name})
+    for i in range(count):
+        uid = f'user{i:06d}'
+        conn.strategy.add_entry(f'uid={uid},ou={ou_names[i % len(ou_names)]},{BASE_DN}', {
+            'objectClass': ['person'],
+            'uid': uid,
+            'cn': f'Given{i} Surname{i}',
+            'givenName': f'Given{i}',
+            'sn': f'Surname{i}',
+            'mail': f'{uid}@example.org',
+            'telephoneNumber': f'+30{i:08d}',
+            'ou': f'Department {i % 50}',
+            'eduPersonAffiliation': AFFILIATIONS[i % len(AFFILIATIONS)],
+        })
+    return server
+
+
+def connect(server, latency=0.0):
+    """Bind a mock connection; `latency` seconds are added to every search to model a network round trip"""
+    conn = Connection(server, client_strategy=MOCK_SYNC)
+    conn.bind()
+    if latency:
+        search = conn.search
+
+        def delayed_search(*args, **kwargs):
+            time.sleep(latency)
+            return search(*args, **kwargs)
+
+        conn.search = delayed_search
+    return conn
+
+
+def create_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for key, value in [('LDAP_SERVER', 'mock-ldap'), ('LDAP_BASE_DN', BASE_DN),
+                           ('LDAP_ALLOW_ANONYMOUS', 'True'), ('LDAP_MAX_ENTRIES', '0')]:
+            db.session.add(Settings(key=key, value=value, category='ldap'))
+        db.session.commit()
+    return app
+
+
+def run(count, page_size):
+    server = build_directory(count)
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        app = create_app(db_path)
+        with app.app_context(), \
+                mock.patch.object(LDAPSync, '_open_connection', lambda self, _server: connect(server)), \
+                mock.patch.object(enrichment_queue, 'enqueue', lambda contact_ids, retry=False: 0):
+            timings = {}
+            # First run creates every contact, second run updates every contact
+            for phase in ('initial', 'resync'):
+                start = time.perf_counter()
+                ldap_sync = LDAPSync()
+                ldap_sync.page_size = page_size
+                ldap_sync.sync_contacts()
+                timings[phase] = round(time.perf_counter() - start, 3)
+            return {
+                'entries': count,
+                'contacts': Contact.query.count(),
+                'initial_sync_seconds': timings['initial'],
+                'resync_seconds': timings['resync'],
+            }
+    finally:
+        ldap_pool.clear()
+        os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[10000, 100000])
+    # The mock server filters the whole DIT for every page, so small pages
+    # make the benchmark measure ldap3's mock strategy instead of the sync
+    parser.add_argument('--page-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = [run(count, args.page_size) for count in args.entries]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+from flask import current_app
+from models import db, Contact, Settings
+from cucm_service import CUCMService
+import logging
+import queue
+import threading
+import time
+
+class CUCMEnrichmentQueue:
+    """Background queue that fills in CUCM data (PIN, MAC address, phone model) for contacts
+
+    LDAP sync and imports only enqueue contact ids, so they never wait on AXL.
+    A bounded set of daemon worker threads drains the queue in batches, sharing
+    one CUCMService per batch and committing once per batch. Retries of
+    contacts that were already enriched without success (unchanged contacts
+    seen by a sync) are admitted at most once per CUCM_ENRICH_RETRY_HOURS.
+    """
+
+    def __init__(self, workers=2, batch_size=50):
+        """
+        Args:
+            workers: Maximum number of worker threads
+            batch_size: Contacts enriched per database commit
+        """
+        self.logger = logging.getLogger('CUCMEnrichment')
+        self.max_workers = workers
+        self.batch_size = batch_size
+        self.enriched = 0
+        self.failed = 0
+        self._app = None
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._attempted = {}  # contact id -> time of its last enrichment
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def init_app(self, app):
+        """Remember the application whose context the workers run in"""
+        self._app = app
+
+    def configure(self, workers=None, batch_size=None):
+        """Update limits; a larger worker count takes effect on the next enqueue"""
+        with self._lock:
+            if workers:
+                self.max_workers = max(int(workers), 1)
+            if batch_size:
+                self.batch_size = max(int(batch_size), 1)
+
+    def enqueue(self, contact_ids, retry=False):
+        """Queue contacts for enrichment; ids already waiting are skipped. Returns the number queued.
+
+        With retry=True, contacts enriched within the retry interval are skipped too.
+        """
+        if not self._cucm_configured():
+            return 0
+
+        app = self._app or current_app._get_current_object()
+        self.configure(
+            workers=Settings.get_value('CUCM_ENRICH_WORKERS', '2'),
+            batch_size=Settings.get_value('CUCM_ENRICH_BATCH_SIZE', '50')
+        )
+        retry_after = int(Settings.get_value('CUCM_ENRICH_RETRY_HOURS', '12') or 0) * 3600
+        now = time.monotonic()
+        with self._lock:
+            if retry:
+                self._attempted = {contact_id: attempted for contact_id, attempted in self._attempted.items()
+                                   if now - attempted < retry_after}
+            new_ids = [contact_id for contact_id in dict.fromkeys(contact_ids)
+                       if contact_id and contact_id not in self._queued
+                       and not (retry and contact_id in self._attempted)]
+            self._queued.update(new_ids)
+            for contact_id in new_ids:
+                self._queue.put(contact_id)
+            if new_ids:
+                self._start_workers(app)
+
+        if new_ids:
+            self.logger.info(f"Queued {len(new_ids)} contacts for CUCM enrichment ({self._queue.qsize()} pending)")
+        return len(new_ids)
+
+    def wait(self):
+        """Block until every queued contact has been processed"""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'workers': sum(thread.is_alive() for thread in self._threads),
+                'enriched': self.enriched,
+                'failed': self.failed,
+            }
+
+    def _cucm_configured(self):
+        return all(Settings.get_value(key) for key in ('CUCM_HOST', 'CUCM_USERNAME', 'CUCM_PASSWORD'))
+
+    def _start_workers(self, app):
+        """Start worker threads up to max_workers (called with the lock held)"""
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(
+                target=self._work, args=(app,),
+                name=f'cucm-enrich-{len(self._threads) + 1}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self, app):
+        while True:
+            contact_ids = [self._queue.get()]
+            while len(contact_ids) < self.batch_size:
+                try:
+                    contact_ids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Contacts changed again while this batch runs are queued anew
+            with self._lock:
+                self._queued.difference_update(contact_ids)
+                attempted = time.monotonic()
+                self._attempted.update((contact_id, attempted) for contact_id in contact_ids)
+
+            try:
+                with app.app_context():
+                    self._enrich_batch(contact_ids)
+            except Exception as e:
+                self.logger.error(f"CUCM enrichment batch failed: {str(e)}")
+                with self._lock:
+                    self.failed += len(contact_ids)
+            finally:
+                for _ in contact_ids:
+                    self._queue.task_done()
+
+    def _enrich_batch(self, contact_ids):
+        """Enrich one batch of contacts with a shared CUCMService and a single commit"""
+        cucm = CUCMService()
+        try:
+            contacts = Contact.query.filter(Contact.id.in_(contact_ids)).all()
+            if any(contact.uid and not contact.pin for contact in contacts):
+                try:
+                    # One paged pull of every code instead of a listFacInfo call per contact
+                    cucm.preload_auth_codes()
+                except Exception as e:
+                    self.logger.warning(f"Could not preload authorization codes, looking them up one by one: {str(e)}")
+            for contact in contacts:
+                self.enrich_contact(contact, cucm)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        with self._lock:
+            self.enriched += len(contacts)
+        self.logger.info(f"Enriched {len(contacts)} contacts with CUCM data ({self._queue.qsize()} pending)")
+
+    def enrich_contact(self, contact, cucm):
+        """Enrich contact with data from CUCM"""
+        if not contact.uid:
+            return
+
+        try:
+            # 1. Try to fetch authorization code (PIN)
+            if not contact.pin:
+                self.logger.info(f"Fetching PIN for {contact.uid} from CUCM")
+                pin = cucm.fetchAuthCode(contact.uid)
+                if pin:
+                    self.logger.info(f"Found PIN for {contact.uid}")
+                    contact.pin = pin
+
+            # 2. Try to find a phone assigned to this user using their UID
+            if not contact.mac_address or not contact.phone_model:
+                self.logger.info(f"Searching for phone details for {contact.uid} in CUCM")
+                phone_details = cucm.find_phone_by_owner(contact.uid)
+                if phone_details:
+                    self.logger.info(f"Found phone for {contact.uid}: {phone_details.get('name', 'Unknown')}")
+
+                    # Update MAC address if found
+                    if 'mac' in phone_details and not contact.mac_address:
+                        mac = phone_details['mac']
+                        # Format MAC address with colons if needed
+                        if len(mac) == 12:
+                            mac = ':'.join([mac[i:i+2] for i in range(0, 12, 2)])
+                        contact.mac_address = mac
+
+                    # Update phone model if found
+                    if 'model' in phone_details and not contact.phone_model:
+                        contact.phone_model = phone_details['model']
+
+        except Exception as e:
+            self.logger.error(f"Error enriching contact with CUCM data: {str(e)}")
+            # Don't let one contact's CUCM error fail the rest of the batch
+
+# Shared by the LDAP sync, imports and the web routes
+enrichment_queue = CUCMEnrichmentQueue()
@@ -7,13 +7,45 @@ from requests import Session
 from requests.auth import HTTPBasicAuth
 import urllib3
 from models import Settings
+from axl_registry import axl_clients
+from phone_inventory import phone_inventory
+from fac_cache import fac_cache
+from ttl_cache import TTLCache
+from config import Config
 import logging
 import os
 
+# Live getPhone/listPhone results shared by every CUCMService instance, sized in entries
+phone_lookup_cache = TTLCache(max_size=1024, ttl=3600)
+# Registration status from live getPhone calls, kept apart from the long-lived phone details
+phone_status_cache = TTLCache(max_size=1024, ttl=60)
+
 class CUCMService:
+    # FAC entries per listFacInfo page when preloading authorization codes
+    FAC_PAGE_SIZE = 1000
+    # Rows per executeSQLQuery page, well under the AXL result size limit
+    SQL_PAGE_ROWS = 2000
+    # Every phone with its owner, in listPhone terms (read when CUCM_SQL_ENRICHMENT is on)
+    PHONE_SQL = (
+        "d.name AS name, d.description AS description, tm.name AS model, tp.name AS product, "
+        "tc.name AS deviceclass, tdp.name AS protocol, eu.userid AS owner "
+        "FROM device d "
+        "LEFT JOIN typemodel tm ON d.tkmodel = tm.enum "
+        "LEFT JOIN typeproduct tp ON d.tkproduct = tp.enum "
+        "LEFT JOIN typeclass tc ON d.tkclass = tc.enum "
+        "LEFT JOIN typedeviceprotocol tdp ON d.tkdeviceprotocol = tdp.enum "
+        "LEFT JOIN enduser eu ON d.fkenduser = eu.pkid "
+        "WHERE d.tkclass = 1 ORDER BY d.name"
+    )
+    # Every authorization code
+    FAC_SQL = "name, code FROM facinfo ORDER BY name"
+    # Seconds a live lookup that found nothing is cached, so phones and codes added in CUCM show up soon
+    NEGATIVE_CACHE_TTL = 60
+
     def __init__(self):
         self.logger = logging.getLogger('CUCMService')
         self._client = None
+        self._service = None
         self._history = HistoryPlugin()  # For debugging SOAP messages
         self._session = None
         self._wsdl = os.path.join(os.path.dirname(__file__), 'schema', 'AXLAPI.wsdl')
@@ -23,8 +55,12 @@ class CUCMService:
             os.makedirs(self._cache_dir)
 
     def _get_client(self):
-        """Initialize SOAP client with zeep"""
-        if self._client is None:
+        """Return the shared AXL service for the current CUCM settings
+
+        The zeep client is built once per process and settings fingerprint
+        (see axl_registry); authentication is only probed until it succeeds.
+        """
+        if self._service is None:
             settings = {
                 'host': Settings.get_value('CUCM_HOST'),
                 'username': Settings.get_value('CUCM_USERNAME'),
@@ -35,98 +71,112 @@ class CUCMService:
             if not all([settings['host'], settings['username'], settings['password']]):
                 raise ValueError("CUCM settings not configured properly")
 
-            # Create session with basic auth
-            session = Session()
-            session.auth = HTTPBasicAuth(settings['username'], settings['password'])
-            session.verify = settings['verify']
-            session.timeout = (30, 30)  # (connect timeout, read timeout)
-
-            if not settings['verify']:
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
+            fingerprint = axl_clients.fingerprint(
+                settings['host'], settings['username'], settings['password'], settings['verify']
+            )
             try:
-                # Setup zeep client with caching and history
-                transport = Transport(
-                    session=session,
-                    cache=SqliteCache(path=os.path.join(self._cache_dir, 'cucm_zeep.db')),
-                    timeout=30,
-                    operation_timeout=30
-                )
-
-                # Create zeep client using WSDL
-                self._client = Client(
-                    wsdl=self._wsdl,
-                    transport=transport,
-                    plugins=[self._history]
+                self._service = axl_clients.get_service(
+                    fingerprint, lambda: self._create_service(settings), self._probe
                 )
-
-                # Create AXL service
-                self._service = self._client.create_service(
-                    "{http://www.cisco.com/AXLAPIService/}AXLAPIBinding",
-                    f"https://{settings['host']}:8443/axl/"
-                )
-
-                # Test authentication with a simple query
-                try:
-                    self._service.listPhone(
-                        {'name': 'SEP%'},
-                        {'name': ''},
-                        1
-                    )
-                except Fault as e:
-                    if 'Authentication failed' in str(e) or '401' in str(e):
-                        raise ValueError("Authentication failed - check username and password")
-                    raise
-                except Exception as e:
-                    raise ValueError(f"Connection failed: {str(e)}")
-
             except Exception as e:
                 self.logger.error(f"CUCM connection error: {str(e)}")
                 raise ValueError(f"Failed to connect to CUCM: {str(e)}")
 
         return self._service  # Return the service instead of the client
 
-    def get_phone_by_mac(self, mac_address):
-        """Get phone details from CUCM by MAC address"""
+    def _create_service(self, settings):
+        """Build a zeep client from the AXL WSDL and bind the AXL service to the configured host"""
+        # Create session with basic auth
+        session = Session()
+        session.auth = HTTPBasicAuth(settings['username'], settings['password'])
+        session.verify = settings['verify']
+        session.timeout = (30, 30)  # (connect timeout, read timeout)
+
+        if not settings['verify']:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        # Setup zeep client with caching and history
+        transport = Transport(
+            session=session,
+            cache=SqliteCache(path=os.path.join(self._cache_dir, 'cucm_zeep.db')),
+            timeout=30,
+            operation_timeout=30
+        )
+
+        # Create zeep client using WSDL
+        self._client = Client(
+            wsdl=self._wsdl,
+            transport=transport,
+            plugins=[self._history]
+        )
+
+        # Create AXL service
+        return self._client.create_service(
+            "{http://www.cisco.com/AXLAPIService/}AXLAPIBinding",
+            f"https://{settings['host']}:8443/axl/"
+        )
+
+    def _probe(self, service):
+        """Test authentication with a simple query"""
         try:
-            service = self._get_client()  # Get the AXL service
-            mac = mac_address.replace(':', '').upper()
-            
-            try:
-                # Make the service call
-                response = service.getPhone(name=f"SEP{mac}")
-                
-                # SOAP responses in zeep can have different structures depending on the CUCM version
-                # Let's handle all possible structures
-                if response:
-                    if 'return' in response:
-                        # Dict-like response
-                        phone_data = response['return']
-                    elif hasattr(response, 'return_'):
-                        # Object-like response - use return_ attribute instead of return
-                        phone_data = response.return_
-                    else:
-                        # Direct response
-                        phone_data = response
-                    
-                    # Now we need to handle the phone_data which might be an object or dict
-                    return {
-                        'name': self._get_value(phone_data, 'name', 'Unknown'),
-                        'description': self._get_value(phone_data, 'description', ''),
-                        'model': self._get_value(phone_data, 'model', ''),
-                        'product': self._get_value(phone_data, 'product', ''),
-                        'class': self._get_value(phone_data, 'class', ''),
-                        'protocol': self._get_value(phone_data, 'protocol', ''),
-                        'status': 'Registered' if self._get_value(phone_data, 'registered', False) else 'Not Registered'
-                    }
+            service.listPhone(
+                {'name': 'SEP%'},
+                {'name': ''},
+                1
+            )
+        except Fault as e:
+            if 'Authentication failed' in str(e) or '401' in str(e):
+                raise ValueError("Authentication failed - check username and password")
+            raise
+        except Exception as e:
+            raise ValueError(f"Connection failed: {str(e)}")
+
+    def refresh_phone_inventory(self, force=False):
+        """Refresh the local phone inventory snapshot if it is enabled and due (or force=True)
+
+        Returns the refresh counts, or None if nothing was refreshed.
+        """
+        if not phone_inventory.enabled():
+            return None
+        interval = int(Settings.get_value('CUCM_PHONE_SNAPSHOT_INTERVAL', '60'))
+        if not force and not phone_inventory.refresh_due(interval):
+            return None
+        page_size = max(int(Settings.get_value('CUCM_PHONE_SNAPSHOT_PAGE_SIZE', '1000')), 1)
+        return phone_inventory.refresh(self._bulk_pages(
+            self.PHONE_SQL, self._phone_from_sql, 'listPhone', phone_inventory.RETURNED_TAGS, 'phone', page_size
+        ))
+
+    def get_phone_by_mac(self, mac_address):
+        """Get phone details from CUCM by MAC address
+
+        Answered from the phone inventory snapshot when it has the phone. A
+        phone missing from a current snapshot is not in CUCM; one missing from
+        a stale snapshot is looked up with a live getPhone call.
+        """
+        if phone_inventory.ready():
+            phone = phone_inventory.find_by_mac(mac_address)
+            if phone is not None:
+                details = {key: phone[key] for key in ('name', 'description', 'model', 'product', 'class', 'protocol')}
+                # The snapshot has no registration state
+                details['status'] = 'Unknown'
+                return details
+            if self._snapshot_is_current():
                 return None
-                
-            except Fault as e:
-                if 'was not found' in str(e):
-                    self.logger.warning(f"Phone with MAC {mac_address} not found")
-                    return None
-                raise
+        mac = mac_address.replace(':', '').upper()
+
+        def load():
+            details = self._get_phone_live(mac)
+            if details:
+                phone_status_cache.set(mac, details.pop('status'))
+            return details
 
+        try:
+            # Repeated opens of the same phone are answered from the cache for CUCM_CACHE_TTL seconds,
+            # but the status only while it is fresh
+            details = self._cached_lookup(('getPhone', mac), load)
+            if details is None:
+                return None
+            return dict(details, status=phone_status_cache.get(mac, 'Unknown'))
         except Fault as e:
             self.logger.error(f"CUCM Fault: {str(e)}")
             return None
@@ -134,6 +184,56 @@ class CUCMService:
             self.logger.error(f"Error getting phone: {str(e)}")
             return None
 
+    def _get_phone_live(self, mac):
+        """getPhone for SEP<mac>; returns None if CUCM has no such phone and raises on any other error"""
+        service = self._get_client()  # Get the AXL service
+        try:
+            # Make the service call
+            response = service.getPhone(name=f"SEP{mac}")
+            
+            # SOAP responses in zeep can have different structures depending on the CUCM version
+            # Let's handle all possible structures
+            if response:
+                if 'return' in response:
+                    # Dict-like response
+                    phone_data = response['return']
+                elif hasattr(response, 'return_'):
+                    # Object-like response - use return_ attribute instead of return
+                    phone_data = response.return_
+                else:
+                    # Direct response
+                    phone_data = response
+                
+                # Now we need to handle the phone_data which might be an object or dict
+                return {
+                    'name': self._get_value(phone_data, 'name', 'Unknown'),
+                    'description': self._get_value(phone_data, 'description', ''),
+                    'model': self._get_value(phone_data, 'model', ''),
+                    'product': self._get_value(phone_data, 'product', ''),
+                    'class': self._get_value(phone_data, 'class', ''),
+                    'protocol': self._get_value(phone_data, 'protocol', ''),
+                    'status': 'Registered' if self._get_value(phone_data, 'registered', False) else 'Not Registered'
+                }
+            return None
+            
+        except Fault as e:
+            if 'was not found' in str(e):
+                self.logger.warning(f"Phone with MAC {mac} not found")
+                return None
+            raise
+
+    def _snapshot_is_current(self):
+        """True when the phone inventory is newer than the refresh interval, so its misses are authoritative"""
+        return phone_inventory.is_fresh(int(Settings.get_value('CUCM_PHONE_SNAPSHOT_INTERVAL', '60')))
+
+    def _cached_lookup(self, key, load):
+        """Answer a live AXL lookup from the shared cache, coalescing identical concurrent calls
+
+        Lookups that found nothing are only cached for NEGATIVE_CACHE_TTL seconds.
+        """
+        phone_lookup_cache.configure(ttl=Config().CUCM_CACHE_TTL)
+        return phone_lookup_cache.get_or_load(key, load, empty_ttl=self.NEGATIVE_CACHE_TTL)
+
     def _get_value(self, obj, attr, default=None):
         """Helper method to get a value from an object or dictionary safely"""
         try:
@@ -150,32 +250,22 @@ class CUCMService:
         except:
             return default
 
-    def search_phones(self, search_pattern="", limit=100):
-        """Search for phones in CUCM"""
-        try:
-            service = self._get_client()  # Get the AXL service
-            response = service.listPhone(
-                {'name': '%' + search_pattern + '%'},
-                {
-                    'name': '',
-                    'description': '',
-                    'model': '',
-                    'product': '',
-                    'class': '',
-                    'protocol': ''
-                },
-                limit
-            )
-
-            if response:
-                return [{
-                    'name': phone['name'],
-                    'description': phone.get('description', ''),
-                    'model': phone.get('model', ''),
-                    'mac': phone['name'][3:] if phone['name'].startswith('SEP') else ''
-                } for phone in response['return']['phone']]
-            return []
+    def search_phones(self, search_pattern="", limit=None):
+        """Search for phones in CUCM (at most CUCM_SEARCH_LIMIT results unless limit is given)
 
+        Misses follow the same rule as get_phone_by_mac: only a stale snapshot
+        is followed by a live listPhone search.
+        """
+        if limit is None:
+            limit = Config().CUCM_SEARCH_LIMIT
+        if phone_inventory.ready():
+            phones = [{key: phone[key] for key in ('name', 'description', 'model', 'mac')}
+                      for phone in phone_inventory.search(search_pattern, limit)]
+            if phones or self._snapshot_is_current():
+                return phones
+        try:
+            return self._cached_lookup(('listPhone', search_pattern.strip().upper(), limit),
+                                       lambda: self._search_phones_live(search_pattern.strip(), limit))
         except Fault as e:
             self.logger.error(f"CUCM Fault: {str(e)}")
             return []
@@ -183,6 +273,31 @@ class CUCMService:
             self.logger.error(f"Error searching phones: {str(e)}")
             return []
 
+    def _search_phones_live(self, search_pattern, limit):
+        """listPhone by device name; raises on AXL errors so they are not cached"""
+        service = self._get_client()  # Get the AXL service
+        response = service.listPhone(
+            searchCriteria={'name': '%' + search_pattern + '%'},
+            returnedTags={
+                'name': '',
+                'description': '',
+                'model': '',
+                'product': '',
+                'class': '',
+                'protocol': ''
+            },
+            first=limit
+        )
+
+        if response and response['return']:
+            return [{
+                'name': self._get_value(phone, 'name', ''),
+                'description': self._get_value(phone, 'description', '') or '',
+                'model': self._get_value(phone, 'model', '') or '',
+                'mac': phone['name'][3:] if phone['name'].startswith('SEP') else ''
+            } for phone in self._response_items(response, 'phone')]
+        return []
+
     def get_registration_status(self, mac_address):
         """Get phone registration status"""
         try:
@@ -209,132 +324,236 @@ class CUCMService:
             return None
 
     def fetchAuthCode(self, uid):
-        """Fetch authorization code (FAC) for a given UID using AXL"""
+        """Fetch authorization code (FAC) for a given UID, from the preloaded codes while they are fresh"""
+        self._configure_fac_cache()
+        known, code = fac_cache.lookup(uid)
+        if known:
+            return code
         try:
-            self.logger.info(f"Fetching auth code for UID: {uid}")
-            
-            # Get AXL service client
-            service = self._get_client()
-            
-            # Use listFacInfo AXL API with correct field names
-            try:
-                response = service.listFacInfo(
-                    searchCriteria={'name': uid},
-                    returnedTags={'code': ''}
-                )
-                
-                # Safely access the return value
-                if response is None:
-                    self.logger.info(f"No authorization code found for {uid}")
-                    return None
-                    
-                # Check for 'return' key in response
-                if 'return' not in response:
-                    self.logger.info(f"Response doesn't contain 'return' key for {uid}")
-                    return None
-                    
-                return_value = response['return']
-                
-                # Check if facInfo exists and has values
-                if return_value is None or 'facInfo' not in return_value or not return_value['facInfo']:
-                    self.logger.info(f"User {uid} doesn't have an authorization code")
-                    return None
-                
-                fac_list = return_value['facInfo']
-                
-                # Make sure we have at least one item in the list
-                if not fac_list or len(fac_list) == 0:
-                    self.logger.info(f"Empty facInfo list for {uid}")
-                    return None
-                    
-                # Safe way to extract the code
-                first_fac = fac_list[0]
-                if isinstance(first_fac, dict):
-                    if 'code' not in first_fac:
-                        self.logger.info(f"No 'code' field found in facInfo for {uid}")
-                        return None
-                    return first_fac['code']
-                elif hasattr(first_fac, 'code'):
-                    return first_fac.code
-                else:
-                    self.logger.info(f"Cannot extract code from facInfo for {uid}")
-                    return None
-                    
-            except Fault as e:
-                if 'was not found' in str(e):
-                    self.logger.info(f"No authorization code found for {uid}")
-                    return None
-                raise
-                
+            code = self._fetch_auth_code_live(uid)
         except Exception as e:
             self.logger.error(f"Error fetching auth code: {str(e)}")
             # Don't raise error, just return None with a log message
             self.logger.info(f"User {uid} doesn't have an authorization code")
             return None
+        # Remembered, like a preloaded code, until the preload would be stale; a miss only briefly
+        fac_cache.remember(uid, code, miss_max_age=self.NEGATIVE_CACHE_TTL)
+        return code
 
-    def find_phone_by_owner(self, uid):
-        """Find a phone assigned to a specific user by UID/username"""
+    def preload_auth_codes(self, force=False):
+        """Load every authorization code with paged listFacInfo calls unless the loaded ones are fresh
+
+        Returns the number of codes loaded, or None if nothing was loaded.
+        """
+        self._configure_fac_cache()
+        if not force and fac_cache.is_fresh():
+            return None
+        return fac_cache.load(self._bulk_pages(
+            self.FAC_SQL, lambda row: row, 'listFacInfo', {'name': '', 'code': ''}, 'facInfo', self.FAC_PAGE_SIZE
+        ))
+
+    def _bulk_pages(self, sql, from_sql, operation, returned_tags, item_key, page_size):
+        """Yield every item of the inventory as pages, read with executeSQLQuery if enabled and allowed
+
+        With CUCM_SQL_ENRICHMENT on, the tables are read with the SQL query in
+        pages of SQL_PAGE_ROWS rows and each row is converted with from_sql. If
+        the AXL user may not run SQL (the first query fails with a Fault), the
+        list operation is paged with skip/first instead, as it is when SQL is off.
+        """
+        if Settings.get_value('CUCM_SQL_ENRICHMENT', 'False').lower() == 'true':
+            pages = self._sql_pages(sql)
+            try:
+                first = next(pages, [])
+            except Fault as e:
+                self.logger.warning(f"executeSQLQuery not permitted, falling back to {operation}: {str(e)}")
+            else:
+                yield [from_sql(row) for row in first]
+                for rows in pages:
+                    yield [from_sql(row) for row in rows]
+                return
+        yield from self._list_pages(operation, returned_tags, item_key, page_size)
+
+    def _list_pages(self, operation, returned_tags, item_key, page_size):
+        """Yield every item of an AXL list operation one page (skip/first) at a time"""
+        service = self._get_client()
+        skip = 0
+        while True:
+            response = getattr(service, operation)(
+                searchCriteria={'name': '%'},
+                returnedTags=returned_tags,
+                skip=skip,
+                first=page_size
+            )
+            items = self._response_items(response, item_key)
+            yield items
+            if len(items) < page_size:
+                return
+            skip += page_size
+
+    def _sql_pages(self, sql):
+        """Run a SELECT with executeSQLQuery in pages of SQL_PAGE_ROWS rows, yielding each page as dicts
+
+        Informix SKIP/FIRST keeps every response under the AXL result size
+        limit; the query must have a stable ORDER BY.
+        """
+        service = self._get_client()
+        skip = 0
+        while True:
+            response = service.executeSQLQuery(
+                sql=f"SELECT SKIP {skip} FIRST {self.SQL_PAGE_ROWS} {sql}"
+            )
+            rows = [self._sql_row(row) for row in self._response_items(response, 'row')]
+            yield rows
+            if len(rows) < self.SQL_PAGE_ROWS:
+                return
+            skip += self.SQL_PAGE_ROWS
+
+    @staticmethod
+    def _response_items(response, item_key):
+        """The item list of an AXL list or SQL response, as a list"""
+        if not response or 'return' not in response or not response['return']:
+            return []
+        items = response['return'][item_key] if item_key in response['return'] else None
+        if not items:
+            return []
+        return items if isinstance(items, list) else [items]
+
+    @staticmethod
+    def _sql_row(row):
+        """An executeSQLQuery row (a list of column elements or a dict) as a dict of column -> text"""
+        if isinstance(row, dict):
+            return {key.lower(): value for key, value in row.items()}
+        return {element.tag.lower(): element.text or '' for element in row}
+
+    @staticmethod
+    def _phone_from_sql(row):
+        return {
+            'name': row.get('name', ''),
+            'description': row.get('description', ''),
+            'model': row.get('model', ''),
+            'product': row.get('product', ''),
+            'class': row.get('deviceclass', ''),
+            'protocol': row.get('protocol', ''),
+            'ownerUserName': row.get('owner', ''),
+        }
+
+    def _configure_fac_cache(self):
+        fac_cache.configure(max_age=int(Settings.get_value('CUCM_FAC_REFRESH_INTERVAL', '60')) * 60)
+
+    def _fetch_auth_code_live(self, uid):
+        """Look one authorization code up with listFacInfo; returns None if the user has none"""
+        self.logger.info(f"Fetching auth code for UID: {uid}")
+        
+        # Get AXL service client
+        service = self._get_client()
+        
+        # Use listFacInfo AXL API with correct field names
         try:
-            service = self._get_client()  # Get the AXL service
-            
-            # Direct phone search by description containing user ID
-            self.logger.info(f"Searching phones with description pattern: %{uid}%")
+            response = service.listFacInfo(
+                searchCriteria={'name': uid},
+                returnedTags={'code': ''}
+            )
             
-            try:
-                phone_resp = service.listPhone(
-                    searchCriteria={'description': f'%{uid}%'},  # Search for phones with description containing UID
-                    returnedTags={
-                        'name': '',
-                        'description': '',
-                        'model': '',
-                        'product': ''
-                    }
-                )
-                
-                # Check if we got a valid response
-                if not phone_resp or 'return' not in phone_resp:
-                    self.logger.info(f"No phones found with description containing {uid}")
-                    return None
-                
-                return_data = phone_resp['return']
-                
-                if not return_data or 'phone' not in return_data or not return_data['phone']:
-                    self.logger.info(f"No phones found with description containing {uid}")
-                    return None
+            # Safely access the return value
+            if response is None:
+                self.logger.info(f"No authorization code found for {uid}")
+                return None
                 
-                phones = return_data['phone']
+            # Check for 'return' key in response
+            if 'return' not in response:
+                self.logger.info(f"Response doesn't contain 'return' key for {uid}")
+                return None
                 
-                # Ensure phones is a list we can iterate over
-                if not isinstance(phones, list):
-                    phones = [phones]
+            return_value = response['return']
+            
+            # Check if facInfo exists and has values
+            if return_value is None or 'facInfo' not in return_value or not return_value['facInfo']:
+                self.logger.info(f"User {uid} doesn't have an authorization code")
+                return None
+            
+            fac_list = return_value['facInfo']
+            
+            # Make sure we have at least one item in the list
+            if not fac_list or len(fac_list) == 0:
+                self.logger.info(f"Empty facInfo list for {uid}")
+                return None
                 
-                if not phones:
-                    self.logger.info(f"No phones found with description containing {uid}")
+            # Safe way to extract the code
+            first_fac = fac_list[0]
+            if isinstance(first_fac, dict):
+                if 'code' not in first_fac:
+                    self.logger.info(f"No 'code' field found in facInfo for {uid}")
                     return None
+                return first_fac['code']
+            elif hasattr(first_fac, 'code'):
+                return first_fac.code
+            else:
+                self.logger.info(f"Cannot extract code from facInfo for {uid}")
+                return None
                 
-                # Get the first phone that matches
-                phone = phones[0]
-                
-                name = self._get_value(phone, 'name', '')
-                
-                # Extract MAC from SEP device name
-                mac = ''
-                if name and isinstance(name, str) and name.startswith('SEP'):
-                    mac = name[3:]
-                    self.logger.info(f"Found phone for {uid}: {name}")
-                
-                return {
-                    'name': name,
-                    'description': self._get_value(phone, 'description', ''),
-                    'model': self._get_value(phone, 'model', ''),
-                    'mac': mac
-                }
-                
-            except Exception as e:
-                self.logger.error(f"Error searching phone by description for {uid}: {str(e)}")
+        except Fault as e:
+            if 'was not found' in str(e):
+                self.logger.info(f"No authorization code found for {uid}")
                 return None
+            raise
 
+    def find_phone_by_owner(self, uid):
+        """Find a phone assigned to a specific user by UID/username
+
+        Answered from the phone inventory snapshot when it has a match. A uid
+        missing from a current snapshot has no phone, so enrichment retries do
+        not cost a listPhone scan per contact; with a stale snapshot a live
+        listPhone search for the uid in the description is made instead.
+        """
+        if phone_inventory.ready():
+            phone = phone_inventory.find_by_owner(uid)
+            if phone is not None:
+                return {key: phone[key] for key in ('name', 'description', 'model', 'mac')}
+            if self._snapshot_is_current():
+                return None
+            self.logger.info(f"No phone owned by or described with {uid} in the stale phone inventory, asking CUCM")
+        try:
+            return self._cached_lookup(('listPhone', 'description', uid.lower()),
+                                       lambda: self._find_phone_by_owner_live(uid))
         except Exception as e:
-            self.logger.error(f"Error finding phone by owner: {str(e)}")
+            self.logger.error(f"Error searching phone by description for {uid}: {str(e)}")
             return None
 
+    def _find_phone_by_owner_live(self, uid):
+        """listPhone by description containing uid; returns None if no phone matches and raises on AXL errors"""
+        service = self._get_client()  # Get the AXL service
+
+        # Direct phone search by description containing user ID
+        self.logger.info(f"Searching phones with description pattern: %{uid}%")
+        phone_resp = service.listPhone(
+            searchCriteria={'description': f'%{uid}%'},  # Search for phones with description containing UID
+            returnedTags={
+                'name': '',
+                'description': '',
+                'model': '',
+                'product': ''
+            }
+        )
+
+        phones = self._response_items(phone_resp, 'phone')
+        if not phones:
+            self.logger.info(f"No phones found with description containing {uid}")
+            return None
+
+        # Get the first phone that matches
+        phone = phones[0]
+
+        name = self._get_value(phone, 'name', '')
+
+        # Extract MAC from SEP device name
+        mac = ''
+        if name and isinstance(name, str) and name.startswith('SEP'):
+            mac = name[3:]
+            self.logger.info(f"Found phone for {uid}: {name}")
+
+        return {
+            'name': name,
+            'description': self._get_value(phone, 'description', ''),
+            'model': self._get_value(phone, 'model', ''),
+            'mac': mac
+        }
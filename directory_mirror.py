@@ -0,0 +1,87 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, DirectoryEntry
+from datetime import datetime
+import hashlib
+import logging
+
+class DirectoryMirror:
+    """Keep the directory_entry table in step with the people seen by an LDAP sync
+
+    Every person entry the sync reads is passed to add(); entries whose
+    mirrored values did not change since the last sync are skipped, the rest
+    are upserted in bulk on flush(). After a sync that saw the whole
+    directory, prune() deletes the entries that were not seen.
+    """
+    # Rows per DELETE ... IN (...) statement
+    BULK_CHUNK_SIZE = 500
+
+    def __init__(self, search_attributes):
+        """
+        Args:
+            search_attributes: LDAP attributes whose values make up the searchable text
+        """
+        self.logger = logging.getLogger('DirectoryMirror')
+        self.search_attributes = search_attributes
+        self.written = 0
+        self.removed = 0
+        self.seen_dns = set()
+        self._hashes = {}
+        self._rows = []
+
+    def load_index(self):
+        """Load the digest of every mirrored entry in a single query"""
+        self._hashes = dict(db.session.query(DirectoryEntry.dn, DirectoryEntry.entry_hash))
+
+    def add(self, entry_dn, entry_data):
+        """Queue an entry for writing unless it is unchanged since the last sync"""
+        self.seen_dns.add(entry_dn)
+        values = {attr: [str(value) for value in entry_data.get(attr, [])]
+                  for attr in ('uid', 'cn', 'mail', 'eduPersonAffiliation', *self.search_attributes)}
+        payload = '\x1f'.join(attr + '=' + '\x1e'.join(values[attr]) for attr in sorted(values))
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        if self._hashes.get(entry_dn) == digest:
+            return
+
+        self._hashes[entry_dn] = digest
+        affiliations = values['eduPersonAffiliation']
+        self._rows.append({
+            'dn': entry_dn,
+            'uid': next(iter(values['uid']), ''),
+            'cn': next(iter(values['cn']), ''),
+            'mail': next(iter(values['mail']), ''),
+            'affiliation': f"|{'|'.join(affiliations)}|" if affiliations else '',
+            'search_text': '\n'.join(value.lower() for attr in self.search_attributes for value in values[attr]),
+            'entry_hash': digest,
+            'updated_at': datetime.utcnow(),
+        })
+
+    def flush(self):
+        """Upsert the queued entries and commit"""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        stmt = sqlite_insert(DirectoryEntry.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DirectoryEntry.__table__.c.dn],
+            set_={name: stmt.excluded[name] for name in rows[0] if name != 'dn'}
+        )
+        try:
+            db.session.execute(stmt, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.written += len(rows)
+
+    def prune(self):
+        """Delete mirrored entries not seen by this sync (only valid after a complete full sync)"""
+        if not self.seen_dns:
+            self.logger.warning("No directory entries were seen, keeping the mirror as it is")
+            return 0
+        missing = [dn for dn in self._hashes if dn not in self.seen_dns]
+        for start in range(0, len(missing), self.BULK_CHUNK_SIZE):
+            chunk = missing[start:start + self.BULK_CHUNK_SIZE]
+            DirectoryEntry.query.filter(DirectoryEntry.dn.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+        self.removed = len(missing)
+        return self.removed
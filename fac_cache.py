@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+class FACCache:
+    """Process-wide map of FAC (authorization code) names to codes
+
+    load() reads every FAC once (paged listFacInfo or executeSQLQuery calls
+    made by CUCMService), so looking up a contact's PIN during enrichment is a
+    dictionary lookup. While the preloaded map is fresh, a name missing from it
+    has no code. Single live lookups made while the map is stale are
+    remembered for the same time, or for miss_max_age when they found no
+    code. Codes are only kept in memory.
+    """
+
+    def __init__(self, max_age=3600):
+        """
+        Args:
+            max_age: Seconds a preloaded map or a remembered live lookup stays valid
+        """
+        self.logger = logging.getLogger('FACCache')
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._codes = {}
+        self._loaded_at = None
+        self._lookups = {}  # name -> (time the lookup expires, code or None)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def configure(self, max_age=None):
+        with self._lock:
+            if max_age is not None:
+                self.max_age = max(int(max_age), 0)
+
+    def is_fresh(self):
+        with self._lock:
+            return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.max_age
+
+    def lookup(self, name):
+        """Return (known, code): known is False when only a live call can tell"""
+        now = time.monotonic()
+        with self._lock:
+            remembered = self._lookups.get(name)
+            if remembered is not None and now < remembered[0]:
+                self.hits += 1
+                return True, remembered[1]
+            if self._loaded_at is not None and now - self._loaded_at < self.max_age:
+                self.hits += 1
+                return True, self._codes.get(name)
+            self.misses += 1
+            return False, None
+
+    def remember(self, name, code, miss_max_age=None):
+        """Record the result of a live lookup, including that a name has no code (for miss_max_age seconds if given)"""
+        max_age = self.max_age if code or miss_max_age is None else min(miss_max_age, self.max_age)
+        with self._lock:
+            self._lookups[name] = (time.monotonic() + max_age, code or None)
+
+    def load(self, pages):
+        """Replace the map with every FAC; returns the number loaded
+
+        pages yields lists of FAC entries (listFacInfo results or dicts with
+        name and code). Returns None without loading if another thread is
+        already loading.
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return None
+        try:
+            started = time.perf_counter()
+            codes = {}
+            for entries in pages:
+                for entry in entries:
+                    name = self._text(entry, 'name')
+                    code = self._text(entry, 'code')
+                    if name and code:
+                        codes[name] = code
+            with self._lock:
+                self._codes = codes
+                self._loaded_at = time.monotonic()
+                # Live lookups made before the preload are superseded by it
+                self._lookups = {}
+            self.logger.info(f"Preloaded {len(codes)} authorization codes in {time.perf_counter() - started:.1f} s")
+            return len(codes)
+        finally:
+            self._load_lock.release()
+
+    def clear(self):
+        """Forget every code (e.g. after the CUCM settings were saved)"""
+        with self._lock:
+            self._codes = {}
+            self._loaded_at = None
+            self._lookups = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'codes': len(self._codes),
+                'loaded_seconds_ago': round(time.monotonic() - self._loaded_at) if self._loaded_at is not None else None,
+                'remembered': len(self._lookups),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    @staticmethod
+    def _text(entry, attr):
+        try:
+            value = entry[attr]
+        except (KeyError, TypeError):
+            value = getattr(entry, attr, None)
+        return str(value) if value else ''
+
+# Shared by every CUCMService instance in the process
+fac_cache = FACCache()
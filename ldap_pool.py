@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+from ldap3.core.exceptions import LDAPException
+import hashlib
+import logging
+import threading
+import time
+
+class LDAPConnectionPool:
+    """Process-wide pool of bound LDAP connections
+
+    Connections are grouped by a fingerprint of the settings they were opened
+    with, so a settings change never hands out a connection bound with old
+    credentials. The ldap3 Server object (holding the schema and DSA info read
+    on the first bind) and the base DN verification result are cached per
+    fingerprint as well.
+    """
+    # Connections a sync leaves free for interactive callers (user search, imports)
+    RESERVED_FOR_INTERACTIVE = 1
+
+    def __init__(self, max_size=4, idle_timeout=300, health_check_after=30, acquire_timeout=30):
+        """
+        Args:
+            max_size: Maximum number of open connections per fingerprint
+            idle_timeout: Seconds after which an idle connection is closed
+            health_check_after: Idle seconds after which a connection is probed before reuse
+            acquire_timeout: Seconds to wait for a free connection when the pool is full
+        """
+        self.logger = logging.getLogger('LDAPConnectionPool')
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._slots = {}
+
+    @staticmethod
+    def fingerprint(*settings):
+        """Stable key for a set of connection settings (hashed so credentials are not kept as keys)"""
+        payload = '\x1f'.join('' if value is None else str(value) for value in settings)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def configure(self, max_size=None, idle_timeout=None):
+        """Update pool limits; takes effect for the next acquire"""
+        with self._cond:
+            if max_size:
+                self.max_size = max(int(max_size), 1)
+            if idle_timeout is not None:
+                self.idle_timeout = max(int(idle_timeout), 0)
+            self._cond.notify_all()
+
+    def sync_workers(self, requested):
+        """Number of sync fetch workers to run, keeping RESERVED_FOR_INTERACTIVE connections free"""
+        with self._cond:
+            return max(min(requested, self.max_size - self.RESERVED_FOR_INTERACTIVE), 1)
+
+    def get_server(self, fingerprint, create_server):
+        """Return the cached ldap3 Server for a fingerprint, creating it on first use"""
+        with self._cond:
+            slot = self._slot(fingerprint)
+            if slot['server'] is None:
+                slot['server'] = create_server()
+            return slot['server']
+
+    def is_verified(self, fingerprint):
+        with self._cond:
+            return self._slot(fingerprint)['verified']
+
+    def mark_verified(self, fingerprint):
+        with self._cond:
+            self._slot(fingerprint)['verified'] = True
+
+    @contextmanager
+    def connection(self, fingerprint, open_connection):
+        """Borrow a bound connection, opening one with open_connection() if none is idle
+
+        The connection goes back to the pool when the block exits, unless the
+        block failed with an LDAP error or the connection was closed, in which
+        case it may be broken and is discarded. A generator closed while it
+        holds the connection (GeneratorExit) may have left a paged search
+        half-read, so that connection is discarded too.
+        """
+        conn = self._acquire(fingerprint, open_connection)
+        try:
+            yield conn
+        except BaseException as e:
+            reusable = not isinstance(e, (LDAPException, GeneratorExit, KeyboardInterrupt, SystemExit)) and not conn.closed
+            self._release(fingerprint, conn, reuse=reusable)
+            raise
+        else:
+            self._release(fingerprint, conn, reuse=not conn.closed)
+
+    def clear(self):
+        """Close every idle connection and forget cached servers (e.g. after a settings change)"""
+        with self._cond:
+            slots, self._slots = self._slots, {}
+            self._cond.notify_all()
+        for slot in slots.values():
+            for conn, _ in slot['idle']:
+                self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pools': len(self._slots),
+                'idle': sum(len(slot['idle']) for slot in self._slots.values()),
+                'in_use': sum(slot['in_use'] for slot in self._slots.values()),
+            }
+
+    def _slot(self, fingerprint):
+        slot = self._slots.get(fingerprint)
+        if slot is None:
+            slot = {'server': None, 'verified': False, 'idle': [], 'in_use': 0}
+            self._slots[fingerprint] = slot
+        return slot
+
+    def _acquire(self, fingerprint, open_connection):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = None
+            with self._cond:
+                expired = self._prune()
+                slot = self._slot(fingerprint)
+                while candidate is None:
+                    if slot['idle']:
+                        candidate, last_used = slot['idle'].pop()
+                        idle_for = time.monotonic() - last_used
+                        slot['in_use'] += 1
+                    elif slot['in_use'] < self.max_size:
+                        slot['in_use'] += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Timed out waiting for a free LDAP connection")
+                        self._cond.wait(remaining)
+                        slot = self._slot(fingerprint)
+
+            for conn in expired:
+                self._close(conn)
+
+            if candidate is None:
+                try:
+                    return open_connection()
+                except BaseException:
+                    self._release(fingerprint, None, reuse=False)
+                    raise
+
+            if self._is_healthy(candidate, idle_for):
+                return candidate
+
+            self.logger.info("Discarding stale pooled LDAP connection")
+            self._release(fingerprint, candidate, reuse=False)
+
+    def _release(self, fingerprint, conn, reuse):
+        with self._cond:
+            slot = self._slots.get(fingerprint)
+            if slot is not None:
+                slot['in_use'] = max(slot['in_use'] - 1, 0)
+                if reuse and conn is not None and len(slot['idle']) < self.max_size:
+                    slot['idle'].append((conn, time.monotonic()))
+                    conn = None
+            self._cond.notify_all()
+        if conn is not None:
+            self._close(conn)
+
+    def _prune(self):
+        """Remove idle connections past the idle timeout (called with the lock held)"""
+        now = time.monotonic()
+        expired = []
+        for slot in self._slots.values():
+            fresh = []
+            for conn, last_used in slot['idle']:
+                if now - last_used >= self.idle_timeout:
+                    expired.append(conn)
+                else:
+                    fresh.append((conn, last_used))
+            slot['idle'] = fresh
+        return expired
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed or not conn.bound:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            # Cheap root DSE read; fails fast if the server dropped the connection
+            conn.search('', '(objectClass=*)', search_scope='BASE', attributes=['1.1'])
+            return not conn.closed
+        except Exception as e:
+            self.logger.info(f"Pooled LDAP connection failed health check: {str(e)}")
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+# Shared by every LDAPSync instance in the process
+ldap_pool = LDAPConnectionPool()
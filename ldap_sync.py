@@ -1,12 +1,56 @@
-from ldap3 import Server, Connection, SUBTREE, ALL_ATTRIBUTES, ALL, LEVEL, MODIFY_REPLACE, Tls, SIMPLE, AUTO_BIND_NO_TLS, AUTO_BIND_TLS_BEFORE_BIND
+from ldap3 import Server, Connection, SUBTREE, ALL_ATTRIBUTES, DSA, LEVEL, MODIFY_REPLACE, Tls, SIMPLE, AUTO_BIND_NO_TLS, AUTO_BIND_TLS_BEFORE_BIND
+from ldap3.core.exceptions import LDAPBindError, LDAPInvalidDnError, LDAPInvalidFilterError
+from ldap3.operation.search import parse_filter
+from ldap3.utils.conv import escape_filter_chars
+from ldap3.utils.dn import parse_dn, safe_dn, to_dn
 import ssl
-from models import db, Contact, Settings, Notification  # Add Notification to imports
-from datetime import datetime
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from models import db, Contact, History, Settings, Notification, SyncRun, DirectoryEntry  # Add Notification to imports
+from datetime import datetime, timedelta, timezone
 from config import Config
 import logging
-from cucm_service import CUCMService  # Add this import at the top
+from cucm_enrichment import enrichment_queue
+from sync_writer import ContactSyncWriter
+from directory_mirror import DirectoryMirror
+from ldap_pool import ldap_pool
+from ttl_cache import TTLCache
+from sync_metrics import SyncMetrics
+import json
+
+# User search results shared by every LDAPSync instance, keyed by settings fingerprint
+user_search_cache = TTLCache(max_size=256, ttl=300)
 
 class LDAPSync:
+    # Attributes requested for every contact entry
+    SYNC_ATTRIBUTES = ['uid', 'cn', 'sn', 'givenName', 'mail', 'telephoneNumber',
+                       'ou', 'eduPersonAffiliation', 'modifyTimestamp']
+    # Simple Paged Results control (RFC 2696)
+    PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+    # Pages fetched ahead of the writer; bounds sync memory to a few pages
+    PREFETCH_PAGES = 2
+    # Settings keys holding incremental sync state
+    HIGH_WATER_MARK_KEY = 'LDAP_SYNC_HIGH_WATER_MARK'
+    LAST_FULL_SYNC_KEY = 'LDAP_LAST_FULL_SYNC'
+    CHECKPOINT_KEY = 'LDAP_SYNC_CHECKPOINT'
+    MIRROR_STATE_KEY = 'LDAP_DIRECTORY_MIRROR'
+    # First characters of the uid partitions; anything else falls in a remainder partition
+    UID_PARTITION_PREFIXES = '0123456789abcdefghijklmnopqrstuvwxyz'
+    # Attributes matched by the user search filter
+    USER_SEARCH_ATTRIBUTES = ['uid', 'cn', 'mail', 'sn', 'givenName']
+    # Number of SyncRun rows kept for the settings page chart
+    SYNC_RUN_HISTORY = 200
+    # Terms per OR filter when fetching many contacts at once, and items per bulk import request
+    IMPORT_FILTER_CHUNK = 100
+    BULK_IMPORT_LIMIT = 1000
+    # First-level entries searched as partitions by 'ou' partitioning (the sync filter only matches people)
+    CONTAINER_FILTER = '(!(objectClass=person))'
+    # LDAP result code returned when a search exceeds the server's size limit
+    SIZE_LIMIT_EXCEEDED = 4
+
     class UIDConflict(Exception):
         def __init__(self, uid, contact_id):
             self.uid = uid
@@ -86,9 +130,18 @@ class LDAPSync:
         except AttributeError:
             self.exclude_students = False
             
-        self.page_size = 100
-        # Update this limit to a much higher value or make it configurable
-        self.max_entries = 1000  # Increased from 100 to 1000
+        # Entries requested per paged search round trip (0 disables paging)
+        self.page_size = max(int(Settings.get_value('LDAP_PAGE_SIZE', '100') or 0), 0)
+        # Adaptive paging doubles the page size while a page comes back within the
+        # latency target, up to max_page_size or the page size the server caps us at
+        self.adaptive_paging = Settings.get_value('LDAP_ADAPTIVE_PAGING', 'False').lower() == 'true'
+        self.page_latency_target = max(int(Settings.get_value('LDAP_PAGE_LATENCY_TARGET_MS', '1000') or 1000), 1) / 1000
+        self.max_page_size = max(int(Settings.get_value('LDAP_MAX_PAGE_SIZE', '1000') or 1000), self.page_size)
+        # Contacts written per INSERT ... ON CONFLICT batch and transaction
+        self.batch_size = int(Settings.get_value('LDAP_SYNC_BATCH_SIZE', '500') or 500)
+        # Entries matched per sync run (0 for no limit); a capped run leaves a checkpoint
+        # the next run continues from, and removals are reconciled once a run completes
+        self.max_entries = max(int(Settings.get_value('LDAP_MAX_ENTRIES', '0') or 0), 0)
         
         # Build search filter based on settings
         base_filter = "(objectClass=person)"
@@ -97,61 +150,49 @@ class LDAPSync:
         else:
             self.search_filter = base_filter
 
+        # Pooled connections are shared by every instance using the same settings
+        self.fingerprint = ldap_pool.fingerprint(
+            self.ldap_server, self.port, self.use_ssl, self.use_anonymous,
+            self.user_dn, self.password, self.base_dn
+        )
+        ldap_pool.configure(
+            max_size=int(Settings.get_value('LDAP_POOL_SIZE', '4') or 4),
+            idle_timeout=int(Settings.get_value('LDAP_POOL_IDLE_TIMEOUT', '300') or 300)
+        )
+
+        # Incremental sync only requests entries modified since the last successful run
+        self.incremental_sync = Settings.get_value('LDAP_INCREMENTAL_SYNC', 'False').lower() == 'true'
+        self.full_sync_interval = int(Settings.get_value('LDAP_FULL_SYNC_INTERVAL', '24') or 24)
+        # Hours within which an interrupted sync is resumed from its checkpoint (0 always restarts)
+        self.resume_window = max(int(Settings.get_value('LDAP_SYNC_RESUME_HOURS', '24') or 0), 0)
+        # Days contacts removed from LDAP are kept before being purged (0 keeps them)
+        self.retention_period = config.RETENTION_PERIOD
+
+        # Optional parallel sync: 'ou' splits by first-level entries under the base DN,
+        # 'uid' by uid prefix; each partition is searched on its own pooled connection
+        self.partitioning = (Settings.get_value('LDAP_SYNC_PARTITIONING', 'none') or 'none').strip().lower()
+        self.sync_workers = max(int(Settings.get_value('LDAP_SYNC_WORKERS', '1') or 1), 1)
+        # Set while sync_contacts runs; collects per-phase timings for the SyncRun record
+        self.metrics = None
+
+        # User search (import dialog) is bounded and cached
+        self.search_size_limit = max(int(Settings.get_value('LDAP_SEARCH_SIZE_LIMIT', '50') or 50), 1)
+        self.search_min_length = max(int(Settings.get_value('LDAP_SEARCH_MIN_LENGTH', '3') or 3), 1)
+        user_search_cache.configure(ttl=Settings.get_value('LDAP_SEARCH_CACHE_TTL', '300') or 0)
+        # Answer user search from the directory_entry mirror kept by the sync
+        self.search_mirror = Settings.get_value('LDAP_SEARCH_LOCAL_MIRROR', 'True').lower() == 'true'
+        self.last_search_truncated = False
+        self.last_search_source = None  # 'mirror' or 'directory'
+        self.mirror_refreshed_at = None
+
     def connect(self):
-        self.logger.info(f"Connecting to LDAP server: {self.ldap_server}, Port: {self.port}, SSL: {self.use_ssl}")
-        
-        if self.use_anonymous:
-            self.logger.info("Using anonymous binding (explicitly enabled)")
-        else:
-            # Log credentials being used (don't log actual password)
-            self.logger.info(f"Using authenticated binding with DN: '{self.user_dn}'")
-            if not self.password:
-                self.logger.warning("Password is empty but authenticated binding was requested")
-        
+        """Open a dedicated connection and verify the base DN (used by the connection tests)"""
         try:
-            if self.use_anonymous:
-                # Only use anonymous binding if explicitly allowed and credentials are missing
-                self.logger.info("Connecting with anonymous binding")
-                if self.use_ssl:
-                    # Create TLS configuration for anonymous binding with SSL
-                    tls = Tls(validate=ssl.CERT_NONE)
-                    server = Server(self.ldap_server, port=self.port, use_ssl=True, tls=tls)
-                else:
-                    server = Server(self.ldap_server, port=self.port, get_info=ALL)
-                conn = Connection(server, auto_bind=True)
-            else:
-                # Validate credentials before attempting to connect
-                if not self.user_dn:
-                    self.logger.error("Missing LDAP bind_dn")
-                    raise ValueError("LDAP bind_dn is required for authentication")
-                    
-                if not self.password:
-                    self.logger.error("Missing LDAP bind_password")
-                    raise ValueError("LDAP bind_password is required for authentication")
-                
-                # Create server object with or without SSL
-                if self.use_ssl:
-                    # Create TLS configuration
-                    tls = Tls(validate=ssl.CERT_NONE)
-                    self.logger.info(f"Creating SSL server connection to {self.ldap_server}:{self.port}")
-                    server = Server(self.ldap_server, port=self.port, use_ssl=True, tls=tls, get_info=ALL)
-                else:
-                    self.logger.info(f"Creating non-SSL server connection to {self.ldap_server}:{self.port}")
-                    server = Server(self.ldap_server, port=self.port, get_info=ALL)
-                
-                # Attempt authenticated connection with proper credentials
-                self.logger.info("Attempting authenticated binding...")
-                conn = Connection(
-                    server,
-                    user=self.user_dn,
-                    password=self.password,
-                    authentication=SIMPLE,
-                    auto_bind=True
-                )
-                self.logger.info(f"Bind successful! Connection: {conn}")
+            conn = self._open_connection(self._create_server())
             
             # Verify base DN exists
             if not self._verify_base_dn(conn):
+                conn.unbind()
                 raise Exception(f"Base DN '{self.base_dn}' not found or not accessible")
             
             self.logger.info("LDAP connection successful")
@@ -162,6 +203,76 @@ class LDAPSync:
             self.logger.error(f"Connection details - Server: {self.ldap_server}, Port: {self.port}, SSL: {self.use_ssl}, Anonymous: {self.use_anonymous}")
             raise
 
+    @contextmanager
+    def connection(self):
+        """Borrow a bound connection from the process-wide pool
+
+        The server info and the base DN check are cached per settings
+        fingerprint, so only the first connection pays for them.
+        """
+        server = ldap_pool.get_server(self.fingerprint, self._create_server)
+        with ldap_pool.connection(self.fingerprint, lambda: self._open_connection(server)) as conn:
+            if not ldap_pool.is_verified(self.fingerprint):
+                with self._timed('verify'):
+                    verified = self._verify_base_dn(conn)
+                if not verified:
+                    raise Exception(f"Base DN '{self.base_dn}' not found or not accessible")
+                ldap_pool.mark_verified(self.fingerprint)
+            yield conn
+
+    def _create_server(self):
+        """Build the ldap3 Server object for the configured host"""
+        if self.use_ssl:
+            # Create TLS configuration
+            tls = Tls(validate=ssl.CERT_NONE)
+            self.logger.info(f"Creating SSL server connection to {self.ldap_server}:{self.port}")
+            return Server(self.ldap_server, port=self.port, use_ssl=True, tls=tls, get_info=DSA)
+        self.logger.info(f"Creating non-SSL server connection to {self.ldap_server}:{self.port}")
+        # Only the root DSE is read at bind: the schema is never used, and without
+        # it ldap3 does not convert attribute values by syntax on every search
+        return Server(self.ldap_server, port=self.port, get_info=DSA)
+
+    def _open_connection(self, server):
+        """Open and bind a new connection; server info is only read if the server has none yet"""
+        self.logger.info(f"Connecting to LDAP server: {self.ldap_server}, Port: {self.port}, SSL: {self.use_ssl}")
+        
+        if self.use_anonymous:
+            # Only use anonymous binding if explicitly allowed and credentials are missing
+            self.logger.info("Connecting with anonymous binding")
+            conn = Connection(server)
+        else:
+            # Validate credentials before attempting to connect
+            if not self.user_dn:
+                self.logger.error("Missing LDAP bind_dn")
+                raise ValueError("LDAP bind_dn is required for authentication")
+                
+            if not self.password:
+                self.logger.error("Missing LDAP bind_password")
+                raise ValueError("LDAP bind_password is required for authentication")
+            
+            # Attempt authenticated connection with proper credentials
+            self.logger.info(f"Attempting authenticated binding with DN: '{self.user_dn}'")
+            conn = Connection(
+                server,
+                user=self.user_dn,
+                password=self.password,
+                authentication=SIMPLE
+            )
+
+        with self._timed('bind'):
+            conn.open()
+            bound = conn.bind(read_server_info=server.info is None)
+        if not bound:
+            description = conn.result.get('description', 'Unknown error') if conn.result else 'Unknown error'
+            conn.unbind()
+            raise LDAPBindError(f"LDAP bind failed: {description}")
+        self.logger.info(f"Bind successful! Connection: {conn}")
+        return conn
+
+    def _timed(self, phase):
+        """Time a block into the current sync run's metrics, if a sync is running"""
+        return self.metrics.phase(phase) if self.metrics else nullcontext()
+
     def _verify_base_dn(self, conn):
         """Verify that the base DN exists and is accessible"""
         try:
@@ -190,228 +301,930 @@ class LDAPSync:
             self.logger.error(f"Failed to get Root DSE: {str(e)}")
             return []
 
-    def sync_contacts(self):
-        self.logger.info("Starting LDAP sync")
-        conn = self.connect()
-        total_entries = 0
-        conflicts = []
-        added_contacts = 0
-        updated_contacts = 0
-        
+    def sync_contacts(self, full=None, progress=None):
+        """Synchronize contacts from LDAP
+
+        full=None picks incremental or full mode from the settings, True forces a
+        full reconcile and False requests an incremental run when a mark exists.
+        progress, if given, is called with keyword arguments (phase, processed,
+        total and the writer's counters) as the sync advances.
+
+        A checkpoint is saved after every committed batch. If a run fails, the
+        next run of the same mode and filter resumes it: partitions that were
+        fully applied are not searched again, entries already written are
+        skipped, and removed contacts are only reconciled once every page of
+        the directory has been applied. A run stopped by LDAP_MAX_ENTRIES
+        leaves the same kind of checkpoint, kept whatever its age or the resume
+        window, so consecutive capped runs work through the directory.
+        """
+        if full is None:
+            full = self._full_sync_due()
+        high_water_mark = None if full else Settings.get_value(self.HIGH_WATER_MARK_KEY)
+        if not high_water_mark:
+            full = True
+        mode = 'full' if full else 'incremental'
+
+        self.logger.info(f"Starting LDAP sync ({mode})")
+        # The base DN was verified when the pooled connection was first opened
+        base_dn = self.base_dn
+
+        search_filter = self.search_filter
+        if high_water_mark:
+            search_filter = f"(&{self.search_filter}(modifyTimestamp>={high_water_mark}))"
+
+        # An interrupted run is resumed with its original sync time, which marks
+        # the contacts it already wrote
+        checkpoint = self._load_checkpoint(mode, search_filter)
+        current_time = datetime.fromisoformat(checkpoint['sync_time']) if checkpoint else datetime.utcnow()
+        completed = [tuple(partition) for partition in checkpoint['completed_partitions']] if checkpoint else []
+        finished = []  # partitions whose pages were all processed but not necessarily committed
+        latest_change = checkpoint.get('latest_change') if checkpoint else None
+        context_csn = checkpoint.get('context_csn') if checkpoint else None
+        # Set once a run of this sync stopped at max_entries
+        capped = bool(checkpoint and checkpoint.get('capped'))
+
+        def save_checkpoint():
+            # Runs after each committed batch, so every finished partition is now applied
+            mirror.flush()
+            completed.extend(finished)
+            finished.clear()
+            if not (self.resume_window or capped):
+                # Resume is off and the run is not capped, so no run would read it
+                return
+            self._save_checkpoint({
+                'fingerprint': self.fingerprint,
+                'mode': mode,
+                'search_filter': search_filter,
+                'partitioning': self.partitioning,
+                'sync_time': current_time.isoformat(),
+                'context_csn': context_csn,
+                'latest_change': latest_change,
+                'completed_partitions': completed,
+                'capped': capped,
+                'processed': writer.processed + skipped,
+                'batch': writer.batches,
+                'last_dn': writer.last_dn,
+            })
+
+        # Every person seen is also copied to the directory_entry mirror for user search
+        mirror = DirectoryMirror(self.USER_SEARCH_ATTRIBUTES)
+
+        # Load existing contacts once and match entries in memory
+        self.metrics = SyncMetrics()
+        writer = ContactSyncWriter(
+            batch_size=self.batch_size,
+            sync_time=current_time,
+            on_batch=self._queue_enrichment,
+            timed=self._timed,
+            on_commit=save_checkpoint
+        )
+        skipped = 0
+
+        def report(phase=None, **extra):
+            if progress:
+                progress(phase=phase, processed=writer.processed + skipped, added=writer.added,
+                         updated=writer.updated, unchanged=writer.unchanged,
+                         conflicts=len(writer.conflicts), **extra)
+
         try:
-            # Use the configured base DN first
-            base_dn = self.base_dn
-            
-            # If base DN verification fails, try to find an alternative
-            if not self._verify_base_dn(conn):
-                self.logger.warning(f"Base DN '{self.base_dn}' not found, attempting to find alternatives...")
-                contexts = self.get_root_dse(conn)
-                if contexts and len(contexts) > 0:
-                    base_dn = str(contexts[0])
-                    self.logger.info(f"Using alternative base DN: {base_dn}")
-                else:
-                    self.logger.error("No valid naming contexts found and base DN invalid")
-                    raise Exception("No valid LDAP base DN found. Please check your LDAP settings.")
+            report('indexing', mode=mode)
+            with self._timed('index'):
+                writer.load_index()
+                mirror.load_index()
+                applied = writer.resume() if checkpoint else 0
+            if checkpoint:
+                self.logger.info(f"Resuming {'capped' if capped else 'interrupted'} {mode} sync from {checkpoint['sync_time']} "
+                                 f"(batch {checkpoint['batch']}, last DN {checkpoint['last_dn']}): "
+                                 f"{applied} entries and {len(completed)} partition(s) already applied")
 
-            # Set paged search control with size limit and exclude students
-            self.logger.info(f"Performing LDAP search with filter: {self.search_filter}")
-            
-            # Use paged search to bypass server-side size limits
-            entries_list = []
-            cookie = None
-            
-            # Implement paged search
-            self.logger.info("Using paged search to retrieve all entries")
-            
-            while True:
-                # Use paged search control to retrieve entries in batches
-                search_result = conn.search(
-                    search_base=base_dn,
-                    search_filter=self.search_filter,
-                    search_scope=SUBTREE,
-                    attributes=['uid', 'cn', 'sn', 'givenName', 'mail', 'telephoneNumber', 
-                              'ou', 'eduPersonAffiliation'],
-                    paged_size=self.page_size,
-                    paged_cookie=cookie
-                )
-                
-                if not search_result:
-                    err_msg = conn.result.get('description', 'Unknown error')
-                    self.logger.warning(f"LDAP search returned no results: {err_msg}")
-                    break
-                    
-                entries_list.extend(conn.entries)
-                self.logger.info(f"Retrieved {len(conn.entries)} entries in this page, total so far: {len(entries_list)}")
-                
-                cookie = conn.result.get('controls', {}).get('1.2.840.113556.1.4.319', {}).get('value', {}).get('cookie')
-                if not cookie:
-                    # No more pages
-                    break
+            with self.connection() as conn:
+                if not checkpoint:
+                    # Read the directory's change sequence before searching so entries
+                    # modified while this run is in progress are picked up by the next one
+                    context_csn = self._read_context_csn(conn, base_dn)
+                partitions = [partition for partition in self._sync_partitions(conn, base_dn, search_filter)
+                              if partition not in completed]
 
-            self.logger.info(f"Found {len(entries_list)} total entries")
-            current_time = datetime.utcnow()
-            
-            # Process all entries
-            for entry in entries_list:
-                # Remove size limit check, we'll process all entries
-                # if total_entries >= self.max_entries:
-                #    break
+            # Pages are fetched on worker threads and processed by this thread as they arrive
+            workers = ldap_pool.sync_workers(min(self.sync_workers, len(partitions)))
+            self.logger.info(f"Performing paged LDAP search with filter: {search_filter} "
+                             f"({len(partitions)} partition(s), {workers} worker(s))")
+            pages = self._prefetch_pages(
+                [self._partition_pages(*partition) for partition in partitions], workers,
+                on_done=lambda index: finished.append(partitions[index])
+            )
+            # A full sync is expected to see about as many entries as there are active LDAP contacts
+            expected = sum(1 for record in writer.contacts_by_dn.values()
+                           if record['is_active'] and record['source'] == 'ldap') if full else None
+            if self.max_entries and expected:
+                expected = min(expected, self.max_entries)
+            report('fetching', total=expected or None)
+            truncated = False
+            with closing(pages):
+                for page in pages:
+                    with self._timed('match'):
+                        for dn, entry_data in page:
+                            # Entries applied by an earlier run of this sync do not count towards the cap
+                            if self.max_entries and writer.processed - writer.already_applied >= self.max_entries:
+                                truncated = True
+                                break
+                            self.logger.debug(f"Processing entry: {dn}")
+                            mirror.add(dn, entry_data)
+                            fields = self._contact_fields(entry_data)
 
-                self.logger.debug(f"Processing entry: {entry.entry_dn}")
-                entry_data = entry.entry_attributes_as_dict
-                entry_dn = entry.entry_dn
-                uid = self._get_list_value(entry_data.get('uid', []))
-                
-                if not uid:  # Skip entries without UID
-                    self.logger.warning(f"Skipping entry without UID: {entry_dn}")
-                    continue
+                            modified = self._generalized_time(entry_data.get('modifyTimestamp', []))
+                            if modified and (latest_change is None or modified > latest_change):
+                                latest_change = modified
 
-                # Check for existing contact
-                existing_by_uid = Contact.query.filter_by(uid=uid).first()
-                existing_by_dn = Contact.query.filter_by(ldap_dn=entry_dn).first()
-
-                if existing_by_uid and existing_by_dn and existing_by_uid != existing_by_dn:
-                    # We have a conflict - store it and skip this entry
-                    self.logger.warning(f"Found conflict for UID {uid}")
-                    existing_by_uid.has_conflict = True
-                    existing_by_uid.conflict_with = existing_by_dn.id
-                    conflicts.append({
-                        'uid': uid,
-                        'manual_contact_id': existing_by_uid.id,
-                        'ldap_dn': entry_dn
-                    })
-                    continue
+                            if not fields['uid']:  # Skip entries without UID
+                                self.logger.warning(f"Skipping entry without UID: {dn}")
+                                skipped += 1
+                                continue
 
-                if existing_by_dn:
-                    self.logger.debug(f"Updating existing contact: {uid}")
-                    contact = existing_by_dn
-                    updated_contacts += 1
-                else:
-                    self.logger.debug(f"Creating new contact: {uid}")
-                    contact = Contact(ldap_dn=entry_dn)
-                    db.session.add(contact)
-                    added_contacts += 1
+                            writer.process(dn, fields)
+                    report()
+                    if truncated:
+                        break
 
-                # Update contact attributes
-                contact.uid = uid
-                contact.first_name = self._get_list_value(entry_data.get('givenName', []))
-                contact.last_name = self._get_list_value(entry_data.get('sn', []))
-                contact.email = self._get_list_value(entry_data.get('mail', []))
-                contact.phone = self._get_list_value(entry_data.get('telephoneNumber', []))
-                contact.department = self._get_list_value(entry_data.get('ou', []))
-                contact.title = self._get_list_value(entry_data.get('eduPersonAffiliation', []))
-                contact.last_sync = current_time
-                contact.source = 'ldap'
-                contact.is_active = True
-                
-                # After contact is created/updated, enrich with CUCM data
-                if contact:
-                    self._enrich_with_cucm_data(contact)
-                
-                total_entries += 1
-                
-                if total_entries % 10 == 0:  # Commit more frequently
-                    self.logger.info(f"Processed {total_entries} entries. Committing changes...")
-                    db.session.commit()
+            # Commit the last partial batch, which also checkpoints the finished partitions
+            writer.flush()
+            mirror.flush()
 
-            # Final commit
-            db.session.commit()
+            if truncated:
+                # The next run resumes from this checkpoint and skips every contact written so far
+                capped = True
+                save_checkpoint()
+                self.logger.warning(f"Stopped after LDAP_MAX_ENTRIES ({self.max_entries}) entries; the next sync "
+                                    f"continues from here and reconciles removed contacts once it completes")
+
+            # Only a full sync sees every entry, so only it can tell what was removed
+            report('reconciling')
+            with self._timed('reconcile'):
+                if full and not truncated:
+                    writer.deactivate_missing()
+                    # A resumed run did not search the partitions finished before the interruption
+                    if not checkpoint:
+                        mirror.prune()
+                purged = self._purge_removed_contacts()
+            report(deactivated=writer.deactivated, purged=purged)
+
+            # Advance the high-water mark only after every change has been committed
+            new_mark = high_water_mark if truncated else context_csn or latest_change or high_water_mark
+            if new_mark:
+                Settings.set_value(self.HIGH_WATER_MARK_KEY, new_mark,
+                                   'High-water mark (GeneralizedTime) of the last LDAP sync')
+            if full and not truncated:
+                Settings.set_value(self.LAST_FULL_SYNC_KEY, current_time.isoformat(),
+                                   'Time of the last full LDAP sync (UTC)')
+                self._update_mirror_state()
+            if not truncated:
+                Settings.set_value(self.CHECKPOINT_KEY, '')
 
             # Create notification for sync results
+            conflicts = writer.conflicts
             notification = Notification(
                 title="LDAP Sync Complete",
-                message=f"Sync completed: {added_contacts} contacts added, {updated_contacts} updated{', ' + str(len(conflicts)) + ' conflicts found' if conflicts else ''}",
+                message=f"{mode.title()} sync completed: {writer.added} contacts added, {writer.updated} updated, {writer.unchanged} unchanged"
+                        f"{', ' + str(writer.deactivated) + ' removed from LDAP' if writer.deactivated else ''}"
+                        f"{', ' + str(purged) + ' purged after retention' if purged else ''}"
+                        f"{', ' + str(len(conflicts)) + ' conflicts found' if conflicts else ''}"
+                        f"{'; stopped at the ' + str(self.max_entries) + ' entry limit, the next sync continues from here' if truncated else ''}"
+                        f"{'; resumed an earlier run (' + str(applied) + ' entries already applied)' if checkpoint else ''}",
                 unread=True
             )
             db.session.add(notification)
+            self._record_run(mode, 'completed', writer, skipped)
             db.session.commit()
 
-            self.logger.info(f"Sync completed successfully. Total entries: {total_entries}, Added: {added_contacts}, Updated: {updated_contacts}")
+            self.logger.info(f"{mode.title()} sync completed successfully. Total entries: {writer.processed}, Added: {writer.added}, Updated: {writer.updated}, Unchanged: {writer.unchanged}")
             return conflicts
-            
+        
         except Exception as e:
             self.logger.error(f"Sync failed: {str(e)}")
             db.session.rollback()
-            
+        
             # Create error notification
             notification = Notification(
                 title="LDAP Sync Failed",
-                message=f"Error during sync: {str(e)}",
+                message=f"Error during sync: {str(e)}"
+                        f"{'. The next sync resumes after the ' + str(writer.batches) + ' committed batch(es)' if writer.batches and self.resume_window else ''}",
                 unread=True
             )
             db.session.add(notification)
+            self._record_run(mode, 'failed', writer, skipped, error=str(e))
             db.session.commit()
-            
+        
             raise
         finally:
-            conn.unbind()
-            self.logger.info("LDAP connection closed")
+            self.metrics = None
+
+    def resync(self, search_base=None, extra_filter=None, uids=None, progress=None):
+        """Refresh the contacts of part of the directory through the sync pipeline
+
+        The entries under search_base (which must lie within the base DN),
+        matching extra_filter (for example "eduPersonAffiliation=staff") and/or
+        with one of the given uids are matched and written exactly like a sync
+        does, conflicts included. A targeted run never deactivates contacts,
+        advances the incremental high-water mark or touches a checkpoint, so
+        removals are left to the next full sync. Returns the conflicts found.
+        """
+        search_base, filters, scope = self.targeted_searches(search_base, extra_filter, uids)
+        requested = {uid.strip() for uid in uids or [] if uid and uid.strip()}
+        found = set()
+        self.logger.info(f"Starting targeted LDAP sync of {scope}: {len(filters)} search(es)")
+        mirror = DirectoryMirror(self.USER_SEARCH_ATTRIBUTES)
+        self.metrics = SyncMetrics()
+        writer = ContactSyncWriter(
+            batch_size=self.batch_size,
+            on_batch=self._queue_enrichment,
+            timed=self._timed,
+            on_commit=mirror.flush
+        )
+        skipped = 0
+
+        def report(phase=None, **extra):
+            if progress:
+                progress(phase=phase, processed=writer.processed + skipped, added=writer.added,
+                         updated=writer.updated, unchanged=writer.unchanged,
+                         conflicts=len(writer.conflicts), **extra)
 
-    def import_single_contact(self, dn, force=False):
-        """Import a single contact by DN. Set force=True to override existing data"""
-        conn = self.connect()
+        try:
+            report('indexing', mode='targeted')
+            with self._timed('index'):
+                writer.load_index()
+                mirror.load_index()
+
+            workers = ldap_pool.sync_workers(min(self.sync_workers, len(filters)))
+            pages = self._prefetch_pages(
+                [self._partition_pages(search_base, SUBTREE, partition_filter) for partition_filter in filters],
+                workers
+            )
+            report('fetching', total=len(requested) or None)
+            with closing(pages):
+                for page in pages:
+                    with self._timed('match'):
+                        for dn, entry_data in page:
+                            mirror.add(dn, entry_data)
+                            fields = self._contact_fields(entry_data)
+                            if not fields['uid']:
+                                self.logger.warning(f"Skipping entry without UID: {dn}")
+                                skipped += 1
+                                continue
+                            found.add(fields['uid'])
+                            writer.process(dn, fields)
+                    report()
+
+            writer.flush()
+            mirror.flush()
+
+            conflicts = writer.conflicts
+            not_found = len(requested - found)
+            db.session.add(Notification(
+                title="LDAP Sync Complete",
+                message=f"Targeted sync of {scope} completed: "
+                        f"{writer.added} contacts added, {writer.updated} updated, {writer.unchanged} unchanged"
+                        f"{', ' + str(len(conflicts)) + ' conflicts found' if conflicts else ''}"
+                        f"{', ' + str(not_found) + ' uid(s) not found' if not_found else ''}",
+                unread=True
+            ))
+            self._record_run('targeted', 'completed', writer, skipped)
+            db.session.commit()
+
+            self.logger.info(f"Targeted sync completed. Total entries: {writer.processed}, Added: {writer.added}, "
+                             f"Updated: {writer.updated}, Unchanged: {writer.unchanged}")
+            return conflicts
+
+        except Exception as e:
+            self.logger.error(f"Targeted sync failed: {str(e)}")
+            db.session.rollback()
+            db.session.add(Notification(
+                title="LDAP Sync Failed",
+                message=f"Error during targeted sync of {scope}: {str(e)}",
+                unread=True
+            ))
+            self._record_run('targeted', 'failed', writer, skipped, error=str(e))
+            db.session.commit()
+            raise
+        finally:
+            self.metrics = None
+
+    def targeted_searches(self, search_base=None, extra_filter=None, uids=None):
+        """Validate the scope of a targeted sync and build its searches
+
+        Returns (search_base, filters, description); raises ValueError for a
+        search base outside the base DN, a malformed filter, more than
+        BULK_IMPORT_LIMIT uids or an empty scope.
+        """
+        base_dn = self.base_dn
+        if search_base and search_base.strip():
+            search_base = search_base.strip()
+            base_key = self._dn_key(base_dn)
+            if self._dn_key(search_base) != base_key and not self._dn_key(search_base).endswith(',' + base_key):
+                raise ValueError(f"Search base '{search_base}' is not within the base DN '{base_dn}'")
+        else:
+            search_base = base_dn
+
+        search_filter = self.search_filter
+        extra_filter = (extra_filter or '').strip()
+        if extra_filter:
+            if not extra_filter.startswith('('):
+                extra_filter = f"({extra_filter})"
+            search_filter = f"(&{search_filter}{extra_filter})"
+            try:
+                # Compile the filter here so a malformed one is rejected before a job is queued
+                parse_filter(search_filter, None, auto_escape=False, auto_encode=False,
+                             validator=None, check_names=False)
+            except LDAPInvalidFilterError as e:
+                raise ValueError(f"Invalid LDAP filter '{extra_filter}': {str(e)}")
+
+        uids = list(dict.fromkeys(uid.strip() for uid in uids or [] if uid and uid.strip()))
+        if len(uids) > self.BULK_IMPORT_LIMIT:
+            raise ValueError(f"At most {self.BULK_IMPORT_LIMIT} uids per targeted sync")
+        if not uids and search_base == base_dn and not extra_filter:
+            raise ValueError("A targeted sync needs a search base, a filter or a list of uids")
+
+        # One search per chunk of uids, fetched like the partitions of a sync
+        filters = []
+        for start in range(0, len(uids), self.IMPORT_FILTER_CHUNK):
+            terms = ''.join(f"(uid={escape_filter_chars(uid)})" for uid in uids[start:start + self.IMPORT_FILTER_CHUNK])
+            filters.append(f"(&{search_filter}(|{terms}))")
+
+        description = search_base
+        if extra_filter:
+            description += f" {extra_filter}"
+        if uids:
+            description += f" ({len(uids)} uid(s))"
+        return search_base, filters or [search_filter], description
+
+    def _mirror_state(self):
+        """State of the directory_entry mirror if it was filled from the current directory settings"""
+        try:
+            state = json.loads(Settings.get_value(self.MIRROR_STATE_KEY) or 'null')
+        except ValueError:
+            return None
+        if not state or state.get('fingerprint') != self.fingerprint:
+            return None
+        return state
+
+    def _update_mirror_state(self):
+        """Record a complete full sync into the mirror, which makes it usable for search
+
+        Incremental, capped and targeted runs write their entries to the mirror
+        too, but only a complete run advances refreshed_at, so it tells how
+        stale the copy may be.
+        """
+        state = {'fingerprint': self.fingerprint, 'includes_students': not self.exclude_students,
+                 'refreshed_at': datetime.utcnow().isoformat()}
+        Settings.set_value(self.MIRROR_STATE_KEY, json.dumps(state),
+                           'Directory settings and time of the last sync into the local directory mirror')
+
+    def _load_checkpoint(self, mode, search_filter):
+        """Return the checkpoint of an interrupted or capped run this sync can resume, or None"""
+        raw = Settings.get_value(self.CHECKPOINT_KEY)
+        if not raw:
+            return None
+        try:
+            checkpoint = json.loads(raw)
+            saved_at = datetime.fromisoformat(checkpoint['saved_at'])
+        except (ValueError, KeyError, TypeError):
+            self.logger.warning("Ignoring unreadable sync checkpoint")
+            return None
+        # A run stopped by max_entries is always continued, otherwise the sync could never complete
+        if not (checkpoint.get('capped') and self.max_entries):
+            if not self.resume_window:
+                return None
+            if datetime.utcnow() - saved_at > timedelta(hours=self.resume_window):
+                self.logger.info(f"Not resuming the interrupted sync: checkpoint is older than {self.resume_window} hours")
+                return None
+
+        if (checkpoint.get('fingerprint'), checkpoint.get('mode'), checkpoint.get('search_filter'),
+                checkpoint.get('partitioning')) != (self.fingerprint, mode, search_filter, self.partitioning):
+            self.logger.info("Not resuming the interrupted sync: settings or sync mode changed")
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, state):
+        """Persist the progress of the running sync in its own transaction"""
+        state['saved_at'] = datetime.utcnow().isoformat()
+        Settings.set_value(self.CHECKPOINT_KEY, json.dumps(state),
+                           'Progress of the running or last interrupted LDAP sync')
+        db.session.commit()
+
+    def _record_run(self, mode, status, writer, skipped, error=None):
+        """Add a SyncRun row with this run's timings; committed by the caller"""
+        metrics = self.metrics
+        duration = metrics.elapsed
+        entries = writer.processed + skipped
+        db.session.add(SyncRun(
+            started_at=metrics.started_at,
+            finished_at=datetime.utcnow(),
+            mode=mode,
+            status=status,
+            error=error,
+            entries=entries,
+            pages=metrics.pages,
+            bytes=metrics.bytes,
+            duration=round(duration, 3),
+            entries_per_second=round(entries / duration, 1) if duration > 0 else None,
+            peak_rss_kb=metrics.peak_rss_kb,
+            added=writer.added,
+            updated=writer.updated,
+            unchanged=writer.unchanged,
+            conflicts=len(writer.conflicts),
+            deactivated=writer.deactivated,
+            phase_timings=json.dumps({name: round(seconds, 3) for name, seconds in metrics.timings.items()}),
+            page_fetch_ms=json.dumps(metrics.page_fetch_ms)
+        ))
+        # Keep only the most recent runs
+        cutoff = db.session.query(SyncRun.id).order_by(SyncRun.id.desc()).offset(self.SYNC_RUN_HISTORY).first()
+        if cutoff:
+            SyncRun.query.filter(SyncRun.id <= cutoff[0]).delete(synchronize_session=False)
+
+    def _purge_removed_contacts(self):
+        """Delete LDAP contacts deactivated longer ago than the retention period, in batches
+
+        Only contacts the sync deactivated because they left LDAP are purged;
+        contacts deleted by hand are kept with their history.
+        """
+        if self.retention_period <= 0:
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_period)
+        purged = 0
+        while True:
+            contact_ids = [contact_id for contact_id, in db.session.query(Contact.id).filter(
+                Contact.source == 'ldap',
+                Contact.is_active == False,
+                Contact.deactivated_by == ContactSyncWriter.DEACTIVATED_BY,
+                Contact.deactivated_at < cutoff
+            ).limit(ContactSyncWriter.BULK_CHUNK_SIZE)]
+            if not contact_ids:
+                break
+            try:
+                Contact.query.filter(Contact.conflict_with.in_(contact_ids)).update(
+                    {Contact.conflict_with: None}, synchronize_session=False
+                )
+                History.query.filter(History.contact_id.in_(contact_ids)).delete(synchronize_session=False)
+                Contact.query.filter(Contact.id.in_(contact_ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            purged += len(contact_ids)
+
+        if purged:
+            self.logger.info(f"Purged {purged} contacts removed from LDAP more than {self.retention_period} days ago")
+        return purged
+
+    def _full_sync_due(self):
+        """Return True when the next run must reconcile the whole directory"""
+        if not self.incremental_sync:
+            return True
+        if not Settings.get_value(self.HIGH_WATER_MARK_KEY):
+            return True
+
+        last_full = Settings.get_value(self.LAST_FULL_SYNC_KEY)
+        if not last_full:
+            return True
+        try:
+            last_full = datetime.fromisoformat(last_full)
+        except ValueError:
+            return True
+        return datetime.utcnow() - last_full >= timedelta(hours=self.full_sync_interval)
+
+    def _read_context_csn(self, conn, base_dn):
+        """Return the newest contextCSN timestamp of the base entry, if the directory publishes one"""
         try:
             result = conn.search(
-                search_base=dn,
+                search_base=base_dn,
                 search_filter='(objectClass=*)',
                 search_scope='BASE',
-                attributes=['uid', 'cn', 'sn', 'givenName', 'mail', 
-                           'telephoneNumber', 'ou', 'eduPersonAffiliation']
+                attributes=['contextCSN']
             )
+            if not result or not conn.entries:
+                return None
+            # A CSN looks like 20240101120000.123456Z#000000#000#000000
+            csns = conn.entries[0].entry_attributes_as_dict.get('contextCSN', [])
+            stamps = [str(csn)[:14] + 'Z' for csn in csns if str(csn)[:14].isdigit()]
+            return max(stamps) if stamps else None
+        except Exception as e:
+            self.logger.debug(f"contextCSN not available: {str(e)}")
+            return None
+
+    def _generalized_time(self, value_list):
+        """Normalize a modifyTimestamp value to a comparable GeneralizedTime string"""
+        if not value_list:
+            return None
+        value = value_list[0]
+        if isinstance(value, datetime):
+            if value.tzinfo:
+                value = value.astimezone(timezone.utc)
+            return value.strftime('%Y%m%d%H%M%SZ')
+        value = str(value)
+        return value[:14] + 'Z' if value[:14].isdigit() else None
+
+    def _sync_partitions(self, conn, base_dn, search_filter):
+        """Split the sync search into independent (search_base, scope, filter) partitions
+
+        'ou' searches every first-level container under the base DN as its own
+        subtree, plus the matching entries directly below the base DN. People
+        are never containers, even those the sync filter leaves out (students
+        when they are excluded), and the listing is paged like the sync search
+        so a flat base DN does not hit the size limit. 'uid' adds
+        one uid prefix per character of UID_PARTITION_PREFIXES and a remainder
+        partition for every other uid. Without partitioning the whole subtree is
+        a single partition.
+        """
+        if self.partitioning == 'ou':
+            containers = []
+            for page in self._iter_pages(conn, base_dn, self.CONTAINER_FILTER, ['1.1'], LEVEL):
+                # Guard against servers that include the base entry in one-level results
+                containers.extend(dn for dn, _ in page if self._dn_key(dn) != self._dn_key(base_dn))
+            if containers:
+                partitions = [(dn, SUBTREE, search_filter) for dn in containers]
+                partitions.append((base_dn, LEVEL, search_filter))
+                return partitions
+            self.logger.info("No first-level containers under the base DN, syncing as a single partition")
+
+        elif self.partitioning == 'uid':
+            prefixes = [f"(uid={prefix}*)" for prefix in self.UID_PARTITION_PREFIXES]
+            partitions = [(base_dn, SUBTREE, f"(&{search_filter}{prefix})") for prefix in prefixes]
+            partitions.append((base_dn, SUBTREE, f"(&{search_filter}(!(|{''.join(prefixes)})))"))
+            return partitions
+
+        elif self.partitioning not in ('', 'none'):
+            self.logger.warning(f"Unknown sync partitioning '{self.partitioning}', syncing as a single partition")
+
+        return [(base_dn, SUBTREE, search_filter)]
+
+    def _partition_pages(self, search_base, scope, search_filter):
+        """Yield the pages of one partition using its own pooled connection"""
+        with self.connection() as conn:
+            yield from self._iter_pages(conn, search_base, search_filter, self.SYNC_ATTRIBUTES, scope)
+
+    def _iter_pages(self, conn, search_base, search_filter, attributes, scope=SUBTREE):
+        """Run a paged search and yield the entries of each page as it arrives
+
+        With adaptive paging the page size doubles after every page that came
+        back in under half the latency target and halves after one that took
+        longer than the target. It never grows past max_page_size or past the
+        size the server was seen to cap a page at.
+        """
+        cookie = None
+        total = 0
+        page_size = self.page_size
+        ceiling = self.max_page_size
+        while True:
+            started = time.perf_counter()
+            with self._timed('fetch'):
+                search_result = conn.search(
+                    search_base=search_base,
+                    search_filter=search_filter,
+                    search_scope=scope,
+                    attributes=attributes,
+                    paged_size=page_size or None,
+                    paged_cookie=cookie
+                )
+            latency = time.perf_counter() - started
+
+            if conn.result.get('result', 0) == self.SIZE_LIMIT_EXCEEDED:
+                if self.adaptive_paging and page_size > self.page_size:
+                    # The page outgrew the server's size limit; retry it at the last size that worked
+                    ceiling = max(page_size // 2, self.page_size)
+                    self.logger.info(f"Server size limit exceeded at page size {page_size}, "
+                                     f"retrying with {ceiling}")
+                    page_size = ceiling
+                    continue
+                # A partial result must not look like the whole directory to the reconcile step
+                raise Exception(f"LDAP search under {search_base} exceeded the server's size limit; "
+                                f"lower LDAP_PAGE_SIZE or split the sync with LDAP_SYNC_PARTITIONING")
+
+            if not search_result:
+                if conn.result.get('result', 0) != 0:
+                    # A failed search must not look like an empty directory to the reconcile step
+                    raise Exception(f"LDAP search under {search_base} failed: {conn.result.get('description', 'Unknown error')}")
+                self.logger.info(f"LDAP search under {search_base} returned no results")
+                return
+
+            page, size = self._decode_entries(conn.response, attributes)
+            if self.metrics:
+                self.metrics.record_page(latency, size)
+            total += len(page)
+            self.logger.info(f"Retrieved {len(page)} entries in {latency * 1000:.0f} ms "
+                             f"(page size {page_size or 'unpaged'}) from {search_base}, total so far: {total}")
+            yield page
+
+            cookie = conn.result.get('controls', {}).get(self.PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+            if not cookie:
+                # No more pages
+                return
+
+            if self.adaptive_paging and page_size:
+                if len(page) < page_size:
+                    # More pages follow, so the server caps pages at this size
+                    ceiling = min(ceiling, max(len(page), self.page_size))
+                if latency > self.page_latency_target:
+                    page_size = max(page_size // 2, self.page_size)
+                elif latency * 2 <= self.page_latency_target:
+                    page_size = min(page_size * 2, ceiling)
+                page_size = min(page_size, ceiling)
+
+    def _decode_entries(self, response, attributes):
+        """Decode the entries of a raw search response into (dn, attributes) pairs
+
+        Values are read from the raw bytes as UTF-8 strings and keyed by the
+        requested attribute name whatever case the server used, which is all the
+        sync needs and skips building an ldap3 Entry for every result. Returns
+        the entries and the approximate payload size in bytes (DNs plus values).
+        """
+        names = {name.lower(): name for name in attributes}
+        entries = []
+        size = 0
+        for item in response or []:
+            if item.get('type') != 'searchResEntry':
+                continue
+            dn = item['dn']
+            size += len(dn)
+            entry_data = {}
+            for name, values in item['raw_attributes'].items():
+                size += sum(len(value) for value in values)
+                entry_data[names.get(name.lower(), name)] = [
+                    value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+                    for value in values
+                ]
+            entries.append((dn, entry_data))
+        return entries, size
+
+    def _prefetch_pages(self, sources, workers=1, on_done=None):
+        """Consume page generators on fetch threads, handing pages over through a bounded queue
+
+        Up to `workers` sources are read concurrently and their pages are merged
+        into one stream for the caller. At most PREFETCH_PAGES pages per worker
+        wait for the caller, so LDAP round trips overlap with database work
+        without buffering the whole directory. on_done(index) is called on the
+        caller's thread once every page of sources[index] has been handed over.
+        """
+        workers = max(workers, 1)
+        pending = queue.Queue(maxsize=self.PREFETCH_PAGES * workers)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch(index, pages):
+            with closing(pages):
+                if stop.is_set():
+                    return
+                try:
+                    for page in pages:
+                        if not put(page):
+                            return
+                except Exception as e:
+                    put(e)
+                else:
+                    put((done, index))
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ldap-sync-fetch')
+        for index, pages in enumerate(sources):
+            executor.submit(fetch, index, pages)
+        try:
+            remaining = len(sources)
+            while remaining:
+                with self._timed('fetch_wait'):
+                    item = pending.get()
+                if isinstance(item, tuple) and item[0] is done:
+                    remaining -= 1
+                    if on_done:
+                        on_done(item[1])
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Release the fetch threads if the consumer stopped early
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for pages in sources:
+                pages.close()
+
+    def import_single_contact(self, dn, force=False):
+        """Import a single contact by DN. Set force=True to override existing data"""
+        with self.connection() as conn:
+            try:
+                result = conn.search(
+                    search_base=dn,
+                    search_filter='(objectClass=*)',
+                    search_scope='BASE',
+                    attributes=['uid', 'cn', 'sn', 'givenName', 'mail', 
+                               'telephoneNumber', 'ou', 'eduPersonAffiliation']
+                )
             
-            if not result or len(conn.entries) == 0:
-                raise Exception("Contact not found")
+                if not result or len(conn.entries) == 0:
+                    raise Exception("Contact not found")
                 
-            entry = conn.entries[0]
-            entry_data = entry.entry_attributes_as_dict
-            uid = self._get_list_value(entry_data.get('uid', []))
+                entry = conn.entries[0]
+                entry_data = entry.entry_attributes_as_dict
+                uid = self._get_list_value(entry_data.get('uid', []))
             
-            # Check for existing contact with this UID
-            existing_contact = Contact.query.filter_by(uid=uid).first()
+                # Check for existing contact with this UID
+                existing_contact = Contact.query.filter_by(uid=uid).first()
             
-            if existing_contact and not force:
-                if existing_contact.source == 'manual':
-                    # Raise our custom conflict exception
-                    raise self.UIDConflict(uid, existing_contact.id)
+                if existing_contact and not force:
+                    if existing_contact.source == 'manual':
+                        # Raise our custom conflict exception
+                        raise self.UIDConflict(uid, existing_contact.id)
+            
+                # Rest of the import logic remains the same
+                if not existing_contact:
+                    contact = Contact(ldap_dn=dn)
+                    db.session.add(contact)
+                else:
+                    contact = existing_contact
+            
+                # Update contact attributes
+                fields = self._contact_fields(entry_data)
+                for name, value in fields.items():
+                    setattr(contact, name, value)
+                contact.ldap_hash = ContactSyncWriter.digest(fields)
+                contact.last_sync = datetime.utcnow()
+                contact.is_active = True
+                contact.deactivated_at = None
+                contact.deactivated_by = None
+                contact.source = 'ldap'  # Mark as LDAP source
             
-            # Rest of the import logic remains the same
-            if not existing_contact:
+                db.session.commit()
+
+                # CUCM data is filled in by the background enrichment queue
+                enrichment_queue.enqueue([contact.id])
+                return True
+            
+            except self.UIDConflict:
+                # Re-raise UIDConflict to be handled by the caller
+                raise
+            except Exception as e:
+                db.session.rollback()
+                raise e
+
+    def import_contacts(self, dns=None, uids=None, force=False):
+        """Import many contacts by DN and/or UID
+
+        Entries are fetched with one OR-filter search per IMPORT_FILTER_CHUNK
+        items, existing contacts are matched with one query per chunk of UIDs,
+        and contacts are committed in batches of batch_size. A UID that belongs
+        to a manual contact is reported as a conflict (unless force=True)
+        instead of being raised, and so is an entry whose UID and DN belong to
+        two different contacts. DNs are compared in normalized form (see
+        _dn_key). Returns one result per requested item, in order.
+        """
+        items = [('dn', dn.strip()) for dn in dns or [] if dn and dn.strip()]
+        items += [('uid', uid.strip()) for uid in uids or [] if uid and uid.strip()]
+        items = list(dict.fromkeys(items))
+
+        terms = []
+        for kind, value in items:
+            if kind == 'uid':
+                terms.append(f"(uid={escape_filter_chars(value)})")
+                continue
+            try:
+                # Entries cannot be filtered by DN portably, so match on the RDN and compare DNs after
+                attribute, rdn_value, _ = parse_dn(self._normalize_dn(value))[0]
+                terms.append(f"({attribute}={escape_filter_chars(rdn_value)})")
+            except Exception:
+                self.logger.warning(f"Skipping malformed DN: {value}")
+
+        entries_by_dn = {}
+        entries_by_uid = {}
+        terms = list(dict.fromkeys(terms))
+        with self.connection() as conn:
+            for start in range(0, len(terms), self.IMPORT_FILTER_CHUNK):
+                chunk = terms[start:start + self.IMPORT_FILTER_CHUNK]
+                search_filter = f"(&{self.search_filter}(|{''.join(chunk)}))"
+                for page in self._iter_pages(conn, self.base_dn, search_filter, self.SYNC_ATTRIBUTES):
+                    for dn, entry_data in page:
+                        fields = self._contact_fields(entry_data)
+                        entries_by_dn[self._dn_key(dn)] = (dn, fields)
+                        if fields['uid']:
+                            entries_by_uid[fields['uid']] = (dn, fields)
+
+        # Resolve every item to an entry, then look up the contacts they touch
+        found = {}
+        for kind, value in items:
+            entry = entries_by_dn.get(self._dn_key(value)) if kind == 'dn' else entries_by_uid.get(value)
+            if entry and entry[1]['uid']:
+                found[(kind, value)] = entry
+
+        found_uids = list({fields['uid'] for _, fields in found.values()})
+        # Stored DNs are normally the form LDAP returns, but may be the form an earlier import was given
+        found_dns = list({dn for dn, _ in found.values()} | {value for kind, value in found if kind == 'dn'})
+        contacts_by_uid = {}
+        contacts_by_dn = {}
+        for start in range(0, max(len(found_uids), len(found_dns)), ContactSyncWriter.BULK_CHUNK_SIZE):
+            uid_chunk = found_uids[start:start + ContactSyncWriter.BULK_CHUNK_SIZE]
+            dn_chunk = found_dns[start:start + ContactSyncWriter.BULK_CHUNK_SIZE]
+            for contact in Contact.query.filter(db.or_(Contact.uid.in_(uid_chunk), Contact.ldap_dn.in_(dn_chunk))):
+                if contact.uid:
+                    contacts_by_uid[contact.uid] = contact
+                if contact.ldap_dn:
+                    contacts_by_dn[self._dn_key(contact.ldap_dn)] = contact
+
+        results = []
+        batch = []
+        written = set()
+        now = datetime.utcnow()
+        for kind, value in items:
+            result = {kind: value}
+            results.append(result)
+            entry = found.get((kind, value))
+            if entry is None:
+                result.update(status='not_found', error='Contact not found in LDAP')
+                continue
+
+            dn, fields = entry
+            uid = fields['uid']
+            result.update(dn=dn, uid=uid)
+            by_uid = contacts_by_uid.get(uid)
+            by_dn = contacts_by_dn.get(self._dn_key(dn))
+            if by_uid is not None and by_dn is not None and by_uid is not by_dn:
+                # Writing either would break the unique uid or ldap_dn of the other
+                result.update(status='conflict', contact_id=by_uid.id,
+                              error=f"UID {uid} belongs to another contact than the one with DN {dn}")
+                continue
+            contact = by_uid or by_dn
+            if contact is not None and contact.uid == uid and contact.source == 'manual' and not force:
+                result.update(status='conflict', contact_id=contact.id,
+                              error=f"Contact with UID {uid} already exists")
+                continue
+
+            if contact is None:
                 contact = Contact(ldap_dn=dn)
                 db.session.add(contact)
+                result['status'] = 'imported'
+            elif id(contact) in written:
+                # Requested twice, e.g. by DN and by UID
+                result['status'] = 'duplicate'
             else:
-                contact = existing_contact
-            
-            # Update contact attributes
-            contact.uid = uid
-            contact.first_name = self._get_list_value(entry_data.get('givenName', []))
-            contact.last_name = self._get_list_value(entry_data.get('sn', []))
-            contact.email = self._get_list_value(entry_data.get('mail', []))
-            contact.phone = self._get_list_value(entry_data.get('telephoneNumber', []))
-            contact.department = self._get_list_value(entry_data.get('ou', []))
-            contact.title = self._get_list_value(entry_data.get('eduPersonAffiliation', []))
-            contact.last_sync = datetime.utcnow()
+                result['status'] = 'updated'
+            written.add(id(contact))
+
+            # Index the contact under the uid and DN it is about to get instead of its old ones
+            if contact.uid and contacts_by_uid.get(contact.uid) is contact:
+                del contacts_by_uid[contact.uid]
+            if contact.ldap_dn and contacts_by_dn.get(self._dn_key(contact.ldap_dn)) is contact:
+                del contacts_by_dn[self._dn_key(contact.ldap_dn)]
+            contacts_by_uid[uid] = contacts_by_dn[self._dn_key(dn)] = contact
+
+            for name, field_value in fields.items():
+                setattr(contact, name, field_value)
+            contact.ldap_dn = dn
+            contact.ldap_hash = ContactSyncWriter.digest(fields)
+            contact.last_sync = now
             contact.is_active = True
-            contact.source = 'ldap'  # Mark as LDAP source
-            
-            # NEW: Try to enrich contact with CUCM data
-            self._enrich_with_cucm_data(contact)
-            
+            contact.deactivated_at = None
+            contact.deactivated_by = None
+            contact.source = 'ldap'
+            batch.append((contact, result))
+
+            if len(batch) >= self.batch_size:
+                self._commit_import_batch(batch)
+                batch = []
+        self._commit_import_batch(batch)
+
+        self.logger.info(f"Bulk import of {len(items)} items: " + ', '.join(
+            f"{status} {sum(1 for result in results if result['status'] == status)}"
+            for status in dict.fromkeys(result['status'] for result in results)))
+        return results
+
+    def _commit_import_batch(self, batch):
+        """Commit one batch of imported contacts; a failing batch marks its items as errors"""
+        if not batch:
+            return
+        try:
+            # Read the ids before committing, which would expire them
+            db.session.flush()
+            contact_ids = [contact.id for contact, _ in batch]
             db.session.commit()
-            return True
-            
-        except self.UIDConflict:
-            # Re-raise UIDConflict to be handled by the caller
-            raise
         except Exception as e:
             db.session.rollback()
-            raise e
-        finally:
-            conn.unbind()
+            self.logger.error(f"Bulk import batch failed: {str(e)}")
+            for _, result in batch:
+                result.update(status='error', error=str(e))
+            return
+
+        for contact_id, (_, result) in zip(contact_ids, batch):
+            result['contact_id'] = contact_id
+        # CUCM data is filled in by the background enrichment queue
+        enrichment_queue.enqueue(list(dict.fromkeys(contact_ids)))
 
     def merge_contact(self, contact, dn):
         """Update empty fields of an existing contact with LDAP data"""
-        conn = self.connect()
-        try:
+        with self.connection() as conn:
             result = conn.search(
                 search_base=dn,
                 search_filter='(objectClass=*)',
@@ -442,86 +1255,183 @@ class LDAPSync:
             
             contact.last_sync = datetime.utcnow()
             return True
-            
-        finally:
-            conn.unbind()
 
-    def search_user(self, search_term, exclude_students=None, exclude_alumni=None):
-        """Search for users in LDAP with flexible matching"""
-        conn = self.connect()
-        try:
-            # Build base search filter
-            base_search = f"(|(uid=*{search_term}*)" \
-                       f"(cn=*{search_term}*)" \
-                       f"(mail=*{search_term}*)" \
-                       f"(sn=*{search_term}*)" \
-                       f"(givenName=*{search_term}*)" \
-                       f")"
-            
-            # Add exclusion filters if requested
-            exclusions = []
-            if exclude_students:
-                exclusions.append("(!(eduPersonAffiliation=student))")
-            if exclude_alumni:
-                exclusions.append("(!(eduPersonAffiliation=alum))")
-            
-            # Combine filters
-            if exclusions:
-                search_filter = f"(&{base_search}{''.join(exclusions)})"
-            else:
-                search_filter = base_search
-            
-            self.logger.info(f"Searching with filter: {search_filter}")
-            
-            # Perform search with case-insensitive matching
-            # Update search to use paging for user searches too
-            entries_list = []
-            cookie = None
-            
-            while True:
-                result = conn.search(
+    def search_user(self, search_term, exclude_students=None, exclude_alumni=None, live=False):
+        """Search for users in LDAP with flexible matching
+
+        At most search_size_limit entries are returned; last_search_truncated
+        tells whether more matched. The local directory mirror answers first
+        (last_search_source is 'mirror') unless live=True or it has no match,
+        since people added to LDAP after the last sync are only in the live
+        directory. Live results are cached per (term, exclusions), and a longer
+        term is answered by filtering the complete cached result of one of its
+        prefixes, since every match of the longer term also matches the prefix.
+        """
+        term = (search_term or '').strip()
+        if len(term) < self.search_min_length:
+            raise ValueError(f"Search term must be at least {self.search_min_length} characters")
+
+        flags = (bool(exclude_students), bool(exclude_alumni))
+        needle = term.lower()
+        if self.search_mirror and not live:
+            result = self._search_mirror(needle, *flags)
+            if result is not None and result['records']:
+                self.last_search_source = 'mirror'
+                self.last_search_truncated = result['truncated']
+                return [dict(record['contact']) for record in result['records']]
+
+        self.last_search_source = 'directory'
+        result = user_search_cache.get((self.fingerprint, needle, flags))
+
+        if result is None:
+            for length in range(len(needle) - 1, self.search_min_length - 1, -1):
+                cached = user_search_cache.get((self.fingerprint, needle[:length], flags))
+                if cached is not None and not cached['truncated']:
+                    self.logger.debug(f"Answering '{term}' from the cached results for '{needle[:length]}'")
+                    result = {
+                        'records': [record for record in cached['records']
+                                    if any(needle in value for value in record['match'])],
+                        'truncated': False
+                    }
+                    user_search_cache.set((self.fingerprint, needle, flags), result)
+                    break
+
+        if result is None:
+            result = self._search_directory(term, *flags)
+            user_search_cache.set((self.fingerprint, needle, flags), result)
+
+        self.last_search_truncated = result['truncated']
+        return [dict(record['contact']) for record in result['records']]
+
+    def _search_mirror(self, needle, exclude_students, exclude_alumni):
+        """Search the directory_entry mirror; None when it cannot answer for these settings"""
+        state = self._mirror_state()
+        if state is None or (not exclude_students and not state.get('includes_students', True)):
+            return None
+        self.mirror_refreshed_at = state.get('refreshed_at')
+
+        query = DirectoryEntry.query.filter(DirectoryEntry.search_text.contains(needle, autoescape=True))
+        if exclude_students:
+            query = query.filter(db.not_(DirectoryEntry.affiliation.contains('|student|')))
+        if exclude_alumni:
+            query = query.filter(db.not_(DirectoryEntry.affiliation.contains('|alum|')))
+        rows = query.order_by(DirectoryEntry.cn).limit(self.search_size_limit + 1).all()
+
+        records = [{
+            'contact': {'dn': row.dn, 'name': row.cn, 'uid': row.uid, 'email': row.mail},
+            'match': row.search_text.split('\n'),
+        } for row in rows[:self.search_size_limit]]
+        self.logger.info(f"User search for '{needle}' returned {len(records)} entries from the local mirror")
+        return {'records': records, 'truncated': len(rows) > self.search_size_limit}
+
+    def _search_directory(self, term, exclude_students, exclude_alumni):
+        """Run one size-limited substring search and return cacheable records"""
+        escaped = escape_filter_chars(term)
+        base_search = f"(|{''.join(f'({attr}=*{escaped}*)' for attr in self.USER_SEARCH_ATTRIBUTES)})"
+
+        # Add exclusion filters if requested
+        exclusions = []
+        if exclude_students:
+            exclusions.append("(!(eduPersonAffiliation=student))")
+        if exclude_alumni:
+            exclusions.append("(!(eduPersonAffiliation=alum))")
+
+        # Combine filters
+        if exclusions:
+            search_filter = f"(&{base_search}{''.join(exclusions)})"
+        else:
+            search_filter = base_search
+
+        self.logger.info(f"Searching with filter: {search_filter}")
+
+        with self.connection() as conn:
+            try:
+                # One entry over the limit tells whether the result was cut short
+                conn.search(
                     search_base=self.base_dn,
                     search_filter=search_filter,
                     search_scope=SUBTREE,
-                    attributes=['uid', 'cn', 'sn', 'givenName', 'mail'],
-                    paged_size=self.page_size,
-                    paged_cookie=cookie
+                    attributes=self.USER_SEARCH_ATTRIBUTES,
+                    size_limit=self.search_size_limit + 1
                 )
-                
-                if not result:
-                    self.logger.warning(f"No results found in this page: {conn.result}")
-                    break
-                
-                entries_list.extend(conn.entries)
-                
-                cookie = conn.result.get('controls', {}).get('1.2.840.113556.1.4.319', {}).get('value', {}).get('cookie')
-                if not cookie:
-                    # No more pages
-                    break
-            
-            if len(entries_list) == 0:
-                self.logger.warning("No results found")
-                return []
-            
-            # Process and return results
-            contacts = []
-            for entry in entries_list:
-                contact = {
+                entries = conn.entries
+                # Read before the connection goes back to the pool, where another request may reuse it
+                size_limit_exceeded = conn.result.get('result') == self.SIZE_LIMIT_EXCEEDED
+            except Exception as e:
+                self.logger.error(f"LDAP search failed: {str(e)}")
+                raise
+
+        truncated = len(entries) > self.search_size_limit or size_limit_exceeded
+        records = []
+        for entry in entries[:self.search_size_limit]:
+            entry_data = entry.entry_attributes_as_dict
+            records.append({
+                'contact': {
                     'dn': entry.entry_dn,
-                    'name': entry.cn.value if hasattr(entry, 'cn') else '',
-                    'uid': entry.uid.value if hasattr(entry, 'uid') else '',
-                    'email': entry.mail.value if hasattr(entry, 'mail') else '',
-                }
-                contacts.append(contact)
-                self.logger.debug(f"Found contact: {contact}")
-            
-            return contacts
-            
-        except Exception as e:
-            self.logger.error(f"LDAP search failed: {str(e)}")
-            raise
-        finally:
-            conn.unbind()
+                    'name': self._get_list_value(entry_data.get('cn', [])),
+                    'uid': self._get_list_value(entry_data.get('uid', [])),
+                    'email': self._get_list_value(entry_data.get('mail', [])),
+                },
+                # Lowercased attribute values used to filter cached results
+                'match': [str(value).lower() for attr in self.USER_SEARCH_ATTRIBUTES
+                          for value in entry_data.get(attr, [])]
+            })
+
+        if not records:
+            self.logger.warning("No results found")
+        self.logger.info(f"User search for '{term}' returned {len(records)} entries"
+                         f"{' (truncated)' if truncated else ''}")
+        return {'records': records, 'truncated': truncated}
+
+    def _queue_enrichment(self, dns, unchanged_ids=()):
+        """Queue the committed contacts of a sync batch that still lack CUCM data
+
+        Written contacts are always queued. Unchanged ones are retries (their
+        PIN or phone may have been set up in CUCM since), which the queue
+        rate-limits per contact.
+        """
+        missing_data = db.or_(Contact.pin.is_(None), Contact.pin == '',
+                              Contact.mac_address.is_(None), Contact.mac_address == '',
+                              Contact.phone_model.is_(None), Contact.phone_model == '')
+        with self._timed('enrichment'):
+            contact_ids = []
+            retry_ids = []
+            for start in range(0, len(dns), ContactSyncWriter.BULK_CHUNK_SIZE):
+                chunk = dns[start:start + ContactSyncWriter.BULK_CHUNK_SIZE]
+                rows = db.session.query(Contact.id).filter(Contact.ldap_dn.in_(chunk), missing_data)
+                contact_ids.extend(contact_id for contact_id, in rows)
+            for start in range(0, len(unchanged_ids), ContactSyncWriter.BULK_CHUNK_SIZE):
+                chunk = unchanged_ids[start:start + ContactSyncWriter.BULK_CHUNK_SIZE]
+                rows = db.session.query(Contact.id).filter(Contact.id.in_(chunk), missing_data)
+                retry_ids.extend(contact_id for contact_id, in rows)
+            enrichment_queue.enqueue(contact_ids)
+            if retry_ids:
+                enrichment_queue.enqueue(retry_ids, retry=True)
+
+    def _contact_fields(self, entry_data):
+        """Map the LDAP attributes of an entry to Contact column values"""
+        return {
+            'uid': self._get_list_value(entry_data.get('uid', [])),
+            'first_name': self._get_list_value(entry_data.get('givenName', [])),
+            'last_name': self._get_list_value(entry_data.get('sn', [])),
+            'email': self._get_list_value(entry_data.get('mail', [])),
+            'phone': self._get_list_value(entry_data.get('telephoneNumber', [])),
+            'department': self._get_list_value(entry_data.get('ou', [])),
+            'title': self._get_list_value(entry_data.get('eduPersonAffiliation', [])),
+        }
+
+    @staticmethod
+    def _normalize_dn(dn):
+        """DN with the spacing around its separators removed; raises LDAPInvalidDnError if malformed"""
+        return safe_dn([component.strip() for component in to_dn(dn)])
+
+    @classmethod
+    def _dn_key(cls, dn):
+        """Comparison key for a DN: attribute types and values are case-insensitive and spacing is normalized"""
+        try:
+            return cls._normalize_dn(dn).lower()
+        except LDAPInvalidDnError:
+            return (dn or '').strip().lower()
 
     def _get_list_value(self, value_list):
         """Safely get first value from LDAP attribute list"""
@@ -539,45 +1449,3 @@ class LDAPSync:
         except (AttributeError, KeyError):
             self.logger.warning(f"Attribute {attr_name} not found for {entry.entry_dn}")
             return ''
-
-    def _enrich_with_cucm_data(self, contact):
-        """Enrich contact with data from CUCM"""
-        if not contact.uid:
-            return
-            
-        try:
-            # Initialize CUCM service
-            cucm = CUCMService()
-            
-            # 1. Try to fetch authorization code (PIN)
-            if not contact.pin:
-                self.logger.info(f"Fetching PIN for {contact.uid} from CUCM")
-                pin = cucm.fetchAuthCode(contact.uid)
-                if pin:
-                    self.logger.info(f"Found PIN for {contact.uid}")
-                    contact.pin = pin
-            
-            # 2. Try to find a phone assigned to this user using their UID
-            # This would require adding a method to CUCMService to search for phones by owner
-            if not contact.mac_address or not contact.phone_model:
-                self.logger.info(f"Searching for phone details for {contact.uid} in CUCM")
-                phone_details = cucm.find_phone_by_owner(contact.uid)
-                if phone_details:
-                    self.logger.info(f"Found phone for {contact.uid}: {phone_details.get('name', 'Unknown')}")
-                    
-                    # Update MAC address if found
-                    if 'mac' in phone_details and not contact.mac_address:
-                        mac = phone_details['mac']
-                        # Format MAC address with colons if needed
-                        if len(mac) == 12:
-                            mac = ':'.join([mac[i:i+2] for i in range(0, 12, 2)])
-                        contact.mac_address = mac
-                    
-                    # Update phone model if found
-                    if 'model' in phone_details and not contact.phone_model:
-                        contact.phone_model = phone_details['model']
-                    
-        except Exception as e:
-            self.logger.error(f"Error enriching contact with CUCM data: {str(e)}")
-            # Don't let CUCM errors prevent LDAP import
-            # We'll just continue without the additional data
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
+import json
 
 db = SQLAlchemy()
 
@@ -22,6 +23,9 @@ class Contact(db.Model):
     source = db.Column(db.String(20), default='manual')  # 'ldap' or 'manual'
     has_conflict = db.Column(db.Boolean, default=False)  # New field
     conflict_with = db.Column(db.Integer, db.ForeignKey('contact.id'), nullable=True)  # New field
+    ldap_hash = db.Column(db.String(64))  # Digest of the LDAP-sourced fields at the last sync
+    deactivated_at = db.Column(db.DateTime)  # When the contact was deleted or removed from LDAP
+    deactivated_by = db.Column(db.String(100))  # 'LDAP Sync' when removed from LDAP, else who deleted it
     
     history = db.relationship('History', backref='contact', lazy=True)
 
@@ -56,6 +60,19 @@ class Contact(db.Model):
             'title': self.title,
         }
 
+def upgrade_schema():
+    """Add columns introduced after a table was created, since create_all() only creates missing tables"""
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+    db.session.commit()
+
 class History(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contact_id = db.Column(db.Integer, db.ForeignKey('contact.id'), nullable=False)
@@ -85,6 +102,16 @@ class Settings(db.Model):
         except Exception:
             return default
 
+    @staticmethod
+    def set_value(key, value, description=None, type_='string', category='internal'):
+        """Create or update a setting value (the caller commits the session)"""
+        setting = Settings.query.filter_by(key=key).first()
+        if setting is None:
+            setting = Settings(key=key, description=description, type=type_, category=category)
+            db.session.add(setting)
+        setting.value = value
+        return setting
+
     @staticmethod
     def get_default_cucm_settings():
         return [
@@ -92,7 +119,17 @@ class Settings(db.Model):
             ('CUCM_USERNAME', '', 'CUCM AXL Username', 'string', 'cucm'),
             ('CUCM_PASSWORD', '', 'CUCM AXL Password', 'string', 'cucm'),
             ('CUCM_VERSION', '14.0.1', 'CUCM Version', 'string', 'cucm'),
-            ('CUCM_VERIFY_CERT', 'False', 'Verify SSL Certificate', 'boolean', 'cucm')
+            ('CUCM_VERIFY_CERT', 'False', 'Verify SSL Certificate', 'boolean', 'cucm'),
+            ('CUCM_ENRICH_WORKERS', '2', 'Background Enrichment Workers', 'integer', 'cucm'),
+            ('CUCM_ENRICH_BATCH_SIZE', '50', 'Contacts Enriched per Commit', 'integer', 'cucm'),
+            ('CUCM_ENRICH_RETRY_HOURS', '12', 'Retry Enrichment of Unchanged Contacts Missing CUCM Data After (hours)', 'integer', 'cucm'),
+            ('CUCM_PHONE_SNAPSHOT', 'True', 'Answer Phone Lookups from a Local Phone Inventory Snapshot', 'boolean', 'cucm'),
+            ('CUCM_PHONE_SNAPSHOT_INTERVAL', '60', 'Phone Inventory Snapshot Refresh Interval (minutes)', 'integer', 'cucm'),
+            ('CUCM_PHONE_SNAPSHOT_PAGE_SIZE', '1000', 'Phones per listPhone Page when Refreshing the Snapshot', 'integer', 'cucm'),
+            ('CUCM_FAC_REFRESH_INTERVAL', '60', 'Reload Preloaded Authorization Codes After (minutes)', 'integer', 'cucm'),
+            ('CUCM_SQL_ENRICHMENT', 'False', 'Read Phones and Authorization Codes with executeSQLQuery', 'boolean', 'cucm'),
+            ('CUCM_CACHE_TTL', '3600', 'Phone Lookup Cache TTL (seconds, 0 to disable)', 'integer', 'cucm'),
+            ('CUCM_SEARCH_LIMIT', '100', 'Max Results per Phone Search', 'integer', 'cucm')
         ]
 
     @staticmethod
@@ -116,9 +153,42 @@ class Settings(db.Model):
             ('LDAP_SYNC_ENABLED', 'False', 'Enable Automatic LDAP Sync', 'boolean', 'ldap'),
             ('LDAP_SYNC_INTERVAL', '60', 'LDAP Sync Interval (minutes)', 'integer', 'ldap'),
             ('LDAP_PAGE_SIZE', '100', 'LDAP Page Size', 'integer', 'ldap'),
-            ('LDAP_MAX_ENTRIES', '1000', 'Max LDAP Entries (0 for no limit)', 'integer', 'ldap'),
+            ('LDAP_MAX_ENTRIES', '0', 'Max LDAP Entries per Sync Run (0 for no limit)', 'integer', 'ldap'),
+            ('LDAP_ADAPTIVE_PAGING', 'False', 'Adaptive Page Size (grow pages while they stay under the latency target)', 'boolean', 'ldap'),
+            ('LDAP_PAGE_LATENCY_TARGET_MS', '1000', 'Adaptive Paging Latency Target per Page (ms)', 'integer', 'ldap'),
+            ('LDAP_MAX_PAGE_SIZE', '1000', 'Largest Adaptive Page Size (server size limit)', 'integer', 'ldap'),
+            ('LDAP_SEARCH_SIZE_LIMIT', '50', 'Max Results per User Search', 'integer', 'ldap'),
+            ('LDAP_SEARCH_MIN_LENGTH', '3', 'Min User Search Term Length', 'integer', 'ldap'),
+            ('LDAP_SEARCH_CACHE_TTL', '300', 'User Search Cache TTL (seconds, 0 to disable)', 'integer', 'ldap'),
+            ('LDAP_SEARCH_LOCAL_MIRROR', 'True', 'Answer User Search from the Local Directory Mirror', 'boolean', 'ldap'),
+            ('LDAP_POOL_SIZE', '4', 'Max Pooled LDAP Connections', 'integer', 'ldap'),
+            ('LDAP_POOL_IDLE_TIMEOUT', '300', 'Pooled LDAP Connection Idle Timeout (seconds)', 'integer', 'ldap'),
+            ('LDAP_SYNC_BATCH_SIZE', '500', 'Sync Write Batch Size (contacts per transaction)', 'integer', 'ldap'),
+            ('LDAP_SYNC_PARTITIONING', 'none', 'Sync Partitioning (none, ou or uid)', 'string', 'ldap'),
+            ('LDAP_SYNC_WORKERS', '1', 'Parallel Sync Workers (one pooled connection each)', 'integer', 'ldap'),
+            ('LDAP_INCREMENTAL_SYNC', 'False', 'Incremental Sync (only entries changed since the last sync)', 'boolean', 'ldap'),
+            ('RETENTION_PERIOD', '30', 'Days to Keep Contacts Removed from LDAP (0 to keep forever)', 'integer', 'ldap'),
+            ('LDAP_FULL_SYNC_INTERVAL', '24', 'Full Reconcile Interval for Incremental Sync (hours)', 'integer', 'ldap'),
+            ('LDAP_SYNC_RESUME_HOURS', '24', 'Resume an Interrupted Sync Within (hours, 0 to always restart)', 'integer', 'ldap'),
         ]
 
+# One-off changes to stored settings: (name, key, old value, new value)
+SETTING_UPGRADES = [
+    # Installs created before the limit was honored store 1000, which would now cap every sync
+    ('ldap-max-entries-unlimited', 'LDAP_MAX_ENTRIES', '1000', '0'),
+]
+
+def upgrade_settings():
+    """Apply the SETTING_UPGRADES not yet applied to this database; a value changed by the user is kept"""
+    applied = {name for name in (Settings.get_value('SETTINGS_UPGRADES') or '').split(',') if name}
+    for name, key, old_value, new_value in SETTING_UPGRADES:
+        if name in applied:
+            continue
+        Settings.query.filter_by(key=key, value=old_value).update({Settings.value: new_value})
+        applied.add(name)
+    Settings.set_value('SETTINGS_UPGRADES', ','.join(sorted(applied)), 'One-off settings upgrades already applied')
+    db.session.commit()
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -149,3 +219,84 @@ class Notification(db.Model):
             'time_ago': time_ago,
             'unread': self.unread
         }
+
+class SyncLock(db.Model):
+    """Cluster-wide lease that lets exactly one process run an LDAP sync"""
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(255))  # host:pid of the process running the sync
+    job_id = db.Column(db.String(32))
+    acquired_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    progress = db.Column(db.Text)  # JSON snapshot of the holder's job, kept after release
+
+class DirectoryEntry(db.Model):
+    """Copy of a directory person, kept by the LDAP sync so user search can be answered locally"""
+    id = db.Column(db.Integer, primary_key=True)
+    dn = db.Column(db.String(255), unique=True, nullable=False)
+    uid = db.Column(db.String(100), index=True)
+    cn = db.Column(db.String(255))
+    mail = db.Column(db.String(120), index=True)
+    affiliation = db.Column(db.String(255))  # every eduPersonAffiliation value, as |value|value|
+    search_text = db.Column(db.Text)  # lowercased values of the user search attributes
+    entry_hash = db.Column(db.String(64))  # digest of the mirrored values, to skip unchanged entries
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CUCMPhone(db.Model):
+    """Snapshot of one CUCM phone, refreshed by phone_inventory so lookups do not need AXL"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)  # device name, e.g. SEP001122334455
+    mac = db.Column(db.String(12), index=True)  # from SEP device names only
+    description = db.Column(db.String(255))
+    model = db.Column(db.String(100))
+    product = db.Column(db.String(100))
+    device_class = db.Column(db.String(50))
+    protocol = db.Column(db.String(50))
+    owner = db.Column(db.String(100), index=True)  # ownerUserName
+    entry_hash = db.Column(db.String(64))  # digest of the snapshot values, to skip unchanged phones
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SyncRun(db.Model):
+    """Timings and throughput of one LDAP sync run"""
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    mode = db.Column(db.String(20))  # full, incremental or targeted
+    status = db.Column(db.String(20))  # completed or failed
+    error = db.Column(db.Text)
+    entries = db.Column(db.Integer, default=0)
+    pages = db.Column(db.Integer, default=0)
+    bytes = db.Column(db.BigInteger, default=0)
+    duration = db.Column(db.Float)  # seconds
+    entries_per_second = db.Column(db.Float)
+    peak_rss_kb = db.Column(db.Integer)
+    added = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)
+    unchanged = db.Column(db.Integer, default=0)
+    conflicts = db.Column(db.Integer, default=0)
+    deactivated = db.Column(db.Integer, default=0)
+    phase_timings = db.Column(db.Text)  # JSON: phase -> seconds
+    page_fetch_ms = db.Column(db.Text)  # JSON list of per-page round trips
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'mode': self.mode,
+            'status': self.status,
+            'error': self.error,
+            'entries': self.entries,
+            'pages': self.pages,
+            'bytes': self.bytes,
+            'duration': self.duration,
+            'entries_per_second': self.entries_per_second,
+            'peak_rss_kb': self.peak_rss_kb,
+            'added': self.added,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'conflicts': self.conflicts,
+            'deactivated': self.deactivated,
+            'phase_timings': json.loads(self.phase_timings) if self.phase_timings else {},
+            'page_fetch_ms': json.loads(self.page_fetch_ms) if self.page_fetch_ms else [],
+        }
@@ -0,0 +1,238 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, CUCMPhone, Settings
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+class PhoneInventory:
+    """Local snapshot of the CUCM phone inventory with in-memory lookup indexes
+
+    refresh() reads every phone from the pages CUCMService pulls (listPhone or
+    executeSQLQuery) and writes only the phones whose values changed since the
+    last refresh, deleting the ones no longer in CUCM. Lookups by MAC, owner and description token are answered
+    from indexes built from the cucm_phone table, which are reloaded whenever
+    any process has refreshed the snapshot since they were built.
+    """
+    STATE_KEY = 'CUCM_PHONE_INVENTORY'
+    # Values kept per phone, as listPhone returnedTags
+    RETURNED_TAGS = {'name': '', 'description': '', 'model': '', 'product': '',
+                     'class': '', 'protocol': '', 'ownerUserName': ''}
+    # Seconds between checks of the shared snapshot state
+    RELOAD_CHECK_INTERVAL = 30
+    # Rows per DELETE ... IN (...) statement
+    BULK_CHUNK_SIZE = 500
+
+    def __init__(self):
+        self.logger = logging.getLogger('PhoneInventory')
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded_at = None  # refreshed_at of the snapshot the indexes were built from
+        self._checked = 0.0
+        self._by_mac = {}
+        self._by_owner = {}
+        self._by_token = {}
+
+    @staticmethod
+    def enabled():
+        return Settings.get_value('CUCM_PHONE_SNAPSHOT', 'True').lower() == 'true'
+
+    def state(self):
+        """Shared snapshot state ({refreshed_at, phones, ...}), or None before the first refresh"""
+        try:
+            return json.loads(Settings.get_value(self.STATE_KEY) or 'null')
+        except ValueError:
+            return None
+
+    def ready(self):
+        """True when lookups can be answered from the snapshot"""
+        if not self.enabled():
+            return False
+        self._ensure_loaded()
+        return self._loaded_at is not None
+
+    def is_fresh(self, interval_minutes):
+        """True when the loaded snapshot was refreshed within the interval, so a phone missing from it is not in CUCM"""
+        if not self.ready():
+            return False
+        try:
+            refreshed_at = datetime.fromisoformat(self._loaded_at)
+        except (TypeError, ValueError):
+            return False
+        return datetime.utcnow() - refreshed_at < timedelta(minutes=interval_minutes)
+
+    def find_by_mac(self, mac_address):
+        mac = re.sub(r'[^0-9A-Fa-f]', '', mac_address or '').upper()
+        with self._lock:
+            return self._by_mac.get(mac)
+
+    def find_by_owner(self, uid):
+        """First phone owned by uid, else the first one whose description mentions it"""
+        key = (uid or '').lower()
+        with self._lock:
+            phones = self._by_owner.get(key) or self._by_token.get(key) or []
+            return phones[0] if phones else None
+
+    def search(self, pattern='', limit=100):
+        """Phones whose device name contains pattern (the snapshot equivalent of listPhone name=%pattern%)"""
+        query = CUCMPhone.query.order_by(CUCMPhone.name)
+        if pattern:
+            query = query.filter(CUCMPhone.name.contains(pattern, autoescape=True))
+        return [self._record(phone) for phone in query.limit(limit)]
+
+    def refresh(self, pages):
+        """Apply the whole phone inventory to the snapshot
+
+        pages yields lists of phones, each a listPhone result or a dict with
+        the RETURNED_TAGS keys, and must cover every phone. Returns the counts
+        of the run, or None if another refresh in this process is already running.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            self.logger.info("Phone inventory refresh already running")
+            return None
+        try:
+            started = time.perf_counter()
+            hashes = dict(db.session.query(CUCMPhone.name, CUCMPhone.entry_hash))
+            seen = set()
+            rows = []
+            written = 0
+            for phones in pages:
+                for phone in phones:
+                    row = self._row(phone)
+                    if not row['name'] or row['name'] in seen:
+                        continue
+                    seen.add(row['name'])
+                    if hashes.get(row['name']) != row['entry_hash']:
+                        rows.append(row)
+                if len(rows) >= self.BULK_CHUNK_SIZE:
+                    written += self._upsert(rows)
+                    rows = []
+            written += self._upsert(rows)
+
+            # Every page was read, so anything not seen was removed from CUCM
+            missing = [name for name in hashes if name not in seen]
+            for start in range(0, len(missing), self.BULK_CHUNK_SIZE):
+                chunk = missing[start:start + self.BULK_CHUNK_SIZE]
+                CUCMPhone.query.filter(CUCMPhone.name.in_(chunk)).delete(synchronize_session=False)
+
+            counts = {'phones': len(seen), 'written': written, 'removed': len(missing),
+                      'seconds': round(time.perf_counter() - started, 1)}
+            Settings.set_value(self.STATE_KEY, json.dumps({'refreshed_at': datetime.utcnow().isoformat(), **counts}),
+                               'Time and counts of the last CUCM phone inventory refresh')
+            db.session.commit()
+            self.logger.info(f"Refreshed phone inventory: {counts['phones']} phones, {written} written, "
+                             f"{len(missing)} removed in {counts['seconds']} s")
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            self._refresh_lock.release()
+
+        self._checked = 0.0
+        self._ensure_loaded()
+        return counts
+
+    def refresh_due(self, interval_minutes):
+        """True when no process has refreshed the snapshot within the interval"""
+        state = self.state()
+        if not state:
+            return True
+        try:
+            refreshed_at = datetime.fromisoformat(state['refreshed_at'])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return datetime.utcnow() - refreshed_at >= timedelta(minutes=interval_minutes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded_at': self._loaded_at,
+                'phones': len(self._by_mac),
+                'owners': len(self._by_owner),
+            }
+
+    def _ensure_loaded(self):
+        """Rebuild the indexes if the shared snapshot changed since they were built"""
+        now = time.monotonic()
+        if now - self._checked < self.RELOAD_CHECK_INTERVAL:
+            return
+        self._checked = now
+        state = self.state()
+        refreshed_at = state.get('refreshed_at') if state else None
+        if refreshed_at == self._loaded_at:
+            return
+
+        by_mac, by_owner, by_token = {}, {}, {}
+        for phone in CUCMPhone.query.order_by(CUCMPhone.name):
+            record = self._record(phone)
+            if phone.mac:
+                by_mac[phone.mac] = record
+            if phone.owner:
+                by_owner.setdefault(phone.owner.lower(), []).append(record)
+            for token in set(re.split(r'[^\w.@-]+', (phone.description or '').lower())):
+                if token:
+                    by_token.setdefault(token, []).append(record)
+        with self._lock:
+            self._by_mac, self._by_owner, self._by_token = by_mac, by_owner, by_token
+            self._loaded_at = refreshed_at
+        self.logger.info(f"Loaded phone inventory snapshot from {refreshed_at}: {len(by_mac)} phones")
+
+    def _upsert(self, rows):
+        if not rows:
+            return 0
+        stmt = sqlite_insert(CUCMPhone.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CUCMPhone.__table__.c.name],
+            set_={name: stmt.excluded[name] for name in rows[0] if name != 'name'}
+        )
+        db.session.execute(stmt, rows)
+        # Committed per chunk so a long refresh does not hold the SQLite write lock throughout
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _text(phone, attr):
+        """String value of a listPhone field; foreign keys such as ownerUserName hold it in _value_1"""
+        try:
+            value = phone[attr]
+        except (KeyError, TypeError, AttributeError):
+            value = getattr(phone, attr, None)
+        if value is not None and not isinstance(value, str):
+            value = getattr(value, '_value_1', None) if not isinstance(value, dict) else value.get('_value_1')
+        return value or ''
+
+    def _row(self, phone):
+        name = self._text(phone, 'name')
+        values = {
+            'name': name,
+            'mac': name[3:].upper() if name.upper().startswith('SEP') else '',
+            'description': self._text(phone, 'description'),
+            'model': self._text(phone, 'model'),
+            'product': self._text(phone, 'product'),
+            'device_class': self._text(phone, 'class'),
+            'protocol': self._text(phone, 'protocol'),
+            'owner': self._text(phone, 'ownerUserName'),
+        }
+        payload = '\x1f'.join(values[key] for key in sorted(values))
+        values['entry_hash'] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        values['updated_at'] = datetime.utcnow()
+        return values
+
+    @staticmethod
+    def _record(phone):
+        return {
+            'name': phone.name,
+            'description': phone.description or '',
+            'model': phone.model or '',
+            'product': phone.product or '',
+            'class': phone.device_class or '',
+            'protocol': phone.protocol or '',
+            'owner': phone.owner or '',
+            'mac': phone.mac or '',
+        }
+
+# Shared by CUCMService lookups, the enrichment workers and the scheduler
+phone_inventory = PhoneInventory()
@@ -1435,8 +1435,8 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
-    // Load LDAP search
-    window.searchLDAP = function() {
+    // Load LDAP search; live skips the local directory mirror
+    window.searchLDAP = function(live = false) {
         const searchTerm = document.getElementById('ldapSearchTerm').value.trim();
         const excludeStudents = document.getElementById('ldapExcludeStudents').checked;
         const excludeAlumni = document.getElementById('ldapExcludeAlumni').checked;
@@ -1459,7 +1459,8 @@ document.addEventListener('DOMContentLoaded', function() {
             body: JSON.stringify({
                 search_term: searchTerm,
                 exclude_students: excludeStudents,
-                exclude_alumni: excludeAlumni
+                exclude_alumni: excludeAlumni,
+                live: live
             })
         })
         .then(response => response.json())
@@ -1498,6 +1499,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 `;
             });
             html += '</div>';
+            if (data.truncated) {
+                html += `<div class="no-results">Showing the first ${data.contacts.length} matches. Refine the search term to narrow the results.</div>`;
+            }
+            if (data.source === 'mirror') {
+                const synced = data.mirror_refreshed_at ? new Date(data.mirror_refreshed_at + 'Z').toLocaleString() : 'the last sync';
+                html += `<div class="no-results">Results from the local directory copy (synced ${synced}). ` +
+                        `<a href="#" onclick="searchLDAP(true); return false;">Search the live directory</a> for people added since.</div>`;
+            }
             resultsDiv.innerHTML = html;
         })
         .catch(error => {
@@ -1546,75 +1555,50 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         const items = document.querySelectorAll('.ldap-contact-item');
-        const total = items.length;
-        let current = 0;
-        let success = 0;
-        let conflicts = 0;
-        let errors = 0;
+        const dns = Array.from(items).map(item =>
+            item.querySelector('.ldap-contact-details p:nth-child(3)').textContent.replace('DN: ', ''));
         
-        // Show progress bar
+        // A single request imports every contact; the bar only shows that it is running
         const progressBar = document.getElementById('importProgress');
         const progressStatus = document.getElementById('importStatus');
         if (progressBar) {
             progressBar.style.display = 'block';
-            progressBar.querySelector('.progress-bar').style.width = '0%';
-            progressStatus.textContent = `0/${total}`;
+            progressBar.querySelector('.progress-bar').style.width = '100%';
+            progressStatus.textContent = `Importing ${dns.length}...`;
         }
         
-        // Process import sequentially
-        function processNext() {
-            if (current >= total) {
-                // All done
-                alert(`Import complete. Success: ${success}, Conflicts: ${conflicts}, Errors: ${errors}`);
+        fetch('/import-contacts', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'application/json',
+                'X-CSRFToken': document.querySelector('meta[name="csrf-token"]').content
+            },
+            body: JSON.stringify({ dns: dns })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (progressBar) {
                 progressBar.style.display = 'none';
-                closeLdapSearchModal();
-                location.reload();
+            }
+            if (!data.success) {
+                alert('Error importing contacts: ' + data.error);
                 return;
             }
-            
-            const item = items[current];
-            const dn = item.querySelector('.ldap-contact-details p:nth-child(3)').textContent.replace('DN: ', '');
-            
-            fetch('/import-contact', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Accept': 'application/json',
-                    'X-CSRFToken': document.querySelector('meta[name="csrf-token"]').content
-                },
-                body: JSON.stringify({ dn: dn })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    success++;
-                } else if (data.conflict) {
-                    conflicts++;
-                } else {
-                    errors++;
-                }
-                
-                current++;
-                // Update progress
-                if (progressBar) {
-                    const percent = (current / total) * 100;
-                    progressBar.querySelector('.progress-bar').style.width = `${percent}%`;
-                    progressStatus.textContent = `${current}/${total}`;
-                }
-                
-                // Process next
-                processNext();
-            })
-            .catch(error => {
-                console.error('Import error:', error);
-                errors++;
-                current++;
-                processNext();
-            });
-        }
-        
-        // Start processing
-        processNext();
+            const summary = data.summary;
+            const success = (summary.imported || 0) + (summary.updated || 0) + (summary.duplicate || 0);
+            const errors = (summary.error || 0) + (summary.not_found || 0);
+            alert(`Import complete. Success: ${success}, Conflicts: ${summary.conflict || 0}, Errors: ${errors}`);
+            closeLdapSearchModal();
+            location.reload();
+        })
+        .catch(error => {
+            console.error('Import error:', error);
+            if (progressBar) {
+                progressBar.style.display = 'none';
+            }
+            alert('Error importing contacts: ' + error.message);
+        });
     };
     
     // Close LDAP search modal
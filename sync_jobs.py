@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import threading
+import time
+import uuid
+from ldap_sync import LDAPSync
+from sync_lease import SyncLease
+
+class SyncJob:
+    """State of one LDAP sync run, updated by the sync's progress callback"""
+
+    def __init__(self, full=None, trigger='manual', scope=None):
+        self.id = uuid.uuid4().hex
+        self.full = full
+        self.trigger = trigger
+        self.scope = scope  # LDAPSync.resync arguments of a targeted sync
+        self.status = 'queued'  # queued, running, completed, failed, skipped
+        self.phase = 'queued'
+        self.processed = 0
+        self.total = None
+        self.counts = {}
+        self.error = None
+        self.attached_to = None  # job that held the lease when this one was skipped
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self._fetch_started = None
+        self._lock = threading.Lock()
+        self.done = threading.Event()  # set once the job completed, failed or was skipped
+
+    def update(self, phase=None, processed=None, total=None, **counts):
+        """Progress callback passed to LDAPSync.sync_contacts"""
+        with self._lock:
+            if phase:
+                if phase == 'fetching' and self._fetch_started is None:
+                    self._fetch_started = time.monotonic()
+                self.phase = phase
+            if processed is not None:
+                self.processed = processed
+            if total is not None:
+                self.total = total
+            self.counts.update(counts)
+
+    def to_dict(self):
+        with self._lock:
+            elapsed = None
+            throughput = None
+            eta = None
+            if self.started_at:
+                elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+            if self._fetch_started is not None and self.processed:
+                fetch_elapsed = time.monotonic() - self._fetch_started
+                if fetch_elapsed > 0:
+                    throughput = self.processed / fetch_elapsed
+            if self.status == 'running' and throughput and self.total and self.total > self.processed:
+                eta = (self.total - self.processed) / throughput
+
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'phase': self.phase,
+                'trigger': self.trigger,
+                'full': self.full,
+                'scope': self.scope,
+                'processed': self.processed,
+                'total': self.total,
+                'entries_per_second': round(throughput, 1) if throughput else None,
+                'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'counts': dict(self.counts),
+                'error': self.error,
+                'attached_to': self.attached_to,
+                'created_at': self.created_at.isoformat(),
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            }
+
+
+class SyncJobManager:
+    """Run LDAP syncs on a background executor and keep their progress for polling
+
+    Syncs run one at a time on a single worker thread inside an application
+    context; the most recent jobs are kept in memory for /sync/<job_id>. A
+    database lease (SyncLease) extends the one-at-a-time rule to every process
+    sharing the database, and its progress snapshots let any process answer
+    for the job that currently holds it.
+    """
+    # Seconds between lease renewals; the lease expires after SyncLease.ttl
+    HEARTBEAT_INTERVAL = 10
+
+    class Busy(Exception):
+        def __init__(self, job_id):
+            self.job_id = job_id
+            super().__init__(f"Another sync is already running (job {job_id})")
+
+    def __init__(self, history_size=20, lease=None):
+        self.logger = logging.getLogger('SyncJobManager')
+        self.history_size = history_size
+        self.lease = lease or SyncLease()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ldap-sync-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, app, full=None, trigger='manual', scope=None):
+        """Start a sync run, or attach to the one already in flight
+
+        scope, if given, holds the search_base/extra_filter/uids arguments of a
+        targeted resync. Returns (job_id, attached) immediately; attached is
+        True when the id belongs to a sync that was already queued or running
+        in any process. A targeted request is never attached, since the sync
+        in flight may not cover its scope (or may already have passed it):
+        Busy is raised with the id of that sync instead.
+        """
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.status in ('queued', 'running'):
+                    if scope:
+                        raise self.Busy(job.id)
+                    self.logger.info(f"Attaching {trigger} sync request to running job {job.id}")
+                    return job.id, True
+            with app.app_context():
+                running = self.lease.current()
+            if running:
+                if scope:
+                    raise self.Busy(running[0])
+                self.logger.info(f"Attaching {trigger} sync request to job {running[0]} in another process")
+                return running[0], True
+
+            job = SyncJob(full=full, trigger=trigger, scope=scope)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_size:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, app, job)
+        self.logger.info(f"Queued {trigger} LDAP sync job {job.id}")
+        return job.id, False
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job run by this process has finished and return its progress (None if unknown)"""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.done.wait(timeout)
+        return job.to_dict()
+
+    def status(self, job_id):
+        """Progress of a job run by this process, or the lease's snapshot for one run elsewhere"""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.lease.job_status(job_id)
+
+    def _run(self, app, job):
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        with app.app_context():
+            if not self.lease.acquire(job.id):
+                running = self.lease.current()
+                job.attached_to = running[0] if running else None
+                job.error = 'Another sync is already running'
+                job.update(phase='skipped')
+                job.status = 'skipped'
+                job.finished_at = datetime.utcnow()
+                self.logger.info(f"Skipped LDAP sync job {job.id}: lease held by job {job.attached_to}")
+                job.done.set()
+                return
+
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(app, job, stop, lost),
+            name='ldap-sync-lease', daemon=True
+        )
+        heartbeat.start()
+
+        def progress(**kwargs):
+            if lost.is_set():
+                raise Exception("Sync lease was lost to another process")
+            job.update(**kwargs)
+
+        try:
+            with app.app_context():
+                if job.scope:
+                    conflicts = LDAPSync().resync(progress=progress, **job.scope)
+                else:
+                    conflicts = LDAPSync().sync_contacts(full=job.full, progress=progress)
+            job.update(phase='done', conflicts=len(conflicts or []))
+            job.status = 'completed'
+        except Exception as e:
+            self.logger.error(f"LDAP sync job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.update(phase='failed')
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.utcnow()
+            stop.set()
+            heartbeat.join()
+            try:
+                with app.app_context():
+                    self.lease.release(job.id, job.to_dict())
+            finally:
+                job.done.set()
+
+    def _heartbeat(self, app, job, stop, lost):
+        """Renew the lease and publish progress until the job finishes"""
+        while not stop.wait(self.HEARTBEAT_INTERVAL):
+            try:
+                with app.app_context():
+                    if not self.lease.renew(job.id, job.to_dict()):
+                        self.logger.error(f"Sync lease for job {job.id} was taken over")
+                        lost.set()
+                        return
+            except Exception as e:
+                # A busy database must not kill the heartbeat; the lease only expires after its TTL
+                self.logger.warning(f"Sync lease heartbeat failed: {str(e)}")
+
+# Shared by the /sync routes and the scheduler
+sync_jobs = SyncJobManager()
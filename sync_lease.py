@@ -0,0 +1,106 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, SyncLock
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+
+class SyncLease:
+    """Database lease that admits one LDAP sync at a time across every process
+
+    A holder owns the lease until it releases it or stops renewing it for
+    `ttl` seconds, after which any process may take it over. Acquire and renew
+    are single conditional UPDATEs, so two processes can never both succeed.
+    """
+    LOCK_NAME = 'ldap_sync'
+
+    def __init__(self, ttl=60, name=LOCK_NAME):
+        """
+        Args:
+            ttl: Seconds the lease stays valid without a heartbeat
+            name: Lock row to use
+        """
+        self.logger = logging.getLogger('SyncLease')
+        self.ttl = ttl
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self, job_id):
+        """Take the lease for job_id; returns False if another live holder has it"""
+        now = datetime.utcnow()
+        values = {
+            'holder': self.holder, 'job_id': job_id, 'acquired_at': now,
+            'heartbeat_at': now, 'expires_at': now + timedelta(seconds=self.ttl), 'progress': None
+        }
+        try:
+            result = db.session.execute(
+                db.update(SyncLock)
+                .where(SyncLock.name == self.name,
+                       db.or_(SyncLock.holder.is_(None), SyncLock.expires_at < now))
+                .values(**values)
+            )
+            if result.rowcount == 0:
+                if db.session.get(SyncLock, self.name) is not None:
+                    db.session.rollback()
+                    return False
+                db.session.add(SyncLock(name=self.name, **values))
+            db.session.commit()
+        except IntegrityError:
+            # Another process created the lock row first
+            db.session.rollback()
+            return False
+        self.logger.info(f"Acquired sync lease for job {job_id} as {self.holder}")
+        return True
+
+    def renew(self, job_id, progress=None):
+        """Extend the lease and publish a progress snapshot; returns False if the lease was lost"""
+        now = datetime.utcnow()
+        values = {'heartbeat_at': now, 'expires_at': now + timedelta(seconds=self.ttl)}
+        if progress is not None:
+            values['progress'] = json.dumps(progress)
+        result = db.session.execute(
+            db.update(SyncLock)
+            .where(SyncLock.name == self.name, SyncLock.holder == self.holder, SyncLock.job_id == job_id)
+            .values(**values)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def release(self, job_id, progress=None):
+        """Give the lease up, keeping the final progress snapshot for late pollers"""
+        values = {'holder': None, 'expires_at': datetime.utcnow()}
+        if progress is not None:
+            values['progress'] = json.dumps(progress)
+        db.session.execute(
+            db.update(SyncLock)
+            .where(SyncLock.name == self.name, SyncLock.holder == self.holder, SyncLock.job_id == job_id)
+            .values(**values)
+        )
+        db.session.commit()
+        self.logger.info(f"Released sync lease for job {job_id}")
+
+    def current(self):
+        """Return (job_id, progress) of the live holder, or None when the lease is free"""
+        lock = db.session.get(SyncLock, self.name)
+        if lock is None or lock.holder is None or lock.expires_at < datetime.utcnow():
+            return None
+        return lock.job_id, self._progress(lock)
+
+    def job_status(self, job_id):
+        """Last published progress of job_id, if it is the most recent job to hold the lease"""
+        lock = db.session.get(SyncLock, self.name)
+        if lock is None or lock.job_id != job_id:
+            return None
+        progress = self._progress(lock) or {'job_id': job_id, 'status': 'running'}
+        if progress.get('status') in ('queued', 'running') and (
+                lock.holder is None or lock.expires_at < datetime.utcnow()):
+            # The holder died without releasing the lease
+            progress.update(status='failed', phase='failed', error='Sync process stopped responding')
+        return progress
+
+    def _progress(self, lock):
+        try:
+            return json.loads(lock.progress) if lock.progress else None
+        except ValueError:
+            return None
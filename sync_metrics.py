@@ -0,0 +1,92 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+class SyncMetrics:
+    """Per-phase timings and counters collected during one LDAP sync run
+
+    Phase times are exclusive: time spent in a nested phase (for example
+    enrichment queueing inside a flush) is only counted for the inner phase.
+    Phases running on fetch threads overlap with the writer, so the totals
+    can add up to more than the wall-clock duration. The resident set size is
+    sampled at every phase boundary and page, and peak_rss_kb keeps the
+    largest sample of this run (None where /proc is not available).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Wall-clock start of this run (a resumed run keeps the interrupted run's sync time instead)
+        self.started_at = datetime.utcnow()
+        self.timings = defaultdict(float)
+        self.page_fetch_ms = []
+        self.pages = 0
+        self.bytes = 0
+        self.peak_rss_kb = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.sample_rss()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block and add its exclusive duration to the named phase"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            with self._lock:
+                self.timings[name] += elapsed - nested
+            if stack:
+                stack[-1] += elapsed
+            self.sample_rss()
+
+    def record_page(self, seconds, size):
+        """Count one fetched page, its round-trip time and its payload size in bytes"""
+        with self._lock:
+            self.pages += 1
+            self.bytes += size
+            self.page_fetch_ms.append(round(seconds * 1000, 1))
+        self.sample_rss()
+
+    def sample_rss(self):
+        """Fold the current resident set size into this run's peak"""
+        rss = self.current_rss_kb()
+        if rss is not None:
+            with self._lock:
+                if self.peak_rss_kb is None or rss > self.peak_rss_kb:
+                    self.peak_rss_kb = rss
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @staticmethod
+    def current_rss_kb():
+        """Current resident set size of this process in KiB, where /proc reports it (Linux)"""
+        try:
+            with open('/proc/self/statm') as statm:
+                pages = int(statm.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+    @staticmethod
+    def process_peak_rss_kb():
+        """Peak resident set size over the whole life of this process in KiB, if the platform reports it"""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS reports bytes, Linux reports KiB
+        return peak // 1024 if sys.platform == 'darwin' else peak
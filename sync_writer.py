@@ -0,0 +1,269 @@
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import db, Contact, History
+from contextlib import nullcontext
+from datetime import datetime
+import hashlib
+import logging
+
+class ContactSyncWriter:
+    """Match LDAP entries against existing contacts and write the changes in batches
+
+    Existing contacts are indexed once by UID and DN. New and changed entries are
+    collected and written with a single INSERT ... ON CONFLICT(ldap_dn) DO UPDATE
+    per batch; unchanged entries only get their last_sync refreshed in bulk.
+    """
+    # Contact columns written on every upsert
+    UPSERT_COLUMNS = ('ldap_dn', 'uid', 'first_name', 'last_name', 'email', 'phone',
+                      'department', 'title', 'ldap_hash', 'last_sync', 'source', 'is_active',
+                      'deactivated_at', 'deactivated_by')
+    # Maximum number of ids per IN (...) clause (below SQLite's bound parameter limit)
+    BULK_CHUNK_SIZE = 500
+    # deactivated_by and History.changed_by of contacts removed from LDAP; only these are purged
+    DEACTIVATED_BY = 'LDAP Sync'
+
+    def __init__(self, batch_size=500, sync_time=None, on_batch=None, timed=None, on_commit=None):
+        """
+        Args:
+            batch_size: Number of pending changes that triggers a write and commit
+            sync_time: Value stored in last_sync for every contact seen
+            on_batch: Optional callable receiving the DNs of each written batch
+                and the ids of the unchanged contacts it touched, after it is
+                committed
+            timed: Optional callable returning a context manager that times a named
+                phase (used to record flush time)
+            on_commit: Optional callable run after every committed batch (used to
+                checkpoint the sync)
+        """
+        self.logger = logging.getLogger('LDAPSync')
+        self.batch_size = max(int(batch_size), 1)
+        self.sync_time = sync_time or datetime.utcnow()
+        self.on_batch = on_batch
+        self.timed = timed or (lambda phase: nullcontext())
+        self.on_commit = on_commit
+
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.conflicts = []
+        self.deactivated = 0
+        self.already_applied = 0
+        self.batches = 0
+        self.last_dn = None
+
+        self.seen_dns = set()
+        self._applied_dns = set()
+        self.contacts_by_uid = {}
+        self.contacts_by_dn = {}
+        self._rows = []
+        self._unchanged_ids = []
+        self._conflict_marks = []
+
+    @property
+    def processed(self):
+        return self.added + self.updated + self.unchanged + len(self.conflicts) + self.already_applied
+
+    @staticmethod
+    def digest(fields):
+        """Digest of the LDAP-sourced contact fields, stored to detect unchanged entries"""
+        payload = '\x1f'.join(fields[name] or '' for name in sorted(fields))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def load_index(self):
+        """Load existing contacts in a single query and index them by UID and DN"""
+        rows = db.session.query(
+            Contact.id, Contact.uid, Contact.ldap_dn, Contact.ldap_hash,
+            Contact.is_active, Contact.source, Contact.last_sync
+        ).all()
+
+        for row in rows:
+            record = row._asdict()
+            if record['uid']:
+                self.contacts_by_uid[record['uid']] = record
+            if record['ldap_dn']:
+                self.contacts_by_dn[record['ldap_dn']] = record
+
+        self.logger.info(f"Indexed {len(rows)} existing contacts for matching")
+
+    def resume(self):
+        """Treat contacts already written with this sync_time by an interrupted run as applied
+
+        Call after load_index with the sync_time of the interrupted run. Every
+        contact whose DN that run saw (written, unchanged or matched by DN in
+        a UID conflict) has that last_sync. Their entries are skipped by
+        process() but still count as seen, so the reconcile step does not
+        deactivate them. Returns the number found.
+        """
+        self._applied_dns = {
+            dn for dn, record in self.contacts_by_dn.items()
+            if record['last_sync'] and record['last_sync'] >= self.sync_time
+        }
+        self.seen_dns.update(self._applied_dns)
+        return len(self._applied_dns)
+
+    def process(self, entry_dn, fields):
+        """Match one LDAP entry and queue the resulting write
+
+        Returns 'added', 'updated', 'unchanged', 'conflict' or 'applied' (already
+        written by the interrupted run being resumed).
+        """
+        if entry_dn in self._applied_dns:
+            self.already_applied += 1
+            return 'applied'
+
+        uid = fields['uid']
+        self.seen_dns.add(entry_dn)
+        self.last_dn = entry_dn
+        existing_by_uid = self.contacts_by_uid.get(uid)
+        existing_by_dn = self.contacts_by_dn.get(entry_dn)
+
+        if existing_by_uid and existing_by_uid is not existing_by_dn:
+            # The UID already belongs to another contact - record the conflict and skip
+            self.logger.warning(f"Found conflict for UID {uid}")
+            self._conflict_marks.append((uid, existing_by_dn['id'] if existing_by_dn else None))
+            if existing_by_dn and existing_by_dn['id']:
+                # Its DN is still in LDAP: refresh last_sync so a resumed run counts it as seen
+                self._unchanged_ids.append(existing_by_dn['id'])
+            self.conflicts.append({
+                'uid': uid,
+                'manual_contact_id': existing_by_uid['id'],
+                'ldap_dn': entry_dn
+            })
+            self._flush_if_full()
+            return 'conflict'
+
+        digest = self.digest(fields)
+        if (existing_by_dn and existing_by_dn['ldap_hash'] == digest
+                and existing_by_dn['is_active'] and existing_by_dn['source'] == 'ldap'):
+            # Nothing changed in LDAP, only last_sync needs refreshing
+            self._unchanged_ids.append(existing_by_dn['id'])
+            self.unchanged += 1
+            self._flush_if_full()
+            return 'unchanged'
+
+        if existing_by_dn:
+            self.logger.debug(f"Updating existing contact: {uid}")
+            record = existing_by_dn
+            if self.contacts_by_uid.get(record['uid']) is record:
+                del self.contacts_by_uid[record['uid']]
+            self.updated += 1
+            status = 'updated'
+        else:
+            self.logger.debug(f"Creating new contact: {uid}")
+            record = {'id': None, 'ldap_dn': entry_dn}
+            self.contacts_by_dn[entry_dn] = record
+            self.added += 1
+            status = 'added'
+
+        record.update(uid=uid, ldap_hash=digest, is_active=True, source='ldap')
+        self.contacts_by_uid[uid] = record
+
+        row = dict(fields, ldap_dn=entry_dn, ldap_hash=digest, last_sync=self.sync_time,
+                   source='ldap', is_active=True, deactivated_at=None, deactivated_by=None)
+        self._rows.append(row)
+        self._flush_if_full()
+        return status
+
+    def _flush_if_full(self):
+        pending = len(self._rows) + len(self._unchanged_ids) + len(self._conflict_marks)
+        if pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write and commit the pending batch; a failing batch is rolled back and re-raised"""
+        if not (self._rows or self._unchanged_ids or self._conflict_marks):
+            return
+        with self.timed('flush'):
+            self._flush()
+
+    def _flush(self):
+        rows, self._rows = self._rows, []
+        unchanged_ids, self._unchanged_ids = self._unchanged_ids, []
+        conflict_marks, self._conflict_marks = self._conflict_marks, []
+
+        try:
+            if rows:
+                self._upsert(rows)
+            self._touch(unchanged_ids)
+            for uid, conflict_with in conflict_marks:
+                Contact.query.filter_by(uid=uid).update(
+                    {Contact.has_conflict: True, Contact.conflict_with: conflict_with},
+                    synchronize_session=False
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.batches += 1
+        if self.on_commit:
+            self.on_commit()
+        if (rows or unchanged_ids) and self.on_batch:
+            self.on_batch([row['ldap_dn'] for row in rows], unchanged_ids)
+
+        self.logger.info(
+            f"Committed batch of {len(rows)} changed contacts. Processed {self.processed} entries "
+            f"(added: {self.added}, updated: {self.updated}, unchanged: {self.unchanged}, "
+            f"conflicts: {len(self.conflicts)})"
+        )
+
+    def deactivate_missing(self):
+        """Deactivate active LDAP contacts whose DN was not seen (only valid after a full sync)
+
+        The missing set is the difference between the indexed DNs and the DNs
+        processed, so no extra query is needed to find them. They are switched
+        off with bulk UPDATEs and a History row each, in one transaction.
+        """
+        missing = [
+            record for dn, record in self.contacts_by_dn.items()
+            if dn not in self.seen_dns and record['id']
+            and record['is_active'] and record['source'] == 'ldap'
+        ]
+        missing_ids = [record['id'] for record in missing]
+        if not missing_ids:
+            return 0
+        if not self.seen_dns:
+            # An empty directory answer is far more likely a broken search than a purge
+            self.logger.warning(f"Full sync saw no entries, not deactivating {len(missing_ids)} contacts")
+            return 0
+
+        try:
+            for start in range(0, len(missing_ids), self.BULK_CHUNK_SIZE):
+                chunk = missing_ids[start:start + self.BULK_CHUNK_SIZE]
+                Contact.query.filter(Contact.id.in_(chunk)).update(
+                    {Contact.is_active: False, Contact.deactivated_at: self.sync_time,
+                     Contact.deactivated_by: self.DEACTIVATED_BY},
+                    synchronize_session=False
+                )
+            db.session.execute(db.insert(History), [
+                {'contact_id': contact_id, 'field_name': 'Status', 'old_value': 'Active',
+                 'new_value': 'Removed from LDAP', 'changed_at': self.sync_time,
+                 'changed_by': self.DEACTIVATED_BY}
+                for contact_id in missing_ids
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for record in missing:
+            record['is_active'] = False
+        self.deactivated = len(missing_ids)
+        self.logger.info(f"Deactivated {self.deactivated} contacts no longer present in LDAP")
+        return self.deactivated
+
+    def _upsert(self, rows):
+        """Insert or update contacts keyed by ldap_dn with one executemany statement"""
+        stmt = sqlite_insert(Contact.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Contact.__table__.c.ldap_dn],
+            set_={name: stmt.excluded[name] for name in self.UPSERT_COLUMNS if name != 'ldap_dn'}
+        )
+        db.session.execute(stmt, rows)
+
+    def _touch(self, contact_ids):
+        """Set last_sync on unchanged contacts with a few bulk UPDATEs instead of per-row flushes"""
+        for start in range(0, len(contact_ids), self.BULK_CHUNK_SIZE):
+            chunk = contact_ids[start:start + self.BULK_CHUNK_SIZE]
+            Contact.query.filter(Contact.id.in_(chunk)).update(
+                {Contact.last_sync: self.sync_time}, synchronize_session=False
+            )
@@ -0,0 +1,66 @@
+"""Shared fixtures: an in-memory database and a MOCK_SYNC directory wired into LDAPSync"""
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import db, Settings
+from ldap_sync import LDAPSync, user_search_cache
+from ldap_pool import ldap_pool
+from cucm_enrichment import enrichment_queue
+from cucm_service import phone_lookup_cache, phone_status_cache
+from fac_cache import fac_cache
+from ldap_directory import BASE_DN, build_directory, connect
+
+
+def _clear_shared_state():
+    ldap_pool.clear()
+    for cache in (user_search_cache, phone_lookup_cache, phone_status_cache):
+        cache.clear()
+    fac_cache.clear()
+
+
+@pytest.fixture
+def app():
+    """Flask app on an in-memory SQLite database with the LDAP settings of the mock directory"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for key, value in [('LDAP_SERVER', 'mock-ldap'), ('LDAP_BASE_DN', BASE_DN),
+                           ('LDAP_ALLOW_ANONYMOUS', 'True'), ('LDAP_MAX_ENTRIES', '0')]:
+            db.session.add(Settings(key=key, value=value, category='ldap'))
+        db.session.commit()
+        _clear_shared_state()
+        yield app
+        db.session.remove()
+        _clear_shared_state()
+
+
+@pytest.fixture
+def directory():
+    """Mock directory of 20 people under ou=people; tests may add or delete entries"""
+    return build_directory(20)
+
+
+@pytest.fixture
+def enqueued():
+    """Record the contact ids handed to the CUCM enrichment queue instead of enriching them"""
+    calls = []
+    with mock.patch.object(enrichment_queue, 'enqueue',
+                           lambda contact_ids, retry=False: calls.append((list(contact_ids), retry))):
+        yield calls
+
+
+@pytest.fixture
+def ldap(app, directory, enqueued):
+    """Route every LDAPSync connection to the mock directory"""
+    with mock.patch.object(LDAPSync, '_open_connection', lambda self, server: connect(directory)):
+        yield directory
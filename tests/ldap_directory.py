@@ -0,0 +1,45 @@
+"""In-process MOCK_SYNC directory used by the tests"""
+from ldap3 import Server, Connection, MOCK_SYNC
+
+BASE_DN = 'dc=example,dc=org'
+AFFILIATIONS = ['staff', 'faculty', 'student', 'affiliate']
+
+
+def build_directory(count, ous=1):
+    """Mock LDAP server holding `count` person entries (uid=userNNNNNN) spread over `ous` OUs"""
+    server = Server('mock-ldap')
+    conn = Connection(server, client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(BASE_DN, {'objectClass': ['domain'], 'dc': 'example'})
+    ou_names = ['people'] if ous <= 1 else [f'people{n}' for n in range(ous)]
+    for name in ou_names:
+        conn.strategy.add_entry(f'ou={name},{BASE_DN}', {'objectClass': ['organizationalUnit'], 'ou': name})
+    for i in range(count):
+        add_person(server, i, ou_names[i % len(ou_names)])
+    return server
+
+
+def add_person(server, i, ou='people', **overrides):
+    """Add person number i under ou; returns its DN"""
+    uid = overrides.pop('uid', f'user{i:06d}')
+    dn = f'uid={uid},ou={ou},{BASE_DN}' if ou else f'uid={uid},{BASE_DN}'
+    attributes = {
+        'objectClass': ['person'],
+        'uid': uid,
+        'cn': f'Given{i} Surname{i}',
+        'givenName': f'Given{i}',
+        'sn': f'Surname{i}',
+        'mail': f'{uid}@example.org',
+        'telephoneNumber': f'+30{i:08d}',
+        'ou': f'Department {i % 50}',
+        'eduPersonAffiliation': AFFILIATIONS[i % len(AFFILIATIONS)],
+    }
+    attributes.update(overrides)
+    Connection(server, client_strategy=MOCK_SYNC).strategy.add_entry(dn, attributes)
+    return dn
+
+
+def connect(server):
+    """Bound mock connection to server"""
+    conn = Connection(server, client_strategy=MOCK_SYNC)
+    conn.bind()
+    return conn
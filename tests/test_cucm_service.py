@@ -0,0 +1,80 @@
+"""CUCMService lookups: snapshot fallback, negative caching and registration status"""
+import time
+from unittest import mock
+
+import pytest
+
+from cucm_service import CUCMService
+from phone_inventory import phone_inventory
+
+PHONE = {'name': 'SEP001122334455', 'description': 'alice', 'model': 'Cisco 8841', 'product': 'Cisco 8841',
+         'class': 'Phone', 'protocol': 'SIP'}
+
+
+@pytest.fixture
+def snapshot(app):
+    """A loaded phone inventory that has no phones; stale unless a test marks it fresh"""
+    with mock.patch.object(phone_inventory, 'ready', lambda: True), \
+            mock.patch.object(phone_inventory, 'is_fresh', return_value=False) as is_fresh, \
+            mock.patch.object(phone_inventory, 'find_by_mac', lambda mac: None), \
+            mock.patch.object(phone_inventory, 'find_by_owner', lambda uid: None), \
+            mock.patch.object(phone_inventory, 'search', lambda pattern, limit: []):
+        yield is_fresh
+
+
+@pytest.fixture
+def service(snapshot):
+    return CUCMService()
+
+
+def test_miss_in_a_current_snapshot_is_authoritative(service, snapshot):
+    snapshot.return_value = True
+    with mock.patch.object(CUCMService, '_get_client', side_effect=AssertionError('live AXL call')):
+        assert service.get_phone_by_mac('001122334455') is None
+        assert service.find_phone_by_owner('alice') is None
+        assert service.search_phones('0011', limit=10) == []
+
+
+def test_miss_in_a_stale_snapshot_asks_cucm(service):
+    with mock.patch.object(CUCMService, '_find_phone_by_owner_live', return_value=None) as owner, \
+            mock.patch.object(CUCMService, '_search_phones_live', return_value=[]) as search:
+        assert service.find_phone_by_owner('alice') is None
+        assert service.search_phones('0011', limit=10) == []
+
+    owner.assert_called_once_with('alice')
+    search.assert_called_once_with('0011', 10)
+
+
+def test_snapshot_miss_falls_back_to_live_lookup(service):
+    with mock.patch.object(CUCMService, '_get_phone_live',
+                           side_effect=lambda mac: dict(PHONE, status='Registered')) as live:
+        assert service.get_phone_by_mac('00:11:22:33:44:55') == dict(PHONE, status='Registered')
+        assert service.get_phone_by_mac('001122334455') == dict(PHONE, status='Registered')
+
+    live.assert_called_once_with('001122334455')
+
+
+def test_phone_not_found_is_cached_briefly(service, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    with mock.patch.object(CUCMService, '_get_phone_live', return_value=None) as live:
+        assert service.get_phone_by_mac('001122334455') is None
+        assert service.get_phone_by_mac('001122334455') is None
+        assert live.call_count == 1
+
+        monkeypatch.setattr(time, 'monotonic', lambda: now + CUCMService.NEGATIVE_CACHE_TTL + 1)
+        live.return_value = dict(PHONE, status='Registered')
+        assert service.get_phone_by_mac('001122334455')['name'] == PHONE['name']
+        assert live.call_count == 2
+
+
+def test_status_outlives_its_cache_as_unknown(service, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    with mock.patch.object(CUCMService, '_get_phone_live',
+                           side_effect=lambda mac: dict(PHONE, status='Registered')) as live:
+        service.get_phone_by_mac('001122334455')
+        monkeypatch.setattr(time, 'monotonic', lambda: now + 120)
+
+        assert service.get_phone_by_mac('001122334455') == dict(PHONE, status='Unknown')
+        assert live.call_count == 1
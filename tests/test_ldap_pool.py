@@ -0,0 +1,69 @@
+"""LDAPConnectionPool reuse, discard rules and sync worker limits"""
+import pytest
+from ldap3.core.exceptions import LDAPSocketReceiveError
+
+from ldap_pool import LDAPConnectionPool
+from ldap_directory import connect
+
+
+@pytest.fixture
+def opened(directory):
+    """Open mock connections through this list so tests can count them"""
+    connections = []
+
+    def open_connection():
+        connections.append(connect(directory))
+        return connections[-1]
+
+    open_connection.connections = connections
+    return open_connection
+
+
+def test_connection_is_reused(opened):
+    pool = LDAPConnectionPool(max_size=2)
+    with pool.connection('fp', opened) as first:
+        pass
+    with pool.connection('fp', opened) as second:
+        pass
+
+    assert first is second
+    assert len(opened.connections) == 1
+    assert pool.stats() == {'pools': 1, 'idle': 1, 'in_use': 0}
+
+
+def test_connection_is_discarded_after_ldap_error(opened):
+    pool = LDAPConnectionPool(max_size=2)
+    with pytest.raises(LDAPSocketReceiveError):
+        with pool.connection('fp', opened):
+            raise LDAPSocketReceiveError('connection reset')
+
+    assert pool.stats()['idle'] == 0
+    assert opened.connections[0].closed
+
+
+def test_connection_of_a_closed_generator_is_discarded(opened):
+    pool = LDAPConnectionPool(max_size=2)
+
+    def pages():
+        with pool.connection('fp', opened):
+            yield from range(3)
+
+    partial = pages()
+    next(partial)
+    partial.close()
+
+    assert pool.stats() == {'pools': 1, 'idle': 0, 'in_use': 0}
+
+
+def test_full_pool_times_out(opened):
+    pool = LDAPConnectionPool(max_size=1, acquire_timeout=0.05)
+    with pool.connection('fp', opened):
+        with pytest.raises(TimeoutError):
+            with pool.connection('fp', opened):
+                pass
+
+
+def test_sync_workers_leave_a_connection_for_interactive_callers():
+    assert LDAPConnectionPool(max_size=4).sync_workers(8) == 3
+    assert LDAPConnectionPool(max_size=4).sync_workers(2) == 2
+    assert LDAPConnectionPool(max_size=1).sync_workers(4) == 1
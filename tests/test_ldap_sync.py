@@ -0,0 +1,215 @@
+"""LDAPSync end to end against the MOCK_SYNC directory"""
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+from models import db, Contact, History, Settings, SyncRun, upgrade_settings
+from ldap_sync import LDAPSync
+from ldap_directory import BASE_DN, add_person, build_directory, connect
+
+PEOPLE = f'ou=people,{BASE_DN}'
+
+
+def configure(**settings):
+    for key, value in settings.items():
+        Settings.set_value(key, value)
+    db.session.commit()
+
+
+def remove_entry(server, uid, ou='people'):
+    conn = connect(server)
+    assert conn.delete(f'uid={uid},ou={ou},{BASE_DN}')
+
+
+def test_full_sync_adds_contacts_and_deactivates_removed_ones(ldap):
+    LDAPSync().sync_contacts(full=True)
+    assert Contact.query.filter_by(source='ldap', is_active=True).count() == 20
+
+    remove_entry(ldap, 'user000007')
+    LDAPSync().sync_contacts(full=True)
+
+    assert not Contact.query.filter_by(uid='user000007').one().is_active
+    assert Contact.query.filter_by(is_active=True).count() == 19
+
+
+def test_purge_only_deletes_contacts_removed_from_ldap(ldap):
+    LDAPSync().sync_contacts(full=True)
+    remove_entry(ldap, 'user000007')
+    LDAPSync().sync_contacts(full=True)
+    # An admin deleted another LDAP contact by hand
+    deleted = Contact.query.filter_by(uid='user000008').one()
+    deleted.is_active = False
+    deleted.deactivated_at = datetime.utcnow()
+    deleted.deactivated_by = 'user'
+    db.session.add(History(contact_id=deleted.id, field_name='Status', old_value='Active', new_value='Deleted'))
+    expired = datetime.utcnow() - timedelta(days=31)
+    Contact.query.filter(Contact.is_active == False).update({Contact.deactivated_at: expired})
+    db.session.commit()
+    configure(RETENTION_PERIOD='30')
+
+    assert LDAPSync()._purge_removed_contacts() == 1
+
+    assert Contact.query.filter_by(uid='user000007').count() == 0
+    assert Contact.query.filter_by(uid='user000008').one().deactivated_by == 'user'
+    assert History.query.filter_by(contact_id=deleted.id).count() == 1
+
+
+def test_unchanged_contacts_missing_cucm_data_are_retried(ldap, enqueued):
+    LDAPSync().sync_contacts(full=True)
+    assert enqueued and not any(retry for _, retry in enqueued)
+    Contact.query.filter(Contact.uid != 'user000000').update(
+        {Contact.pin: '1234', Contact.mac_address: '001122334455', Contact.phone_model: 'Cisco 8841'})
+    db.session.commit()
+    enqueued.clear()
+
+    LDAPSync().sync_contacts(full=True)
+
+    retried = [contact_id for contact_ids, retry in enqueued if retry for contact_id in contact_ids]
+    assert retried == [Contact.query.filter_by(uid='user000000').one().id]
+
+
+def test_resumed_sync_keeps_conflicting_contact_active(app, enqueued):
+    directory = build_directory(50, ous=3)
+    configure(LDAP_PAGE_SIZE='10', LDAP_SYNC_PARTITIONING='ou', LDAP_SYNC_BATCH_SIZE='5')
+    with mock.patch.object(LDAPSync, '_open_connection', lambda self, server: connect(directory)):
+        LDAPSync().sync_contacts(full=True)
+        renamed = Contact.query.filter_by(uid='user000003').one()
+        renamed.uid = 'user000003-old'
+        db.session.add(Contact(uid='user000003', source='manual', first_name='Manual'))
+        db.session.commit()
+
+        decode = LDAPSync._decode_entries
+        calls = []
+
+        def failing_decode(self, *args):
+            calls.append(None)
+            if len(calls) == 4:
+                raise RuntimeError('connection lost')
+            return decode(self, *args)
+
+        with mock.patch.object(LDAPSync, '_decode_entries', failing_decode), pytest.raises(RuntimeError):
+            LDAPSync().sync_contacts(full=True)
+        assert Settings.get_value(LDAPSync.CHECKPOINT_KEY)
+
+        LDAPSync().sync_contacts(full=True)
+
+    assert not Settings.get_value(LDAPSync.CHECKPOINT_KEY)
+    assert Contact.query.filter_by(ldap_dn=renamed.ldap_dn).one().is_active
+    assert Contact.query.filter_by(is_active=False).count() == 0
+
+
+def test_ou_partitions_are_containers_only(app, enqueued):
+    directory = build_directory(6, ous=2)
+    # Excluded students directly below the base DN must not become partitions
+    for i in range(10, 14):
+        add_person(directory, i, ou=None, eduPersonAffiliation='student')
+    add_person(directory, 14, ou=None, eduPersonAffiliation='staff')
+    configure(LDAP_SYNC_PARTITIONING='ou', LDAP_EXCLUDE_STUDENTS='True', LDAP_PAGE_SIZE='1')
+
+    with mock.patch.object(LDAPSync, '_open_connection', lambda self, server: connect(directory)):
+        ldap_sync = LDAPSync()
+        with ldap_sync.connection() as conn:
+            partitions = ldap_sync._sync_partitions(conn, BASE_DN, ldap_sync.search_filter)
+        LDAPSync().sync_contacts(full=True)
+
+    assert sorted(base for base, _, _ in partitions) == sorted(
+        [f'ou=people0,{BASE_DN}', f'ou=people1,{BASE_DN}', BASE_DN])
+    uids = {uid for uid, in db.session.query(Contact.uid)}
+    assert 'user000014' in uids and 'user000010' not in uids
+    assert len(uids) == 6
+
+
+def test_capped_runs_continue_until_the_directory_is_complete(ldap):
+    db.session.add(Contact(uid='gone', ldap_dn=f'uid=gone,{PEOPLE}', source='ldap'))
+    db.session.commit()
+    configure(LDAP_MAX_ENTRIES='8', LDAP_PAGE_SIZE='4', LDAP_SYNC_RESUME_HOURS='0')
+
+    runs = 0
+    while True:
+        runs += 1
+        LDAPSync().sync_contacts(full=True)
+        if not Settings.get_value(LDAPSync.CHECKPOINT_KEY):
+            break
+        # Nothing is deactivated until a run has seen the whole directory
+        assert Contact.query.filter_by(uid='gone').one().is_active
+        assert runs < 5
+
+    assert runs == 3
+    assert Contact.query.filter_by(source='ldap', is_active=True).count() == 20
+    assert not Contact.query.filter_by(uid='gone').one().is_active
+    assert Settings.get_value('LDAP_LAST_FULL_SYNC')
+    # Continued runs share the first run's sync time but record their own start
+    history = SyncRun.query.order_by(SyncRun.id).all()
+    assert len(history) == 3
+    assert all(later.started_at >= earlier.finished_at for earlier, later in zip(history, history[1:]))
+
+
+def test_upgrade_settings_lifts_the_old_entry_cap_once(app):
+    configure(LDAP_MAX_ENTRIES='1000')
+    upgrade_settings()
+    assert Settings.get_value('LDAP_MAX_ENTRIES') == '0'
+
+    # A cap set by the admin after the upgrade is kept
+    configure(LDAP_MAX_ENTRIES='1000')
+    upgrade_settings()
+    assert Settings.get_value('LDAP_MAX_ENTRIES') == '1000'
+
+
+def test_targeted_sync_rejects_malformed_filter(ldap):
+    with pytest.raises(ValueError, match='Invalid LDAP filter'):
+        LDAPSync().targeted_searches(extra_filter='(uid=user000001')
+
+
+def test_targeted_sync_rejects_base_outside_base_dn(ldap):
+    with pytest.raises(ValueError, match='not within the base DN'):
+        LDAPSync().targeted_searches(search_base='ou=people,dc=other,dc=org')
+    assert LDAPSync().targeted_searches(search_base='ou=People, DC=example,dc=org')[0]
+
+
+def test_targeted_sync_writes_contacts_but_not_mirror_freshness(ldap):
+    LDAPSync().sync_contacts(full=True)
+    state = json.loads(Settings.get_value(LDAPSync.MIRROR_STATE_KEY))
+    remove_entry(ldap, 'user000002')
+
+    conflicts = LDAPSync().resync(uids=['user000001', 'user000002'])
+
+    assert conflicts == []
+    assert json.loads(Settings.get_value(LDAPSync.MIRROR_STATE_KEY)) == state
+    # Removals are left to the next full sync
+    assert Contact.query.filter_by(uid='user000002').one().is_active
+
+
+def test_user_search_uses_mirror_unless_live(ldap):
+    LDAPSync().sync_contacts(full=True)
+
+    ldap_sync = LDAPSync()
+    assert [user['uid'] for user in ldap_sync.search_user('user000011')] == ['user000011']
+    assert ldap_sync.last_search_source == 'mirror'
+
+    assert [user['uid'] for user in ldap_sync.search_user('user000011', live=True)] == ['user000011']
+    assert ldap_sync.last_search_source == 'directory'
+
+
+def test_live_user_search_is_bounded(ldap):
+    configure(LDAP_SEARCH_SIZE_LIMIT='5')
+    ldap_sync = LDAPSync()
+
+    assert len(ldap_sync.search_user('user0000', live=True)) == 5
+    assert ldap_sync.last_search_truncated
+    assert len(ldap_sync.search_user('user000012', live=True)) == 1
+    assert not ldap_sync.last_search_truncated
+
+
+def test_import_reports_uid_and_dn_owned_by_different_contacts(ldap):
+    db.session.add(Contact(uid='old1', ldap_dn=f'uid=user000001,{PEOPLE}', source='ldap'))
+    db.session.add(Contact(uid='user000001', ldap_dn=f'uid=elsewhere,{BASE_DN}', source='ldap'))
+    db.session.commit()
+
+    results = LDAPSync().import_contacts(
+        dns=['uid=user000001, ou=People,dc=example,dc=org', 'uid=user000002 ,ou=people,dc=EXAMPLE,dc=org'])
+
+    assert [result['status'] for result in results] == ['conflict', 'imported']
+    assert Contact.query.count() == 3
+    assert Contact.query.filter_by(uid='user000002').one().ldap_dn == f'uid=user000002,{PEOPLE}'
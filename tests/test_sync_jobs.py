@@ -0,0 +1,37 @@
+"""SyncJobManager submission while another sync holds the lease"""
+import pytest
+
+from sync_jobs import SyncJobManager
+from sync_lease import SyncLease
+
+
+@pytest.fixture
+def other_process(app):
+    """A sync lease held by job1 of another process"""
+    lease = SyncLease()
+    lease.holder = 'other-host:1'
+    assert lease.acquire('job1')
+    return lease
+
+
+def test_sync_request_attaches_to_the_running_sync(app, other_process):
+    assert SyncJobManager().submit(app) == ('job1', True)
+
+
+def test_targeted_request_is_refused_while_another_sync_runs(app, other_process):
+    with pytest.raises(SyncJobManager.Busy) as busy:
+        SyncJobManager().submit(app, trigger='targeted', scope={'uids': ['user000001']})
+
+    assert busy.value.job_id == 'job1'
+
+
+def test_targeted_job_takes_the_lease_and_can_be_waited_for(app, ldap):
+    manager = SyncJobManager()
+    job_id, attached = manager.submit(app, trigger='cli', scope={'uids': ['user000001']})
+
+    job = manager.wait(job_id, timeout=30)
+
+    assert not attached
+    assert job['status'] == 'completed'
+    assert job['counts']['added'] == 1
+    assert manager.lease.job_status(job_id)['status'] == 'completed'
@@ -0,0 +1,57 @@
+"""SyncLease acquisition, takeover and dead-holder detection"""
+from datetime import datetime, timedelta
+
+from models import db, SyncLock
+from sync_lease import SyncLease
+
+
+def lease_for(holder, ttl=60):
+    lease = SyncLease(ttl=ttl)
+    lease.holder = holder
+    return lease
+
+
+def expire(name=SyncLease.LOCK_NAME):
+    db.session.get(SyncLock, name).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_second_holder_is_refused_while_lease_is_live(app):
+    first, second = lease_for('host-a:1'), lease_for('host-b:2')
+
+    assert first.acquire('job1')
+    assert not second.acquire('job2')
+    assert first.current() == ('job1', None)
+
+
+def test_expired_lease_is_taken_over_and_old_holder_loses_it(app):
+    first, second = lease_for('host-a:1'), lease_for('host-b:2')
+    assert first.acquire('job1')
+    expire()
+
+    assert second.acquire('job2')
+    assert not first.renew('job1', {'job_id': 'job1', 'status': 'running'})
+    assert second.renew('job2', {'job_id': 'job2', 'status': 'running'})
+    assert second.current() == ('job2', {'job_id': 'job2', 'status': 'running'})
+
+
+def test_release_frees_the_lease_and_keeps_final_progress(app):
+    first, second = lease_for('host-a:1'), lease_for('host-b:2')
+    assert first.acquire('job1')
+    first.release('job1', {'job_id': 'job1', 'status': 'completed'})
+
+    assert first.current() is None
+    assert first.job_status('job1') == {'job_id': 'job1', 'status': 'completed'}
+    assert second.acquire('job2')
+    assert second.job_status('job1') is None
+
+
+def test_job_of_a_dead_holder_is_reported_failed(app):
+    lease = lease_for('host-a:1')
+    assert lease.acquire('job1')
+    assert lease.renew('job1', {'job_id': 'job1', 'status': 'running'})
+    expire()
+
+    status = lease.job_status('job1')
+    assert status['status'] == 'failed'
+    assert status['error'] == 'Sync process stopped responding'
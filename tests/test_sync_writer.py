@@ -0,0 +1,135 @@
+"""ContactSyncWriter matching, conflicts, deactivation and resume"""
+from datetime import datetime, timedelta
+
+from models import db, Contact, History
+from sync_writer import ContactSyncWriter
+
+DN = 'uid={uid},ou=people,dc=example,dc=org'
+
+
+def fields(uid, **overrides):
+    values = {'uid': uid, 'first_name': 'Given', 'last_name': 'Surname', 'email': f'{uid}@example.org',
+              'phone': '+3000000000', 'department': 'Department', 'title': ''}
+    values.update(overrides)
+    return values
+
+
+def run_writer(entries, sync_time=None, full=True, **kwargs):
+    writer = ContactSyncWriter(batch_size=2, sync_time=sync_time, **kwargs)
+    writer.load_index()
+    statuses = [writer.process(DN.format(uid=uid), values) for uid, values in entries]
+    writer.flush()
+    if full:
+        writer.deactivate_missing()
+    return writer, statuses
+
+
+def test_adds_then_skips_unchanged_and_updates_changed(app):
+    writer, statuses = run_writer([('alice', fields('alice')), ('bob', fields('bob'))])
+    assert statuses == ['added', 'added']
+    assert Contact.query.filter_by(source='ldap', is_active=True).count() == 2
+
+    writer, statuses = run_writer([('alice', fields('alice')), ('bob', fields('bob', title='Dean'))])
+    assert statuses == ['unchanged', 'updated']
+    assert (writer.added, writer.updated, writer.unchanged) == (0, 1, 1)
+    assert Contact.query.filter_by(uid='bob').one().title == 'Dean'
+    assert Contact.query.count() == 2
+
+
+def test_unchanged_contacts_get_last_sync_and_reach_on_batch(app):
+    run_writer([('alice', fields('alice'))])
+    batches = []
+    sync_time = datetime.utcnow() + timedelta(minutes=1)
+    run_writer([('alice', fields('alice'))], sync_time=sync_time,
+               on_batch=lambda dns, unchanged_ids: batches.append((dns, unchanged_ids)))
+
+    contact = Contact.query.filter_by(uid='alice').one()
+    assert contact.last_sync == sync_time
+    assert batches == [([], [contact.id])]
+
+
+def test_uid_owned_by_manual_contact_is_a_conflict(app):
+    manual = Contact(uid='alice', first_name='Manual', source='manual')
+    db.session.add(manual)
+    db.session.commit()
+
+    writer, statuses = run_writer([('alice', fields('alice'))])
+
+    assert statuses == ['conflict']
+    assert writer.conflicts == [{'uid': 'alice', 'manual_contact_id': manual.id,
+                                 'ldap_dn': DN.format(uid='alice')}]
+    db.session.refresh(manual)
+    assert manual.has_conflict and manual.first_name == 'Manual'
+    assert Contact.query.count() == 1
+
+
+def test_full_sync_deactivates_contacts_missing_from_ldap(app):
+    run_writer([('alice', fields('alice')), ('bob', fields('bob'))])
+
+    writer, _ = run_writer([('alice', fields('alice'))])
+
+    assert writer.deactivated == 1
+    bob = Contact.query.filter_by(uid='bob').one()
+    assert not bob.is_active and bob.deactivated_at is not None
+    assert bob.deactivated_by == ContactSyncWriter.DEACTIVATED_BY
+    assert History.query.filter_by(contact_id=bob.id, new_value='Removed from LDAP').count() == 1
+    assert Contact.query.filter_by(uid='alice').one().is_active
+
+
+def test_empty_full_sync_deactivates_nothing(app):
+    run_writer([('alice', fields('alice'))])
+
+    writer, _ = run_writer([])
+
+    assert writer.deactivated == 0
+    assert Contact.query.filter_by(uid='alice').one().is_active
+
+
+def test_manual_contacts_are_never_deactivated(app):
+    run_writer([('alice', fields('alice'))])
+    db.session.add(Contact(uid='carol', ldap_dn=DN.format(uid='carol'), source='manual'))
+    db.session.commit()
+
+    run_writer([('alice', fields('alice'))])
+
+    assert Contact.query.filter_by(uid='carol').one().is_active
+
+
+def test_resume_skips_applied_entries_and_keeps_them_seen(app):
+    run_writer([('alice', fields('alice')), ('bob', fields('bob')), ('carol', fields('carol'))])
+    sync_time = datetime.utcnow() + timedelta(minutes=1)
+
+    # The interrupted run got as far as alice
+    run_writer([('alice', fields('alice'))], sync_time=sync_time, full=False)
+
+    writer = ContactSyncWriter(batch_size=2, sync_time=sync_time)
+    writer.load_index()
+    assert writer.resume() == 1
+    statuses = [writer.process(DN.format(uid=uid), fields(uid)) for uid in ('alice', 'bob', 'carol')]
+    writer.flush()
+    writer.deactivate_missing()
+
+    assert statuses == ['applied', 'unchanged', 'unchanged']
+    assert writer.already_applied == 1
+    assert writer.deactivated == 0
+    assert Contact.query.filter_by(is_active=True).count() == 3
+
+
+def test_resume_counts_dn_of_a_conflict_as_seen(app):
+    run_writer([('alice', fields('alice'))])
+    # alice's LDAP contact was renamed locally and a manual contact took the uid
+    Contact.query.filter_by(uid='alice').update({Contact.uid: 'alice-old'})
+    db.session.add(Contact(uid='alice', source='manual'))
+    db.session.commit()
+    sync_time = datetime.utcnow() + timedelta(minutes=1)
+
+    _, statuses = run_writer([('alice', fields('alice'))], sync_time=sync_time, full=False)
+    assert statuses == ['conflict']
+
+    writer = ContactSyncWriter(sync_time=sync_time)
+    writer.load_index()
+    assert writer.resume() == 1
+    writer.deactivate_missing()
+
+    assert writer.deactivated == 0
+    assert Contact.query.filter_by(ldap_dn=DN.format(uid='alice')).one().is_active
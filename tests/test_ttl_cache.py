@@ -0,0 +1,81 @@
+"""TTLCache expiry, eviction and request coalescing"""
+import threading
+import time
+
+import pytest
+
+from ttl_cache import TTLCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_entries_expire(monkeypatch):
+    cache = TTLCache(ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache.set('a', 1)
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+
+    assert cache.get('a', 'missing') == 'missing'
+
+
+def test_empty_results_use_empty_ttl(monkeypatch):
+    cache = TTLCache(ttl=3600)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+    cache.get_or_load('found', lambda: {'name': 'SEP001122334455'}, empty_ttl=60)
+    cache.get_or_load('missing', lambda: None, empty_ttl=60)
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+
+    assert cache.get('found') == {'name': 'SEP001122334455'}
+    assert cache.get_or_load('missing', lambda: 'added since', empty_ttl=60) == 'added since'
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache(ttl=60)
+
+    def fail():
+        raise RuntimeError('AXL unavailable')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load('a', fail)
+    assert cache.get_or_load('a', lambda: 1) == 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    loads = []
+
+    def slow_load():
+        loads.append(None)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_load('key', slow_load)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_load('key', slow_load)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results == ['value'] * 4
+    assert len(loads) == 1
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import threading
+import time
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed number of seconds"""
+
+    def __init__(self, max_size=256, ttl=300):
+        """
+        Args:
+            max_size: Maximum number of entries; the least recently used is evicted first
+            ttl: Seconds an entry stays valid (0 disables caching)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def get_or_load(self, key, load, empty_ttl=None):
+        """Return the cached value for key, calling load() to fill it on a miss
+
+        Concurrent misses for the same key wait for the first caller's load()
+        instead of repeating it. If load() raises, every waiting caller gets
+        the exception and nothing is cached. An empty result (None, [], ...)
+        is kept for empty_ttl seconds instead of the cache's ttl, if given.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = {'done': threading.Event(), 'value': None, 'error': None}
+                self._inflight[key] = pending
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            pending['done'].wait()
+            if pending['error'] is not None:
+                raise pending['error']
+            return pending['value']
+
+        try:
+            pending['value'] = load()
+            self.set(key, pending['value'], ttl=empty_ttl if not pending['value'] else None)
+            return pending['value']
+        except BaseException as e:
+            pending['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending['done'].set()
+
+    def set(self, key, value, ttl=None):
+        """Cache value for the cache's ttl, or for ttl seconds if given (never longer than the cache's ttl)"""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def configure(self, max_size=None, ttl=None):
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max(int(max_size), 0)
+            if ttl is not None:
+                self.ttl = max(int(ttl), 0)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'coalesced': self.coalesced}